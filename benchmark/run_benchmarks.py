@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+"""
+Benchmark the toolbox on synthetic scenes without maya.
+
+maya.cmds, maya.api.OpenMaya and pymel.core are replaced by the recording
+stand-in of stub_maya. Every benchmark builds its scene, then runs one
+operation of the toolbox and reports the maya commands it called and the
+wall time. Commands are counted exactly, so a change which adds round trips
+shows up even where the stand-in is faster than maya. With --latency every
+command costs extra time like a call into maya would.
+
+Results are compared with a stored baseline. More calls of a command or a
+wall time above the tolerance are reported as regressions and the exit code
+is 1. Run it with the python of maya 2016 (2.7) from the repository root:
+
+    python benchmark/run_benchmarks.py --size medium
+    python benchmark/run_benchmarks.py --size medium --save-baseline
+"""
+
+import gc
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+import tempfile
+from collections import OrderedDict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'python'))
+
+import stub_maya
+
+scene = stub_maya.install()
+
+import scenes
+import edit_files
+import tbt_utils
+import YetiHelpers
+import copy_textures
+import ReferenceTools
+
+BASELINE = os.path.join(HERE, 'baseline.json')
+# node counts of the synthetic scenes
+SIZES = {
+    'small': {'references': 5, 'nodes_per_reference': 100, 'yeti_nodes': 100,
+              'file_nodes': 500, 'status_calls': 200},
+    'medium': {'references': 20, 'nodes_per_reference': 250, 'yeti_nodes': 1000,
+               'file_nodes': 2000, 'status_calls': 1000},
+    'large': {'references': 50, 'nodes_per_reference': 400, 'yeti_nodes': 5000,
+              'file_nodes': 10000, 'status_calls': 5000},
+}
+# slower than the baseline by this fraction is a regression
+TOLERANCE = 0.5
+# wall time differences below this many seconds are noise
+MIN_SECONDS = 0.01
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(func):
+    """Register a benchmark. It gets the size dict and a temp directory,
+    builds its scene and returns the operation to time"""
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+@benchmark
+def get_edits(size, tmp):
+    scenes.add_references(scene, size['references'], size['nodes_per_reference'])
+    return ReferenceTools.get_edits
+
+
+def _edit_file(size, tmp):
+    """Export the edits of the reference scene and change half the controls"""
+    controls = scenes.add_references(scene, size['references'], size['nodes_per_reference'])
+    path = os.path.join(tmp, 'bench' + edit_files.EXTENSION)
+    stub_maya.recorder.latency, latency = 0.0, stub_maya.recorder.latency
+    try:
+        edit_files.write_edits(path, ReferenceTools.get_edits())
+    finally:
+        stub_maya.recorder.latency = latency
+    scenes.change_controls(scene, controls)
+    return path
+
+
+@benchmark
+def apply_edits(size, tmp):
+    path = _edit_file(size, tmp)
+    return lambda: ReferenceTools.apply_edits(path)
+
+
+@benchmark
+def apply_edits_namespace(size, tmp):
+    path = _edit_file(size, tmp)
+    return lambda: ReferenceTools.apply_edits(path, namespace_override='rig00', dry_run=True)
+
+
+@benchmark
+def set_render_settings(size, tmp):
+    scenes.add_render_nodes(scene)
+
+    def run():
+        # a fresh scene, a switch to draft and a switch which changes nothing
+        for preset in ('final', 'draft', 'draft'):
+            tbt_utils.set_render_settings(preset)
+    return run
+
+
+@benchmark
+def get_status(size, tmp):
+    scenes.add_settings_node(scene)
+
+    def run():
+        for i in range(size['status_calls']):
+            if i % 10 == 0:
+                tbt_utils.set_status('frameRange', i % 20 == 0)
+            tbt_utils.get_status('tbt_settings')
+    return run
+
+
+@benchmark
+def get_yeti_nodes(size, tmp):
+    scenes.add_yeti_nodes(scene, size['yeti_nodes'])
+    return lambda: YetiHelpers.get_yeti_nodes(selection=None)
+
+
+@benchmark
+def get_yeti_nodes_selected(size, tmp):
+    scenes.add_yeti_nodes(scene, size['yeti_nodes'])
+    return lambda: YetiHelpers.get_yeti_nodes(selection=True)
+
+
+@benchmark
+def remap_yeti_locations(size, tmp):
+    location = os.path.join(tmp, 'location')
+    transforms = scenes.add_yeti_nodes(scene, size['yeti_nodes'])
+    if not os.path.exists(location):
+        os.makedirs(os.path.join(location, 'fur'))
+        os.makedirs(os.path.join(location, 'textures'))
+        for name in transforms:
+            open(os.path.join(location, 'fur', name + '.0001.fur'), 'w').close()
+    return lambda: YetiHelpers.remap_locations(location)
+
+
+@benchmark
+def relink_textures(size, tmp):
+    targets = scenes.add_file_nodes(scene, size['file_nodes'])
+    return lambda: copy_textures.relink(copy_textures.get_file_nodes(), targets)
+
+
+@benchmark
+def export_alembic(size, tmp):
+    path = os.path.join(tmp, 'bench.abc')
+    return lambda: tbt_utils.export_alembic_bake(1, 100, 'render_GEO_GRP', path=path)
+
+
+class _Null(object):
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+
+def run_benchmark(name, size, repeat, tmp):
+    """Run a benchmark repeat times on fresh scenes. A first warm-up run
+    which pays for lazy imports and first calls is not counted
+
+    Returns:
+        dict: Best wall time in seconds and the commands of the best run
+    """
+    best = None
+    for run in range(repeat + 1):
+        scene.new()
+        operation = BENCHMARKS[name](size, tmp)
+        stub_maya.recorder.reset()
+        stdout, sys.stdout = sys.stdout, _Null()
+        # like timeit, collections of the scene would add noise
+        gc.collect()
+        gc.disable()
+        start = stub_maya.clock()
+        try:
+            operation()
+        finally:
+            seconds = stub_maya.clock() - start
+            gc.enable()
+            sys.stdout = stdout
+        if run == 0:
+            continue
+        if best is None or seconds < best['seconds']:
+            best = {'seconds': seconds, 'commands': stub_maya.recorder.report()}
+    best['calls'] = sum(c['calls'] for c in best['commands'].values())
+    return best
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Compare results with a baseline
+
+    Returns:
+        list: Regression messages
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for command, data in sorted(result['commands'].items()):
+            before = base['commands'].get(command, {}).get('calls', 0)
+            if data['calls'] > before:
+                regressions.append('{}: {} calls {} -> {}'.format(
+                    name, command, before, data['calls']))
+        slower = result['seconds'] - base['seconds']
+        if slower > MIN_SECONDS and result['seconds'] > base['seconds'] * (1 + tolerance):
+            regressions.append('{}: {:.3f}s -> {:.3f}s'.format(
+                name, base['seconds'], result['seconds']))
+    return regressions
+
+
+def format_results(results, baseline=None):
+    lines = ['{:<26}{:>10}{:>12}{:>12}'.format('benchmark', 'calls', 'seconds', 'baseline')]
+    for name, result in results.items():
+        base = (baseline or {}).get(name)
+        lines.append('{:<26}{:>10}{:>12.4f}{:>12}'.format(
+            name, result['calls'], result['seconds'],
+            '{:.4f}'.format(base['seconds']) if base else '-'))
+        commands = sorted(result['commands'].items(), key=lambda c: -c[1]['calls'])
+        for command, data in commands:
+            before = base['commands'].get(command, {}).get('calls', 0) if base else None
+            lines.append('  {:<24}{:>10}{:>12.4f}{:>12}'.format(
+                command, data['calls'], data['seconds'], '-' if before is None else before))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the toolbox with a recording maya stand-in')
+    parser.add_argument('benchmarks', nargs='*', help='Benchmarks to run, default all')
+    parser.add_argument('--size', choices=sorted(SIZES), default='medium')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds added to every maya command')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    parser.add_argument('--output', help='Write the results to a json file')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('Unknown benchmarks: {}'.format(', '.join(sorted(unknown))))
+    logging.disable(logging.CRITICAL)
+    stub_maya.recorder.latency = args.latency
+
+    tmp = tempfile.mkdtemp(prefix='tbt_bench_')
+    results = OrderedDict()
+    try:
+        for name in args.benchmarks or BENCHMARKS:
+            results[name] = run_benchmark(name, SIZES[args.size], args.repeat, tmp)
+    finally:
+        shutil.rmtree(tmp)
+
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            stored = json.load(f)
+    baseline = stored.get(args.size, {})
+    print(format_results(results, baseline))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        baseline.update(results)
+        stored[args.size] = baseline
+        with open(args.baseline, 'w') as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+        print('Saved baseline: {}'.format(args.baseline))
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for message in regressions:
+        print('REGRESSION ' + message)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Synthetic scenes for the benchmarks, built on the stand-in scene of
+stub_maya. Values are derived from the node index, so every build of a size
+is the same scene.
+"""
+
+import render_presets
+
+# node attributes of a referenced control: getAttr type and value of node i
+CONTROL_ATTRS = [
+    ('translate', 'double3', lambda i: [(i * 0.5, 1.0, -i * 0.25)]),
+    ('rotateY', 'doubleAngle', lambda i: float(i % 360)),
+    ('visibility', 'bool', lambda i: i % 7 != 0),
+    ('mode', 'enum', lambda i: i % 3),
+    ('label', 'string', lambda i: 'ctrl_{}'.format(i)),
+    # not readable by the api path, falls back to getAttr
+    ('offsetMatrix', 'matrix', lambda i: [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0,
+                                          0.0, 0.0, 1.0, 0.0, float(i), 0.0, 0.0, 1.0]),
+]
+
+SETTINGS_ATTRS = ['projectSetup', 'setCamera', 'renderPasses', 'frameRange',
+                  'startFrame', 'endFrame', 'renderSettings']
+
+
+def edit_string(node, attr, attr_type, value):
+    """Return the setAttr edit string referenceQuery lists for a value"""
+    if attr_type == 'string':
+        return 'setAttr "{}.{}" -type "string" "{}"'.format(node, attr, value)
+    if isinstance(value, list):
+        flat = value[0] if isinstance(value[0], tuple) else value
+        return 'setAttr "{}.{}" -type "{}" {}'.format(
+            node, attr, attr_type, ' '.join(str(v) for v in flat))
+    return 'setAttr "{}.{}" {}'.format(node, attr, value)
+
+
+def add_references(scene, references, nodes_per_reference):
+    """Add references with edited controls and select all controls
+
+    Every reference holds nodes_per_reference controls with a setAttr edit
+    per attribute, plus a connectAttr edit to lodVisibility. Every
+    fifth reference is nested in the one before it.
+
+    Returns:
+        list: Names of the controls
+    """
+    controls = []
+    for r in range(references):
+        namespace = 'rig{:02d}'.format(r)
+        edits = []
+        for n in range(nodes_per_reference):
+            i = r * nodes_per_reference + n
+            name = '{}:ctrl{:04d}'.format(namespace, n)
+            node = scene.add_node(name, 'transform')
+            for attr, attr_type, value in CONTROL_ATTRS:
+                node.add_attr(attr, value(i), attr_type)
+                edits.append(edit_string(name, attr, attr_type, value(i)))
+            node.add_attr('lodVisibility', True, 'bool')
+            edits.append('connectAttr "{0}.visibility" "{0}.lodVisibility"'.format(name))
+            controls.append(name)
+        parent = 'rig{:02d}RN'.format(r - 1) if r % 5 == 4 else None
+        scene.add_reference(namespace + 'RN', namespace, edits, parent=parent)
+    scene.select(controls)
+    return controls
+
+
+def change_controls(scene, controls, step=2):
+    """Change translate and visibility of every step-th control"""
+    for i, name in enumerate(controls[::step]):
+        node = scene.nodes[name]
+        node.attrs['translate'][0] = [(0.0, 0.0, float(i))]
+        node.attrs['visibility'][0] = not node.attrs['visibility'][0]
+
+
+def add_render_nodes(scene):
+    """Add the render nodes with every attribute of the render presets at
+    a default value"""
+    defaults = {}
+    for name in render_presets.PRESETS:
+        for attr, value in render_presets.resolve(name).items():
+            defaults.setdefault(attr, value)
+    for attr, value in sorted(defaults.items()):
+        node_name, _, attr = attr.partition('.')
+        if node_name not in scene.nodes:
+            scene.add_node(node_name, 'renderGlobals')
+        if isinstance(value, basestring):
+            scene.nodes[node_name].add_attr(attr, '', 'string')
+        elif isinstance(value, float):
+            scene.nodes[node_name].add_attr(attr, 0.0, 'double')
+        else:
+            scene.nodes[node_name].add_attr(attr, 0, 'long')
+
+
+def add_settings_node(scene, node_name='tbt_settings'):
+    node = scene.add_node(node_name, 'network')
+    for attr in SETTINGS_ATTRS:
+        node.add_attr(attr, False, 'bool', user_defined=True)
+
+
+def add_yeti_nodes(scene, count, cache_dir='/old/cache', image_dir='/old/textures'):
+    """Add yeti shapes under transforms and select the transforms
+
+    Returns:
+        list: Names of the transforms
+    """
+    transforms = []
+    for i in range(count):
+        name = 'fur{:05d}'.format(i)
+        scene.add_node(name, 'transform')
+        shape = scene.add_node(name + 'Shape', 'pgYetiMaya', parent=name)
+        shape.add_attr('cacheFileName', '{}/fur/{}.%04d.fur'.format(cache_dir, name), 'string')
+        shape.add_attr('imageSearchPath', image_dir, 'string')
+        shape.add_attr('fileMode', 1, 'long')
+        transforms.append(name)
+    scene.select(transforms)
+    return transforms
+
+
+def add_file_nodes(scene, count, texture_dir='/old/sourceimages'):
+    """Add file nodes, every texture is used by two nodes
+
+    Returns:
+        dict: Texture path to collected path, the targets of relink
+    """
+    targets = {}
+    for i in range(count):
+        path = '{}/tex{:05d}.exr'.format(texture_dir, i // 2)
+        scene.add_node('file{:05d}'.format(i), 'file').add_attr('fileTextureName', path, 'string')
+        targets[path] = path.replace(texture_dir, '/projects/bench/sourceimages')
+    return targets
@@ -0,0 +1,725 @@
+"""
+Stand-in for maya.cmds, maya.api.OpenMaya and pymel.core backed by an in
+memory scene, so the toolbox can be benchmarked without maya.
+
+Every command call is recorded with its count and the time spent in it.
+An optional latency is added to every command to model the cost of a round
+trip into maya, api calls are only counted. Commands the stand-in does not
+know are recorded and return None.
+
+The stubs are registered in sys.modules by install() and never exist as
+packages on disk, so they can not shadow a real maya installation:
+
+    import stub_maya
+    scene = stub_maya.install()
+    import ReferenceTools
+"""
+
+import re
+import sys
+import time
+import types
+import fnmatch
+from collections import defaultdict
+
+clock = getattr(time, 'perf_counter', time.time)
+
+COMPOUND_RE = re.compile(r'^(short|long|float|double)([234])$')
+
+
+class Recorder(object):
+    """Count and time command calls
+
+    Args:
+        latency (float): Seconds added to every command call
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.reset()
+
+    def reset(self):
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)
+
+    def command(self, name, func, api=False):
+        """Wrap a function so every call is recorded under name"""
+        recorder = self
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if recorder.latency and not api:
+                    # busy wait, sleep is too coarse for microseconds
+                    end = start + recorder.latency
+                    while clock() < end:
+                        pass
+                recorder.calls[name] += 1
+                recorder.seconds[name] += clock() - start
+        wrapper.__name__ = name
+        return wrapper
+
+    def report(self):
+        """Return {command: {'calls': n, 'seconds': s}}"""
+        return dict((k, {'calls': self.calls[k], 'seconds': self.seconds[k]})
+                    for k in self.calls)
+
+
+class Node(object):
+    """Node of the stand-in scene
+
+    Args:
+        name (str): Unique node name
+        node_type (str): Maya node type
+        parent (Node): Parent transform of a shape
+    """
+
+    def __init__(self, name, node_type, parent=None):
+        self.name = name
+        self.type = node_type
+        self.parent = parent
+        self.children = []
+        # attribute name to [value, getAttr type]
+        self.attrs = {}
+        self.user_defined = []
+        if parent:
+            parent.children.append(self)
+
+    def add_attr(self, attr, value, attr_type, user_defined=False):
+        self.attrs[attr] = [value, attr_type]
+        if user_defined:
+            self.user_defined.append(attr)
+        return self
+
+
+class Scene(object):
+    """Nodes, references, selection and callbacks of the stand-in scene"""
+
+    def __init__(self):
+        self.scene_callbacks = {}
+        self.new()
+
+    def new(self, name=''):
+        """Drop all nodes and fire the after new scene callbacks"""
+        self.name = name
+        self.nodes = {}
+        self.order = []
+        # reference node to {'namespace', 'parent', 'edits'}
+        self.references = {}
+        self.selection = []
+        self.node_callbacks = {}
+        self.workspace = '/projects/bench'
+        self.file_rules = {'fileCache': 'cache/fur', 'images': 'images',
+                           'sourceImages': 'sourceimages'}
+        self.playback = {'ast': 1.0, 'aet': 100.0, 'min': 1.0, 'max': 100.0}
+        for callback in list(self.scene_callbacks.values()):
+            if callback[0] == OpenMaya.MSceneMessage.kAfterNew:
+                callback[1]()
+        return self
+
+    def add_node(self, name, node_type, parent=None):
+        if name in self.nodes:
+            raise ValueError('Node exists: ' + name)
+        node = Node(name, node_type, self.nodes[parent] if parent else None)
+        self.nodes[name] = node
+        self.order.append(name)
+        return node
+
+    def add_reference(self, rfn, namespace, edits=(), parent=None):
+        self.add_node(rfn, 'reference')
+        self.references[rfn] = {'namespace': namespace, 'parent': parent,
+                                'edits': list(edits)}
+
+    def select(self, names):
+        self.selection = list(names)
+
+    def node(self, name):
+        node = self.nodes.get(name.split('|')[-1])
+        if node is None:
+            raise ValueError('No object matches name: ' + name)
+        return node
+
+    def plug(self, name):
+        """Return node and attribute name of node.attr"""
+        node_name, _, attr = name.partition('.')
+        node = self.node(node_name)
+        if attr not in node.attrs:
+            raise ValueError('No object matches name: ' + name)
+        return node, attr
+
+    def set_value(self, name, value, attr_type=None):
+        node, attr = self.plug(name)
+        node.attrs[attr][0] = value
+        if attr_type:
+            node.attrs[attr][1] = attr_type
+        for callback in self.node_callbacks.get(node.name, {}).values():
+            if callback[0] == 'attr':
+                callback[1](OpenMaya.MNodeMessage.kAttributeSet,
+                            OpenMaya.MPlug(node, attr), None, None)
+
+
+scene = None
+recorder = Recorder()
+
+
+# maya.cmds
+
+def _ls(*patterns, **kwargs):
+    if kwargs.get('selection') or kwargs.get('sl'):
+        names = list(scene.selection)
+    else:
+        names = scene.order
+    node_type = kwargs.get('type')
+    if node_type:
+        names = [n for n in names if scene.nodes[n].type == node_type]
+    if patterns:
+        names = [n for n in names if any(fnmatch.fnmatchcase(n, p) for p in patterns)]
+    return list(names)
+
+
+def _get_attr(name, **kwargs):
+    node, attr = scene.plug(name)
+    value, attr_type = node.attrs[attr]
+    if kwargs.get('type'):
+        return attr_type
+    if attr_type == 'message':
+        raise RuntimeError('Message attributes have no data values.')
+    return value
+
+
+def _set_attr(name, *values, **kwargs):
+    try:
+        node, attr = scene.plug(name)
+    except ValueError as e:
+        raise RuntimeError(str(e))
+    attr_type = kwargs.get('type')
+    if kwargs.get('size'):
+        value = list(values)
+    elif len(values) > 1 or (attr_type and COMPOUND_RE.match(attr_type)):
+        value = [tuple(values)]
+    else:
+        value = values[0]
+    scene.set_value(name, value, attr_type)
+
+
+def _reference_query(rfn, **kwargs):
+    ref = scene.references.get(rfn)
+    if ref is None:
+        raise RuntimeError('Not a reference node: ' + rfn)
+    if kwargs.get('namespace'):
+        return ':' + ref['namespace']
+    if kwargs.get('parent'):
+        return ref['parent']
+    if kwargs.get('editStrings'):
+        command = kwargs.get('editCommand')
+        return [e for e in ref['edits'] if not command or e.startswith(command + ' ')]
+    return None
+
+
+def _undo_info(**kwargs):
+    return None
+
+
+def _file(*args, **kwargs):
+    if kwargs.get('query') and kwargs.get('sceneName'):
+        return scene.name
+    if kwargs.get('new'):
+        scene.new()
+    return None
+
+
+def _list_attr(node, **kwargs):
+    node = scene.node(node)
+    if kwargs.get('userDefined') or kwargs.get('ud'):
+        return list(node.user_defined)
+    return sorted(node.attrs)
+
+
+def _obj_exists(name):
+    try:
+        scene.plug(name) if '.' in name else scene.node(name)
+    except ValueError:
+        return False
+    return True
+
+
+def _noop(*args, **kwargs):
+    return None
+
+
+class StubModule(types.ModuleType):
+    """Module which records unknown commands as calls that return None"""
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        command = recorder.command(name, _noop)
+        setattr(self, name, command)
+        return command
+
+
+# commands a plugin adds to maya.cmds and pymel.core when it is loaded
+PLUGIN_COMMANDS = {
+    'AbcExport.bundle': ['AbcExport'],
+    'AbcImport.bundle': ['AbcImport'],
+}
+
+
+def _load_plugin(name, **kwargs):
+    for command in PLUGIN_COMMANDS.get(name, []):
+        for module in (cmds, pm):
+            if command not in module.__dict__:
+                setattr(module, command, recorder.command(command, _noop))
+
+
+def _commands(module, commands):
+    for name, func in commands.items():
+        setattr(module, name, recorder.command(name, func))
+
+
+cmds = StubModule('maya.cmds')
+_commands(cmds, {
+    'ls': _ls,
+    'getAttr': _get_attr,
+    'setAttr': _set_attr,
+    'referenceQuery': _reference_query,
+    'undoInfo': _undo_info,
+    'file': _file,
+    'listAttr': _list_attr,
+    'objExists': _obj_exists,
+    'loadPlugin': _load_plugin,
+})
+
+
+# maya.api.OpenMaya
+
+class _AttrObject(object):
+    def __init__(self, fn, sub=None):
+        self.fn = fn
+        self.sub = sub
+
+    def hasFn(self, fn):
+        return self.fn == fn
+
+
+class _Units(object):
+    def __init__(self, value):
+        self.value = value
+
+    def asUnits(self, unit):
+        return self.value
+
+    @staticmethod
+    def uiUnit():
+        return 0
+
+
+class _OpenMaya(object):
+    """Namespace of the api classes the toolbox uses"""
+
+    class MFn(object):
+        kNumericAttribute = 1
+        kUnitAttribute = 2
+        kEnumAttribute = 3
+        kTypedAttribute = 4
+        kCompoundAttribute = 5
+
+    class MFnNumericData(object):
+        (kBoolean, kByte, kChar, kShort, kInt, kFloat, kDouble, k2Short, k3Short,
+         k2Int, k3Int, k2Float, k3Float, k2Double, k3Double, k4Double) = range(1, 17)
+
+    class MFnData(object):
+        kString = 1
+        kMatrix = 2
+
+    class _AttrFn(object):
+        def __init__(self, attr):
+            self.attr = attr
+
+        def numericType(self):
+            return self.attr.sub
+
+        unitType = attrType = numericType
+
+    class MFnNumericAttribute(_AttrFn):
+        pass
+
+    class MFnUnitAttribute(_AttrFn):
+        kAngle = 1
+        kDistance = 2
+        kTime = 3
+
+    class MFnTypedAttribute(_AttrFn):
+        pass
+
+    MAngle = MDistance = MTime = _Units
+
+    class MPlug(object):
+        def __init__(self, node, attr, index=None):
+            self.node = node
+            self.attr = attr
+            self.index = index
+
+        def _type(self):
+            attr_type = self.node.attrs[self.attr][1]
+            if self.index is not None:
+                return COMPOUND_RE.match(attr_type).group(1)
+            return attr_type
+
+        def _value(self):
+            value = self.node.attrs[self.attr][0]
+            if self.index is not None:
+                return value[0][self.index]
+            return value
+
+        def attribute(self):
+            return _attribute_object(self._type())
+
+        @property
+        def isCompound(self):
+            return self.index is None and bool(COMPOUND_RE.match(self._type()))
+
+        isArray = False
+
+        def numChildren(self):
+            return int(COMPOUND_RE.match(self._type()).group(2))
+
+        def child(self, i):
+            return OpenMaya.MPlug(self.node, self.attr, i)
+
+        def partialName(self, **kwargs):
+            return self.attr
+
+        def asDouble(self):
+            return float(self._value())
+
+        def asInt(self):
+            return int(self._value())
+
+        def asBool(self):
+            return bool(self._value())
+
+        def asString(self):
+            return self._value()
+
+        def asMAngle(self):
+            return _Units(self._value())
+
+        asMDistance = asMTime = asMAngle
+
+    class MObject(object):
+        def __init__(self, node):
+            self.node = node
+
+    class MMessage(object):
+        @staticmethod
+        def removeCallback(callback_id):
+            scene.scene_callbacks.pop(callback_id, None)
+            for callbacks in scene.node_callbacks.values():
+                callbacks.pop(callback_id, None)
+
+    class MSceneMessage(MMessage):
+        kAfterNew = 1
+        kAfterOpen = 2
+
+        @staticmethod
+        def addCallback(message, func):
+            callback_id = _next_id()
+            scene.scene_callbacks[callback_id] = (message, func)
+            return callback_id
+
+    class MNodeMessage(MMessage):
+        kAttributeSet = 1 << 0
+        kAttributeAdded = 1 << 1
+        kAttributeRemoved = 1 << 2
+
+        @staticmethod
+        def _add(kind, node, func):
+            callback_id = _next_id()
+            scene.node_callbacks.setdefault(node.node.name, {})[callback_id] = (kind, func)
+            return callback_id
+
+    class MSelectionList(object):
+        def __init__(self):
+            self.items = []
+            self.keys = set()
+
+        def add(self, name):
+            try:
+                item = scene.plug(name) if '.' in name else (scene.node(name), None)
+            except ValueError:
+                raise RuntimeError('(kInvalidParameter): Object does not exist')
+            # like maya an item already in the list is not added again
+            key = (id(item[0]), item[1])
+            if key not in self.keys:
+                self.keys.add(key)
+                self.items.append(item)
+
+        def length(self):
+            return len(self.items)
+
+        def getPlug(self, i):
+            node, attr = self.items[i]
+            if attr is None:
+                raise TypeError('(kInvalidParameter): Item is not a plug')
+            return OpenMaya.MPlug(node, attr)
+
+        def getDependNode(self, i):
+            return OpenMaya.MObject(self.items[i][0])
+
+
+OpenMaya = _OpenMaya
+_ids = [0]
+
+
+def _next_id():
+    _ids[0] += 1
+    return _ids[0]
+
+
+NUMERIC = dict((name, getattr(OpenMaya.MFnNumericData, key)) for name, key in [
+    ('bool', 'kBoolean'), ('byte', 'kByte'), ('char', 'kChar'), ('short', 'kShort'),
+    ('long', 'kInt'), ('float', 'kFloat'), ('double', 'kDouble')])
+UNITS = {'doubleAngle': OpenMaya.MFnUnitAttribute.kAngle,
+         'doubleLinear': OpenMaya.MFnUnitAttribute.kDistance,
+         'time': OpenMaya.MFnUnitAttribute.kTime}
+
+
+def _attribute_object(attr_type):
+    fn = OpenMaya.MFn
+    if attr_type in NUMERIC:
+        return _AttrObject(fn.kNumericAttribute, NUMERIC[attr_type])
+    if attr_type in UNITS:
+        return _AttrObject(fn.kUnitAttribute, UNITS[attr_type])
+    if attr_type == 'enum':
+        return _AttrObject(fn.kEnumAttribute)
+    if attr_type == 'string':
+        return _AttrObject(fn.kTypedAttribute, OpenMaya.MFnData.kString)
+    if COMPOUND_RE.match(attr_type):
+        return _AttrObject(fn.kCompoundAttribute)
+    return _AttrObject(fn.kTypedAttribute, OpenMaya.MFnData.kMatrix)
+
+
+def _api_module():
+    module = types.ModuleType('maya.api.OpenMaya')
+    for name in dir(OpenMaya):
+        if not name.startswith('__'):
+            setattr(module, name, getattr(OpenMaya, name))
+    sel = OpenMaya.MSelectionList
+    sel.add = _api_call('MSelectionList.add', sel.add)
+    sel.getPlug = _api_call('MSelectionList.getPlug', sel.getPlug)
+    messages = OpenMaya.MNodeMessage
+    for name, kind in [('addAttributeChangedCallback', 'attr'),
+                       ('addNodePreRemovalCallback', 'removed'),
+                       ('addNameChangedCallback', 'renamed')]:
+        setattr(messages, name, staticmethod(
+            lambda node, func, kind=kind: messages._add(kind, node, func)))
+    return module
+
+
+def _api_call(name, method):
+    command = recorder.command(name, method, api=True)
+
+    def wrapper(self, *args):
+        return command(self, *args)
+    return wrapper
+
+
+api_module = _api_module()
+
+
+# pymel.core
+
+class MayaNodeError(ValueError):
+    pass
+
+
+class MayaAttributeError(AttributeError):
+    pass
+
+
+class PyAttribute(object):
+    def __init__(self, node, attr):
+        self.node = node
+        self.attr = attr
+
+    def name(self):
+        return self.node.name() + '.' + self.attr
+
+    def get(self):
+        return pm.getAttr(self.name())
+
+    def set(self, *values, **kwargs):
+        pm.setAttr(self.name(), *values, **kwargs)
+
+
+class PyNode(object):
+    def __init__(self, name):
+        if isinstance(name, PyNode):
+            name = name.name()
+        try:
+            self._node = scene.node(name)
+        except ValueError:
+            raise MayaNodeError(name)
+
+    def name(self):
+        return self._node.name
+
+    longName = name
+
+    def type(self):
+        return pm.nodeType(self.name())
+
+    def getShape(self):
+        shapes = pm.listRelatives(self.name(), shapes=True)
+        return shapes[0] if shapes else None
+
+    def getParent(self):
+        parents = pm.listRelatives(self.name(), parent=True)
+        return parents[0] if parents else None
+
+    def attr(self, attr):
+        if attr not in self._node.attrs:
+            raise MayaAttributeError(self.name() + '.' + attr)
+        return PyAttribute(self, attr)
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        return self.attr(attr)
+
+    def listAttr(self, ud=False, **kwargs):
+        return [PyAttribute(self, a) for a in cmds.listAttr(self.name(), ud=ud)]
+
+    def addAttr(self, attr, dt=None, at=None, **kwargs):
+        pm.addAttr(self.name(), longName=attr, dataType=dt, attributeType=at)
+
+    def __eq__(self, other):
+        return isinstance(other, PyNode) and other._node is self._node
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._node.name)
+
+    def __str__(self):
+        return self._node.name
+
+    def __repr__(self):
+        return 'nt.{}({!r})'.format(self._node.type, self._node.name)
+
+
+def _py_ls(*patterns, **kwargs):
+    return [PyNode(n) for n in _ls(*patterns, **kwargs)]
+
+
+def _selected(**kwargs):
+    return [PyNode(n) for n in scene.selection]
+
+
+def _select(*nodes, **kwargs):
+    names = []
+    for n in nodes:
+        names.extend(n if isinstance(n, (list, tuple)) else [n])
+    scene.select(str(n) for n in names)
+
+
+def _node_type(name):
+    return scene.node(name).type
+
+
+def _list_relatives(name, shapes=False, parent=False, **kwargs):
+    node = scene.node(name)
+    if parent:
+        return [PyNode(node.parent.name)] if node.parent else []
+    return [PyNode(c.name) for c in node.children]
+
+
+def _add_attr(name, longName=None, dataType=None, attributeType=None, **kwargs):
+    node = scene.node(name)
+    node.add_attr(longName, '' if dataType == 'string' else 0,
+                  dataType or attributeType, user_defined=True)
+
+
+def _playback_options(**kwargs):
+    if kwargs.get('query'):
+        for key in ('ast', 'aet', 'min', 'max'):
+            if kwargs.get(key):
+                return scene.playback[key]
+    return None
+
+
+class _Workspace(object):
+    def getPath(self):
+        return scene.workspace
+
+    @property
+    def fileRules(self):
+        return scene.file_rules
+
+    def open(self, path):
+        scene.workspace = path
+
+
+class _Mel(object):
+    def __init__(self):
+        self.eval = recorder.command('mel.eval', _noop)
+
+
+pm = StubModule('pymel.core')
+_commands(pm, {
+    'ls': _py_ls,
+    'selected': _selected,
+    'select': _select,
+    'getAttr': _get_attr,
+    'setAttr': _set_attr,
+    'nodeType': _node_type,
+    'listRelatives': _list_relatives,
+    'addAttr': _add_attr,
+    'undoInfo': _undo_info,
+    'playbackOptions': _playback_options,
+    'loadPlugin': _load_plugin,
+})
+pm.PyNode = PyNode
+pm.MayaNodeError = MayaNodeError
+pm.MayaAttributeError = MayaAttributeError
+pm.workspace = _Workspace()
+pm.mel = _Mel()
+
+
+def install(latency=0.0):
+    """Register the stand-in modules in sys.modules
+
+    Args:
+        latency (float): Seconds added to every command call
+
+    Returns:
+        Scene: The scene the commands work on
+    """
+    global scene
+    recorder.latency = latency
+    if scene is None:
+        scene = Scene()
+
+    maya = types.ModuleType('maya')
+    api = types.ModuleType('maya.api')
+    api.OpenMaya = api_module
+    maya.cmds = cmds
+    maya.api = api
+    maya.mel = StubModule('maya.mel')
+    maya.utils = types.ModuleType('maya.utils')
+    maya.utils.executeDeferred = lambda func, *args: func(*args)
+    maya.standalone = StubModule('maya.standalone')
+    pymel = types.ModuleType('pymel')
+    pymel.core = pm
+
+    sys.modules.update({
+        'maya': maya, 'maya.cmds': cmds, 'maya.api': api,
+        'maya.api.OpenMaya': api.OpenMaya, 'maya.mel': maya.mel,
+        'maya.utils': maya.utils, 'maya.standalone': maya.standalone,
+        'pymel': pymel, 'pymel.core': pm,
+    })
+    return scene
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Measure how long the toolboxes take to open in a cold maya session.
+
+Every run starts a new mayapy process, initializes maya standalone and a
+QApplication (not timed, a maya ui session has both) and then times the
+import of the toolbox module, the first open() which builds the window and a
+second open() which reuses it. It also reports if pymel was imported on the
+way, which alone takes seconds in a cold session.
+
+The median of the runs is compared with the limit and the exit code is 1 if
+a toolbox opens slower:
+
+    python benchmark/toolbox_startup.py --mayapy /path/to/mayapy --runs 5
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PYTHON_DIR = os.path.join(HERE, '..', 'python')
+sys.path.insert(0, PYTHON_DIR)
+
+import mayapy_pool
+
+TOOLBOXES = ['TrollBridgeToolbox', 'YetiToolbox']
+# seconds from import to the first shown window
+LIMIT = 1.0
+MARKER = 'TBT_STARTUP '
+
+# runs in the mayapy process
+PROBE = r'''
+import sys, time, json
+sys.path.insert(0, {python_dir!r})
+import maya.standalone
+maya.standalone.initialize('Python')
+from PySide.QtGui import QApplication
+app = QApplication.instance() or QApplication(sys.argv)
+
+t0 = time.time()
+module = __import__({toolbox!r})
+t1 = time.time()
+window = module.open()
+app.processEvents()
+t2 = time.time()
+module.open()
+app.processEvents()
+t3 = time.time()
+print({marker!r} + json.dumps({{
+    'import': t1 - t0, 'open': t2 - t1, 'reopen': t3 - t2,
+    'pymel': 'pymel.core' in sys.modules}}))
+sys.stdout.flush()
+'''
+
+
+def probe(toolbox, mayapy):
+    """Time import and open of a toolbox in a new mayapy process
+
+    Returns:
+        dict: Seconds of import, open and reopen and if pymel was imported
+    """
+    code = PROBE.format(python_dir=os.path.abspath(PYTHON_DIR), toolbox=toolbox, marker=MARKER)
+    proc = subprocess.Popen([mayapy, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = proc.communicate()[0].decode('utf-8', 'replace')
+    for line in output.splitlines():
+        if line.startswith(MARKER):
+            return json.loads(line[len(MARKER):])
+    raise RuntimeError('Could not open {}:\n{}'.format(toolbox, output))
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the cold start of the toolboxes')
+    parser.add_argument('toolboxes', nargs='*', default=TOOLBOXES)
+    parser.add_argument('--mayapy', default=mayapy_pool.MAYAPY)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--limit', type=float, default=LIMIT)
+    args = parser.parse_args(argv)
+
+    slow = []
+    print('{:<22}{:>10}{:>10}{:>10}{:>8}'.format('toolbox', 'import', 'open', 'reopen', 'pymel'))
+    for toolbox in args.toolboxes:
+        runs = [probe(toolbox, args.mayapy) for _ in range(args.runs)]
+        result = dict((k, median([r[k] for r in runs])) for k in ('import', 'open', 'reopen'))
+        pymel = any(r['pymel'] for r in runs)
+        print('{:<22}{:>10.3f}{:>10.3f}{:>10.3f}{:>8}'.format(
+            toolbox, result['import'], result['open'], result['reopen'], 'yes' if pymel else 'no'))
+        if result['import'] + result['open'] > args.limit:
+            slow.append(toolbox)
+    for toolbox in slow:
+        print('SLOW {} takes more than {:.1f}s to open'.format(toolbox, args.limit))
+    return 1 if slow else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
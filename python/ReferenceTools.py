@@ -1,13 +1,83 @@
 import maya.cmds as mc
 
-import json
+import re
 import os
 import logging
-import itertools
+
+import edit_files
+import plug_values
+import tbt_metrics
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# types setAttr does not accept as -type flag
+INVALID_TYPES = ['float']
+
+SETATTR_RE = re.compile(r'^setAttr\s+"?([^"\s]+)"?')
+QUOTED_RE = re.compile(r'"([^"]*)"')
+LONG_NAME_RE = re.compile(r'-(?:ln|longName)\s+"([^"]+)"')
+# edits whose quoted node.attr arguments are the edited plugs
+CONNECT_COMMANDS = ('connectAttr', 'disconnectAttr')
+
+
+def get_reference_nodes(nodes):
+    """
+    Find the reference nodes holding the edits of nodes. Uses one query per
+    reference node in the scene instead of one per node
+    :param nodes: node names
+    :return: set of reference node names
+    """
+    by_namespace = {}
+    for rfn in mc.ls(type='reference'):
+        try:
+            namespace = mc.referenceQuery(rfn, namespace=True)
+        except RuntimeError:
+            # sharedReferenceNode and unloaded references
+            continue
+        by_namespace[namespace.lstrip(':')] = rfn
+
+    ref_nodes = set()
+    for namespace in set(n.split('|')[-1].rpartition(':')[0] for n in nodes):
+        rfn = by_namespace.get(namespace)
+        while rfn and rfn not in ref_nodes:
+            ref_nodes.add(rfn)
+            # edits on nested references can be stored on the parent
+            rfn = mc.referenceQuery(rfn, referenceNode=True, parent=True)
+    return ref_nodes
+
+
+def parse_edit_plugs(edit_strings):
+    """
+    Get the edited plugs from edit strings: the plug of setAttr, both plugs
+    of connectAttr and disconnectAttr and the attribute of addAttr. These are
+    the attributes editAttrs lists, edits like parent and deleteAttr leave no
+    attribute to read
+    :param edit_strings: strings returned by referenceQuery(editStrings=True)
+    :return: list of (node, attr) tuples in edit order
+    """
+    plugs = []
+    for e in edit_strings:
+        command = e.split(None, 1)[0] if e else ''
+        names = []
+        if command == 'setAttr':
+            match = SETATTR_RE.match(e)
+            names = [match.group(1)] if match else []
+        elif command in CONNECT_COMMANDS:
+            names = QUOTED_RE.findall(e)
+        elif command == 'addAttr':
+            long_name = LONG_NAME_RE.search(e)
+            quoted = QUOTED_RE.findall(e)
+            if long_name and quoted:
+                names = ['{}.{}'.format(quoted[-1], long_name.group(1))]
+        for name in names:
+            node, _, attr = name.partition('.')
+            if attr:
+                plugs.append((node.split('|')[-1], attr))
+    return plugs
+
+
+@tbt_metrics.timed()
 def get_edits():
     """
     Get reference edits from a selection. Returns a dict with full attr name and values
@@ -15,24 +85,23 @@ def get_edits():
     """
 
     sel = mc.ls(selection=True)
-    data = {}
-    for i in sel:
-        print i
-        edits = mc.referenceQuery('{}'.format(i), editAttrs=True)
-        for e in edits:
-            attr_name = '{shape}.{attr}'.format(shape=i, attr=e)
-            try:
-                value = mc.getAttr(attr_name)
-                attr_type = mc.getAttr(attr_name, type=True)
-            # except if attr is message
-            except RuntimeError:
-                pass
-            # except if attr is nodeInfo
-            except ValueError:
-                pass
-            else:
-                data[attr_name] = {'value': value, 'type': attr_type}
-    return data
+    # edit strings name nodes by their short name
+    short_names = dict((i.split('|')[-1], i) for i in sel)
+
+    attr_names = []
+    seen = set()
+    for rfn in get_reference_nodes(sel):
+        edits = mc.referenceQuery(rfn, editStrings=True) or []
+        for node, attr in parse_edit_plugs(edits):
+            if node not in short_names:
+                continue
+            attr_name = '{shape}.{attr}'.format(shape=short_names[node], attr=attr)
+            if attr_name not in seen:
+                seen.add(attr_name)
+                attr_names.append(attr_name)
+
+    logger.debug('Reading %d edited attributes of %d nodes', len(attr_names), len(sel))
+    return plug_values.read_values(attr_names)
 
 def export(tmp_dir='/tmp/tbt_maya'):
 
@@ -46,75 +115,130 @@ def export(tmp_dir='/tmp/tbt_maya'):
     else:
         _file_name = 'export'
 
-    _file = os.path.join(tmp_dir, '{}_edits.json'.format(_file_name))
-    with open(_file, 'w') as f:
-        json.dump(get_edits(), f)
-        logger.info('Wrote file: %s' % _file)
+    _file = os.path.join(tmp_dir, _file_name + edit_files.EXTENSION)
+    edits = get_edits()
+    with tbt_metrics.span('edits_write', path=_file, count=len(edits)):
+        edit_files.write_edits(_file, edits)
+    logger.info('Wrote file: %s' % _file)
+    return _file
 
-def apply_edits(file_path, namespace_override=None):
+def namespace_remapper(namespace_override=None):
     """
-    Apply edits to a scene
-    :param edits: edits dict
-    :return:
+    Build the function which moves edit keys to another namespace. Node names
+    are remapped once and cached, so many attributes of the same node cost
+    one lookup each
+    :param namespace_override: new namespace, None keeps the keys as they are
+    :return: function taking and returning an attribute name
     """
+    if not namespace_override:
+        return lambda k: k
+
+    nodes = {}
+
+    def remap_node(node):
+        parts = []
+        for part in node.split('|'):
+            if not part:
+                parts.append(part)
+            elif ':' in part:
+                parts.append(namespace_override + ':' + part.split(':', 1)[1])
+            else:
+                parts.append(namespace_override + ':' + part)
+        return '|'.join(parts)
 
-    namespaces = mc.namespaceInfo(listOnlyNamespaces=True)
-    errors = []
-    success = []
-    invalid_types = ['float']
-
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-            logger.info('Loaded: %s' % file_path)
-
-        for k, v in data.iteritems():
+    def remap(k):
+        node, sep, attr = k.partition('.')
+        if node not in nodes:
+            nodes[node] = remap_node(node)
+        return nodes[node] + sep + attr
 
-            value = v['value']
-            vtype = v['type']
+    return remap
 
-            if isinstance(value, list):
-                if isinstance(value[0], list):
-                    value = list(itertools.chain.from_iterable(value))
-            if isinstance(vtype, list):
-                vsize = len(vtype)
-                vtype = None
-            else:
-                vsize = None
 
-            name_string = k.split(':')
-            if len(name_string) < 2:
-                namespace = None
-            else:
-                namespace = name_string[0]
-
-            if namespace_override:
-                # create new namespace with override
-                if namespace:
-                    k = namespace_override + ':' + name_string[1:]
-                else:
-                    k = namespace_override + ':' + k
-
-                # set the new namespace
-                namespace = namespace_override
-
-            #logger.info('Using following namespace: {}'.format(namespace))
-            try:
-                print k, value, vtype
-                if vsize:
-                    mc.setAttr(k, *value, size=vsize)
-                elif vtype:
-                    if isinstance(value, list):
-                        mc.setAttr(k, *value, type=vtype)
+def set_value(attr_name, value, vtype):
+    """
+    Set an attribute with the arguments setAttr needs for its type
+    :param attr_name: node.attr
+    :param value: normalized value
+    :param vtype: type as stored in the edit file
+    """
+    if isinstance(vtype, list):
+        mc.setAttr(attr_name, *value, size=len(vtype))
+    elif vtype:
+        if isinstance(value, list):
+            mc.setAttr(attr_name, *value, type=vtype)
+        elif vtype in INVALID_TYPES:
+            mc.setAttr(attr_name, value)
+        else:
+            mc.setAttr(attr_name, value, type=vtype)
+
+
+@tbt_metrics.timed()
+def apply_edits(file_path, namespace_override=None, dry_run=False):
+    """
+    Apply edits to a scene. Current values are read in bulk and only the
+    attributes which differ are set, grouped per node in one undo chunk
+    :param file_path: edit file, *_edits.jsonl.gz or the old *_edits.json
+    :param namespace_override: apply the edits to nodes in this namespace
+    :param dry_run: only report what would change
+    :return: result dict with changed, unchanged, missing and errors
+    """
+    result = {'file': file_path, 'dry_run': dry_run,
+              'changed': [], 'unchanged': 0, 'missing': [], 'errors': []}
+
+    if not os.path.exists(file_path):
+        logger.error('File path does not exist: %s' % file_path)
+        result['errors'].append({'attr': None, 'error': 'File path does not exist'})
+        return result
+
+    logger.info('Reading: %s' % file_path)
+    remap = namespace_remapper(namespace_override)
+    edits = []
+    with tbt_metrics.span('edits_read', path=file_path):
+        for k, v in edit_files.iter_edits(file_path):
+            edits.append((remap(k), edit_files.normalize_value(v['value']), v['type']))
+
+    with tbt_metrics.span('values_read', count=len(edits)):
+        current = plug_values.read_values([k for k, _, _ in edits])
+
+    # attributes to set grouped per node, in file order
+    by_node = {}
+    node_order = []
+    for k, value, vtype in edits:
+        if k not in current:
+            result['missing'].append(k)
+            continue
+        if edit_files.values_equal(edit_files.normalize_value(current[k]['value']), value):
+            result['unchanged'] += 1
+            continue
+        node = k.partition('.')[0]
+        if node not in by_node:
+            by_node[node] = []
+            node_order.append(node)
+        by_node[node].append((k, value, vtype))
+
+    if not dry_run and node_order:
+        mc.undoInfo(openChunk=True, chunkName='apply_edits')
+    try:
+        with tbt_metrics.span('edits_set', nodes=len(node_order), dry_run=dry_run):
+            for node in node_order:
+                for k, value, vtype in by_node[node]:
+                    if dry_run:
+                        result['changed'].append(k)
+                        continue
+                    try:
+                        set_value(k, value, vtype)
+                    except RuntimeError as e:
+                        logger.debug('Could not set %s: %s', k, e)
+                        result['errors'].append({'attr': k, 'error': str(e)})
                     else:
-                        if vtype in invalid_types:
-                            mc.setAttr(k, value)
-                        else:
-                            mc.setAttr(k, value, type=vtype)
-            except RuntimeError as e:
-                print '#### ', e
-                errors.append(e)
-            else:
-                success.append(k)
-    else:
-        logger.error('File path does not exist: %s' % file_path)
\ No newline at end of file
+                        result['changed'].append(k)
+    finally:
+        if not dry_run and node_order:
+            mc.undoInfo(closeChunk=True)
+
+    logger.info('%s %d attributes on %d nodes, %d unchanged, %d missing, %d errors',
+                'Would change' if dry_run else 'Changed', len(result['changed']),
+                len(node_order), result['unchanged'], len(result['missing']),
+                len(result['errors']))
+    return result
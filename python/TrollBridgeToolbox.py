@@ -1,18 +1,18 @@
 import logging
 
-import pymel.core as pm
-from maya import OpenMayaUI as omui
-
 from PySide.QtCore import *
 from PySide.QtGui import *
-from shiboken import wrapInstance
 
+# tbt_utils only imports pymel in the functions which need it, so opening
+# the toolbox does not wait for pymel
 import tbt_utils
-reload(tbt_utils)
+import background_render
+from tbt_ui import maya_main_window
 
 logger = logging.getLogger('TrollBridgeToolbox')
-mayaMainWindowPtr = omui.MQtUtil.mainWindow()
-mayaMainWindow= wrapInstance(long(mayaMainWindowPtr), QWidget)
+
+# the window is built on the first open() and reused
+_window = None
 
 
 # projectSetup
@@ -46,7 +46,18 @@ class MainWindow(QWidget):
         self.__setup_widgets()
 
         self.update_status()
-        
+
+    def refresh(self):
+        """Read the values of the scene again when the window is reopened,
+        the scene may have changed since it was built"""
+        self.create_node()
+        status = tbt_utils.get_status(self.node_name) or {}
+        self.edit_filename.setText(status.get(self.node_name + '.sceneName', ''))
+        start, end = tbt_utils.get_frame_range()
+        self.field_start_frame.setValue(int(start))
+        self.field_end_frame.setValue(int(end))
+        self.update_status()
+
     def __setup_widgets(self):
         """Setup menu widgets and add to main layout"""
 
@@ -103,6 +114,46 @@ class MainWindow(QWidget):
         btn_batch.clicked.connect(self.render_frame)
         self.main_layout.addWidget(btn_batch)
 
+        btn_queue = PushButton('Queue Frame Range', self)
+        btn_queue.clicked.connect(self.queue_frame_range)
+        self.main_layout.addWidget(btn_queue)
+
+        self.__background_render_widget()
+
+    def __background_render_widget(self):
+        """
+        Progress, log and cancel button of the background render
+        """
+        self.render_progress = QProgressBar()
+        self.render_progress.setRange(0, 100)
+        self.render_label = QLabel('')
+
+        btn_cancel = QPushButton('Cancel')
+        btn_cancel.clicked.connect(self.cancel_render)
+
+        self.render_log = QPlainTextEdit()
+        self.render_log.setReadOnly(True)
+        self.render_log.setMaximumBlockCount(500)
+        self.render_log.setMaximumHeight(120)
+
+        h_layout = QHBoxLayout()
+        h_layout.addWidget(self.render_progress)
+        h_layout.addWidget(btn_cancel)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.render_label)
+        layout.addLayout(h_layout)
+        layout.addWidget(self.render_log)
+
+        group = QGroupBox('Background Render')
+        group.setLayout(layout)
+        self.main_layout.addWidget(group)
+
+        renderer = background_render.get_renderer()
+        renderer.on_progress = self.render_frame_progress
+        renderer.on_log = self.render_frame_log
+        renderer.on_done = self.render_frame_done
+
     def __render_settings_widget(self):
         """
         Render settings buttons grouped and added to main layout
@@ -178,7 +229,8 @@ class MainWindow(QWidget):
         self.main_layout.addWidget(group)
 
     def update_status(self, button=None):
-        """Update the status of the widgets
+        """Update the status of the widgets. Only buttons whose state changed
+        are repainted
         Args:
             button (QPushButton): The button object which sent the event
         """
@@ -196,15 +248,39 @@ class MainWindow(QWidget):
                 value = bool(status.get(attr_name) == i.property('status'))
             else:
                 attr_name = self.node_name + '.' + i.property('status')
-                value = status.get(attr_name)
+                value = bool(status.get(attr_name))
 
+            if value == i.active:
+                continue
+            i.active = value
             if value:
                 i.setStyleSheet('background-color: green')
             else:
                 i.setStyleSheet('background-color: ')
 
     def render_frame(self):
-        tbt_utils.render_current_frame()
+        """Queue the current frame, frames queue up if a render is running"""
+        job = tbt_utils.render_current_frame(background=True)
+        self.render_label.setText('Queued frame {}'.format(job.frame))
+
+    def queue_frame_range(self):
+        """Render the frame range in the local render queue"""
+        job_id = tbt_utils.queue_frame_range()
+        self.render_label.setText('Queued {}'.format(job_id))
+
+    def cancel_render(self):
+        background_render.get_renderer().cancel()
+
+    def render_frame_progress(self, job, percent):
+        self.render_label.setText('Rendering frame {}'.format(job.frame))
+        self.render_progress.setValue(percent)
+
+    def render_frame_log(self, job, line):
+        self.render_log.appendPlainText(line)
+
+    def render_frame_done(self, job):
+        self.render_label.setText('Frame {} {}'.format(job.frame, job.state))
+        self.render_progress.setValue(100 if job.state == background_render.DONE else 0)
 
     def setup_project(self):
         tbt_utils.setup_project(name=self.edit_filename.text())
@@ -261,6 +337,8 @@ class PushButton(QPushButton):
         self.setText(name)
         self.type = kwargs.get('button_type')
         self.parent = parent
+        # last painted status, None until update_status ran
+        self.active = None
         
     def mouseReleaseEvent(self, event):
         QPushButton.mouseReleaseEvent(self, event)
@@ -269,5 +347,14 @@ class PushButton(QPushButton):
 
 
 def open():
-    dialog = MainWindow(parent=mayaMainWindow)
-    dialog.show()
\ No newline at end of file
+    """Show the toolbox. The window is built on the first call, later
+    calls show the same window with the values of the current scene"""
+    global _window
+    if _window is None:
+        _window = MainWindow(parent=maya_main_window())
+    else:
+        _window.refresh()
+    _window.show()
+    _window.raise_()
+    _window.activateWindow()
+    return _window
\ No newline at end of file
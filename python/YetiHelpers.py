@@ -1,37 +1,113 @@
 import os
+import re
 import logging
 from datetime import datetime
 
 import pymel.core as pm
 
+import tbt_metrics
+import yeti_cache_index
+
 logger = logging.getLogger('YetiToolbox')
 
-def change_location(location):
+# path components of cacheFileName and imageSearchPath kept when relocating
+REMAP_DEPTH = {'cacheFileName': 2, 'imageSearchPath': 1}
+FRAME_TOKEN = re.compile(r'%0?\d*d|#+')
+
+class LocationIndex(object):
+    """
+    Listing of a location and its sub directories. Every directory is listed
+    at most once, so resolving many paths costs one round trip per directory
+    :param location: directory to index
+    """
+
+    def __init__(self, location):
+        self.location = location
+        self.dirs = {}
+
+    def listing(self, rel_dir):
+        if rel_dir not in self.dirs:
+            path = os.path.join(self.location, rel_dir)
+            try:
+                self.dirs[rel_dir] = set(os.listdir(path))
+            except OSError:
+                self.dirs[rel_dir] = set()
+        return self.dirs[rel_dir]
 
-    sel = pm.ls(selection=True)
-    for s in sel:
-        shape = s.getShape()
-        if shape.type() == 'pgYetiMaya':
-            cache = shape.cacheFileName.get()
-            rel = cache.split('/')[-2:]
-            cache_new = os.path.join(location, '/'.join(rel))
-
-            image = shape.imageSearchPath.get()
-            rel = image.split('/')[-1:]
-            image_new = os.path.join(location, '/'.join(rel))
-
-            # check if path is valid
-            if os.path.exists(cache_new):
-                shape.cacheFileName.set(cache_new)
-                logger.info('Changed {} -> {}'.format(cache, cache_new))
-            else:
-                logger.error('Error: path {} does not exist'.format(cache_new))
-
-            if os.path.exists(image_new):
-                shape.imageSearchPath.set(image_new)
-                logger.info('Changed {} -> {}'.format(cache, image_new))
-            else:
-                logger.error('Error: path {} does not exist'.format(image_new))
+    def resolve(self, rel):
+        """
+        Check if a relative path exists in the location. Frame tokens like
+        %04d match if at least one frame exists
+        :param rel: relative path with / separators
+        :return: absolute path or None
+        """
+        parts = rel.split('/')
+        for depth in range(len(parts) - 1):
+            if parts[depth] not in self.listing('/'.join(parts[:depth])):
+                return None
+        name = parts[-1]
+        names = self.listing('/'.join(parts[:-1]))
+        if FRAME_TOKEN.search(name):
+            pattern = re.compile(r'-?\d+'.join(re.escape(p) for p in FRAME_TOKEN.split(name)) + '$')
+            if not any(pattern.match(x) for x in names):
+                return None
+        elif name not in names:
+            return None
+        return os.path.join(self.location, *parts)
+
+def relocate_path(path, depth):
+    """
+    Return the last components of a path joined with /
+    :param path: file path
+    :param depth: number of components to keep
+    :return:
+    """
+    return '/'.join(path.replace('\\', '/').rstrip('/').split('/')[-depth:])
+
+@tbt_metrics.timed()
+def remap_locations(location, nodes=None):
+    """
+    Point cacheFileName and imageSearchPath of yeti nodes to a new location.
+    The location is indexed once and all changes are applied in one undo chunk
+    :param location: new root directory
+    :param nodes: yeti nodes, defaults to all in the scene
+    :return: report dict with changed and unresolved lists
+    """
+    if nodes is None:
+        nodes = pm.ls(type='pgYetiMaya')
+    index = LocationIndex(location)
+    report = {'changed': [], 'unresolved': []}
+
+    changes = []
+    for n in nodes:
+        for attr, depth in sorted(REMAP_DEPTH.items()):
+            old = n.attr(attr).get()
+            if not old:
+                continue
+            new = index.resolve(relocate_path(old, depth))
+            if new is None:
+                report['unresolved'].append((n.name(), attr, old))
+                logger.error('Error: {} not found in {}'.format(old, location))
+            elif new != old:
+                changes.append((n, attr, old, new))
+
+    pm.undoInfo(openChunk=True, chunkName='remap_yeti_locations')
+    try:
+        for n, attr, old, new in changes:
+            n.attr(attr).set(new)
+            report['changed'].append((n.name(), attr, old, new))
+            logger.info('Changed {} -> {}'.format(old, new))
+    finally:
+        pm.undoInfo(closeChunk=True)
+    return report
+
+def change_location(location):
+    """
+    Point the caches and image paths of the selected yeti nodes to a new location
+    :param location: new root directory
+    :return: report dict of remap_locations
+    """
+    return remap_locations(location, nodes=get_yeti_nodes(selection=True))
 
 def get_project_dir(_type=None):
     """
@@ -98,14 +174,14 @@ def set_image_path(path, selection=False):
 def get_input_cache(node):
     return node.cacheFileName.get()
 
-def create_cache(node, _range=(1, 3), samples=3, cache_dir=None):
+def get_cache_file_name(node, cache_dir=None):
     """
-    create cache for yeti node
-    :param node:
+    Return the .%04d.fur cache file path of a yeti node and create the cache
+    directory if needed
+    :param node: yeti node
+    :param cache_dir: output directory, defaults to the fileCache file rule
     :return:
     """
-    # select the node
-    pm.select(node)
     # create output file name
     file_name = node.getParent().name().replace(':', '_')
     file_name += '.%04d.fur'
@@ -116,9 +192,14 @@ def create_cache(node, _range=(1, 3), samples=3, cache_dir=None):
     else:
         if not os.path.exists(cache_dir):
             os.mkdir(cache_dir)
-    file_name = os.path.join(cache_dir, file_name)
-    logger.info('time range: {_range}, samples: {samples}'.format(_range=_range, samples=samples))
+    return os.path.join(cache_dir, file_name)
 
+def prepare_cache(node):
+    """
+    Store the groom file of a node before it gets replaced by a cache
+    :param node: yeti node
+    :return: tuple of (bool, groom file). False if the node already uses a cache
+    """
     # Check if we are either loaded a groom file or not using a loaded cache
     groom_file = node.cacheFileName.get()
     if groom_file:
@@ -130,13 +211,35 @@ def create_cache(node, _range=(1, 3), samples=3, cache_dir=None):
                 node.YetiGroomFile.set(str(groom_file))
     elif node.fileMode.get() != 0:
         logger.info('You are already using a cache')
-        return
+        return False, groom_file
+    return True, groom_file
 
-    # Create cache
+def write_cache(node, file_name, _range=(1, 3), samples=3):
+    """
+    Run pgYetiCommand to write the cache of a node
+    :param node: yeti node
+    :param file_name: .%04d.fur file path
+    :param _range: start and end frame
+    :param samples: samples per frame
+    :return:
+    """
+    # select the node
+    pm.select(node)
     logger.info('Writing cache: {}'.format(file_name))
     cmd = 'pgYetiCommand -writeCache "{file_path}" -range {start} {stop} -samples {samples}'
-    pm.mel.eval(cmd.format(file_path=file_name, start=int(_range[0]), stop=int(_range[1]), samples=3))
-    print 'cmd: ', cmd.format(file_path=file_name, start=int(_range[0]), stop=int(_range[1]), samples=3)
+    cmd = cmd.format(file_path=file_name, start=int(_range[0]), stop=int(_range[1]), samples=int(samples))
+    with tbt_metrics.span('yeti_cache_write', node=str(node), path=file_name, start=_range[0], stop=_range[1]):
+        pm.mel.eval(cmd)
+    print 'cmd: ', cmd
+
+def use_cache(node, file_name, groom_file=None):
+    """
+    Switch a node to a written cache and keep the original groom file in the notes
+    :param node: yeti node
+    :param file_name: .%04d.fur file path
+    :param groom_file: original cache file name of the node
+    :return:
+    """
     # Add notes and original groom file to a custom attribute
     if groom_file:
         try:
@@ -151,4 +254,60 @@ def create_cache(node, _range=(1, 3), samples=3, cache_dir=None):
 
     # Set file cache on node and change to Cache mode
     node.cacheFileName.set(file_name)
-    node.fileMode.set(1)
\ No newline at end of file
+    node.fileMode.set(1)
+
+@tbt_metrics.timed()
+def create_cache(node, _range=(1, 3), samples=3, cache_dir=None):
+    """
+    create cache for yeti node
+    :param node:
+    :return:
+    """
+    file_name = get_cache_file_name(node, cache_dir=cache_dir)
+    logger.info('time range: {_range}, samples: {samples}'.format(_range=_range, samples=samples))
+
+    ok, groom_file = prepare_cache(node)
+    if not ok:
+        return
+
+    # Create cache
+    write_cache(node, file_name, _range=_range, samples=samples)
+    if not check_cache(file_name, _range=_range):
+        return
+    use_cache(node, file_name, groom_file=groom_file)
+
+def check_cache(file_name, _range=None):
+    """
+    Check that a written cache sequence is complete before it gets used.
+    The directory is listed again, the cache may have added frames
+    :param file_name: .%04d.fur file path
+    :param _range: expected start and end frame
+    :return: True if the sequence is complete
+    """
+    with tbt_metrics.span('cache_check', path=file_name) as span:
+        report = yeti_cache_index.validate_cache(file_name, _range=_range, refresh=True)
+        span.set(ok=report['ok'])
+    if not report['ok']:
+        logger.error('Incomplete cache, not switching to it: {}'.format(
+            yeti_cache_index.format_report(report)))
+    return report['ok']
+
+def validate_caches(selection=None):
+    """
+    Validate the cache sequences used by yeti nodes in scene or selection
+    :param selection:
+    :return: list of reports
+    """
+    reports = []
+    for n in get_yeti_nodes(selection=selection):
+        file_name = n.cacheFileName.get()
+        if not file_name or not file_name.endswith('.fur'):
+            continue
+        report = yeti_cache_index.validate_cache(file_name)
+        report['node'] = n.name()
+        if report['ok']:
+            logger.info(yeti_cache_index.format_report(report))
+        else:
+            logger.error(yeti_cache_index.format_report(report))
+        reports.append(report)
+    return reports
@@ -1,18 +1,18 @@
-from maya import OpenMayaUI as omui
 from PySide.QtCore import *
 from PySide.QtGui import *
-from shiboken import wrapInstance
 
 import os
 import logging
 
-import YetiHelpers
-reload(YetiHelpers)
+# YetiHelpers and yeti_batch import pymel, they are imported by the buttons
+# which need them so opening the toolbox does not wait for pymel
+import yeti_cache_index
+from tbt_ui import maya_main_window
 
 logger = logging.getLogger('YetiToolbox')
 
-mayaMainWindowPtr = omui.MQtUtil.mainWindow()
-mayaMainWindow= wrapInstance(long(mayaMainWindowPtr), QWidget)
+# the window is built on the first open() and reused
+_window = None
 
 
 class LineEdit(QWidget):
@@ -42,6 +42,8 @@ class ExportDialog(QDialog):
         self.time_range = time_range
         self.samples = samples
         self.output_path = output_path
+        self.parallel = False
+        self.chunks = 1
 
         self.layout_edits = QGridLayout()
         self.main_layout = QVBoxLayout()
@@ -51,6 +53,9 @@ class ExportDialog(QDialog):
         self.edit_time_stop = LineEdit('Stop', time_range[1])
         self.edit_samples = LineEdit('Samples', samples)
         self.edit_path = LineEdit('Export Path', output_path)
+        self.edit_chunks = LineEdit('Range Parts', self.chunks)
+        self.check_parallel = QCheckBox('Headless workers')
+        self.check_parallel.setToolTip('Cache every node in its own mayapy process')
 
         # OK and Cancel buttons
         buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, Qt.Horizontal, self)
@@ -60,6 +65,8 @@ class ExportDialog(QDialog):
         self.layout_edits.addWidget(self.edit_time_start, 0, 0)
         self.layout_edits.addWidget(self.edit_time_stop, 0, 1)
         self.layout_edits.addWidget(self.edit_samples, 1, 0)
+        self.layout_edits.addWidget(self.edit_chunks, 1, 1)
+        self.layout_edits.addWidget(self.check_parallel, 2, 0)
 
         self.main_layout.addWidget(self.edit_path)
         self.main_layout.addLayout(self.layout_edits)
@@ -68,6 +75,8 @@ class ExportDialog(QDialog):
     def send_values(self):
         self.time_range = (float(self.edit_time_start.text()), float(self.edit_time_stop.text()))
         self.samples = int(self.edit_samples.text())
+        self.parallel = self.check_parallel.isChecked()
+        self.chunks = int(self.edit_chunks.text())
         self.accept()
 
 class YetiMainWidget(QWidget):
@@ -82,6 +91,8 @@ class YetiMainWidget(QWidget):
         self.main_layout = QGridLayout()
         self.setLayout(self.main_layout)
 
+        self.batch = None
+
         self.__setup_widgets()
 
     def __setup_widgets(self):
@@ -91,10 +102,20 @@ class YetiMainWidget(QWidget):
         self.btn_set_source = QPushButton('Set Image Source Directory')
         self.btn_set_source.clicked.connect(self.set_image_src)
 
+        self.btn_validate = QPushButton('Validate Caches')
+        self.btn_validate.clicked.connect(self.validate_caches)
+
         self.main_layout.addWidget(self.btn_create_cache, 0, 0)
         self.main_layout.addWidget(self.btn_set_source, 1, 0)
+        self.btn_relocate = QPushButton('Relocate Caches')
+        self.btn_relocate.clicked.connect(self.relocate_caches)
+
+        self.main_layout.addWidget(self.btn_validate, 2, 0)
+        self.main_layout.addWidget(self.btn_relocate, 3, 0)
 
     def create_cache(self):
+        import YetiHelpers
+
         selection = YetiHelpers.get_selection()
         nodes = YetiHelpers.get_yeti_nodes(selection)
         time_range = YetiHelpers.get_time_range()
@@ -108,12 +129,63 @@ class YetiMainWidget(QWidget):
             time_range = dialog.time_range
             samples = dialog.samples
             output_path = dialog.output_path
+            if dialog.parallel:
+                self.create_cache_parallel(nodes, time_range, samples, output_path, dialog.chunks)
+                return
             # iterate through nodes and create the caches
             #print time_range, samples, output_path
             for n in nodes:
                 YetiHelpers.create_cache(n, _range=time_range, samples=samples, cache_dir=output_path)
 
+    def create_cache_parallel(self, nodes, time_range, samples, output_path, chunks):
+        import yeti_batch
+
+        # a batch which failed to start has no thread
+        if self.batch and self.batch.thread is not None and self.batch.thread.is_alive():
+            logger.error('Caches are still being written')
+            return
+        self.batch = yeti_batch.CacheBatch(
+            nodes, time_range, samples=samples, cache_dir=output_path, chunks=chunks)
+        self.batch.start(on_done=self.cache_done)
+        # cache_done runs deferred in the main thread, after this returns
+        self.btn_create_cache.setEnabled(False)
+        self.btn_create_cache.setText('Writing Caches...')
+
+    def cache_done(self, failed):
+        self.btn_create_cache.setEnabled(True)
+        self.btn_create_cache.setText('Create Cache')
+        if failed:
+            logger.error('Failed to cache: {}'.format(', '.join(str(n) for n in failed)))
+        else:
+            logger.info('All caches written')
+
+    def validate_caches(self):
+        import YetiHelpers
+
+        reports = YetiHelpers.validate_caches(selection=None)
+        bad = [r for r in reports if not r['ok']]
+        if bad:
+            QMessageBox.warning(self, 'Validate Caches', '\n'.join(
+                '{}: {}'.format(r['node'], yeti_cache_index.format_report(r)) for r in bad))
+        else:
+            logger.info('{} caches ok'.format(len(reports)))
+
+    def relocate_caches(self):
+        import YetiHelpers
+
+        location = QFileDialog.getExistingDirectory(
+            self, 'New Cache Location', YetiHelpers.get_project_dir(_type='fileCache'))
+        if not location:
+            return
+        report = YetiHelpers.remap_locations(str(location))
+        logger.info('Changed {} paths'.format(len(report['changed'])))
+        if report['unresolved']:
+            QMessageBox.warning(self, 'Relocate Caches', 'Not found in {}:\n{}'.format(
+                location, '\n'.join('{}.{}: {}'.format(*u) for u in report['unresolved'])))
+
     def set_image_src(self):
+        import YetiHelpers
+
         default_dir = YetiHelpers.get_project_dir(_type='sourceImages')
         dialog = QInputDialog(self)
         dialog.setInputMode(QInputDialog.TextInput)
@@ -129,5 +201,11 @@ class YetiMainWidget(QWidget):
             logger.info('Set path to: {}'.format(path))
 
 def open():
-    yeti_dialog = YetiMainWidget(parent=mayaMainWindow)
-    yeti_dialog.show()
\ No newline at end of file
+    """Show the toolbox. The window is built on the first call and reused"""
+    global _window
+    if _window is None:
+        _window = YetiMainWidget(parent=maya_main_window())
+    _window.show()
+    _window.raise_()
+    _window.activateWindow()
+    return _window
\ No newline at end of file
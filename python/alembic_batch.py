@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+"""
+Export alembic caches of many shots in parallel. Every scene of the manifest
+is exported by export_alembic.py in its own mayapy process, the number of
+processes running at the same time is limited by --workers.
+
+The manifest is either a text file with one scene path per line or a json
+file:
+
+    {
+        "project": "/path/to/project",
+        "rig_type": "head",
+        "scenes": [
+            "/path/to/project/scenes/TB_01130/TB_01130_anim_v03.mb",
+            {"scene": "/path/to/other.mb", "rig_type": "body"}
+        ]
+    }
+
+Run it with a normal python interpreter:
+
+    python alembic_batch.py shots.json --workers 4 --timeout 3600 --retries 1
+
+The job ledger is written next to the manifest. Running the same command again
+after an interruption only exports the scenes which are not done yet.
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+
+import mayapy_pool
+
+logger = logging.getLogger('alembic_batch')
+
+EXPORT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'export_alembic.py')
+
+
+def read_manifest(path, project=None, rig_type='head'):
+    """Read the scenes to export from a manifest file
+
+    Args:
+        path (str): Json or text manifest
+        project (str): Default project directory
+        rig_type (str): Default rig type
+
+    Returns:
+        list: List of dicts with scene, project and rig_type keys
+    """
+    with open(path, 'r') as f:
+        content = f.read()
+
+    if path.endswith('.json'):
+        data = json.loads(content)
+        project = data.get('project', project)
+        rig_type = data.get('rig_type', rig_type)
+        scenes = data.get('scenes', [])
+    else:
+        scenes = [l.strip() for l in content.splitlines()
+                  if l.strip() and not l.strip().startswith('#')]
+
+    entries = []
+    for s in scenes:
+        if not isinstance(s, dict):
+            s = {'scene': s}
+        entry = {
+            'scene': s['scene'],
+            'project': s.get('project', project),
+            'rig_type': s.get('rig_type', rig_type),
+        }
+        if not entry['project']:
+            raise ValueError('No project set for scene: {}'.format(entry['scene']))
+        entries.append(entry)
+    return entries
+
+
+def create_jobs(entries, mayapy=mayapy_pool.MAYAPY, timeout=None, retries=0):
+    """Create one export job per manifest entry
+
+    Args:
+        entries (list): Entries returned by read_manifest()
+        mayapy (str): Path of the mayapy interpreter
+        timeout (float): Timeout per job in seconds
+        retries (int): Retries per job
+
+    Returns:
+        list: List of mayapy_pool.Job
+    """
+    jobs = []
+    for e in entries:
+        cmd = [mayapy, EXPORT_SCRIPT, e['scene'], e['project'], e['rig_type']]
+        job_id = '{}:{}'.format(e['rig_type'], e['scene'])
+        jobs.append(mayapy_pool.Job(job_id, cmd, timeout=timeout, retries=retries))
+    return jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Batch export alembic caches')
+    parser.add_argument('manifest', help='json or text file with the scenes to export')
+    parser.add_argument('--project', help='project directory if not set in the manifest')
+    parser.add_argument('--rig-type', default='head', choices=['head', 'body'])
+    parser.add_argument('--workers', type=int, default=mayapy_pool.default_workers())
+    parser.add_argument('--timeout', type=float, default=None, help='seconds per job')
+    parser.add_argument('--retries', type=int, default=0)
+    parser.add_argument('--mayapy', default=mayapy_pool.MAYAPY)
+    parser.add_argument('--ledger', help='job ledger, defaults to <manifest>.ledger.json')
+    parser.add_argument('--log-dir', help='job logs, defaults to <manifest>_logs')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s: %(message)s')
+
+    base = os.path.splitext(args.manifest)[0]
+    ledger_path = args.ledger or base + '.ledger.json'
+    log_dir = args.log_dir or base + '_logs'
+
+    entries = read_manifest(args.manifest, project=args.project, rig_type=args.rig_type)
+    jobs = create_jobs(entries, mayapy=args.mayapy, timeout=args.timeout, retries=args.retries)
+    logger.info('Exporting %d scenes with %d workers', len(jobs), args.workers)
+
+    ledger = mayapy_pool.Ledger(ledger_path)
+    summary = mayapy_pool.run_jobs(jobs, workers=args.workers, ledger=ledger, log_dir=log_dir)
+
+    mayapy_pool.write_json(base + '.report.json', summary)
+    logger.info('Summary:\n%s', mayapy_pool.format_summary(summary))
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Skip alembic exports whose inputs did not change since the last export.
+
+For every exported alembic file a record is kept in the .export_cache folder
+of the alembicCache directory. The record holds a fingerprint of everything
+the export depends on:
+
+    - content hash of the scene file
+    - path, size and modification time of the rig which replaced the reference
+    - rig type and root nodes
+    - AbcExport options
+
+The frame range is read from the scene, so it is covered by the scene hash.
+If the fingerprint matches and the exported files are still the ones written
+by that export, the export is skipped.
+"""
+
+import os
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger('alembic_cache')
+
+CACHE_DIR = '.export_cache'
+BLOCK_SIZE = 1024 * 1024
+
+
+def file_signature(path):
+    """Return size and modification time of a file"""
+    st = os.stat(path)
+    return [st.st_size, int(st.st_mtime)]
+
+
+def file_hash(path):
+    """Return the sha1 hex digest of a file's content"""
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                break
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def fingerprint(inputs):
+    """Return a stable hash of export inputs. The scene signature is left
+    out, so touching the scene without changing it keeps the fingerprint"""
+    data = dict((k, v) for k, v in inputs.items() if k != 'scene_signature')
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ExportCache(object):
+    """Persistent record of the alembic exports in a directory
+
+    Args:
+        abc_dir (str): Directory the alembic files are exported to
+    """
+
+    def __init__(self, abc_dir):
+        self.root = os.path.join(abc_dir, CACHE_DIR)
+
+    def record_path(self, abc_path):
+        return os.path.join(self.root, os.path.basename(abc_path) + '.json')
+
+    def read(self, abc_path):
+        """Return the record of an alembic file or None"""
+        path = self.record_path(abc_path)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            logger.warning('Ignoring broken cache record: %s', path)
+            return None
+
+    def inputs(self, abc_path, scene, rig, rig_type, roots, options, **kwargs):
+        """Collect the inputs of an export
+
+        The scene hash of the previous record is reused if the size and
+        modification time of the scene did not change, so unchanged scenes
+        are not read again.
+
+        Args:
+            abc_path (str): Alembic file path
+            scene (str): Scene file path
+            rig (str): Rig file which replaces the reference
+            rig_type (str): Rig type
+            roots (str): Root nodes
+            options (str): AbcExport options
+            kwargs: Additional settings which change the export
+
+        Returns:
+            dict: Export inputs
+        """
+        scene_sig = file_signature(scene)
+        record = self.read(abc_path)
+        if record and record['inputs']['scene_signature'] == scene_sig:
+            scene_hash = record['inputs']['scene_hash']
+        else:
+            scene_hash = file_hash(scene)
+
+        inputs = {
+            'scene': os.path.abspath(scene),
+            'scene_signature': scene_sig,
+            'scene_hash': scene_hash,
+            'rig': os.path.abspath(rig),
+            'rig_signature': file_signature(rig),
+            'rig_type': rig_type,
+            'roots': roots,
+            'options': options,
+        }
+        inputs.update(kwargs)
+        return inputs
+
+    def lookup(self, abc_path, inputs):
+        """Return the record of a previous export with the same inputs whose
+        files are unchanged, or None if the export has to run
+
+        Args:
+            abc_path (str): Alembic file path
+            inputs (dict): Inputs returned by inputs()
+        """
+        record = self.read(abc_path)
+        if not record or record['fingerprint'] != fingerprint(inputs):
+            return None
+        for path, sig in record['outputs'].items():
+            if not os.path.exists(path) or file_signature(path) != sig:
+                logger.info('Exported file changed: %s', path)
+                return None
+        return record
+
+    def store(self, abc_path, inputs, outputs, **kwargs):
+        """Record an export
+
+        Args:
+            abc_path (str): Alembic file path
+            inputs (dict): Inputs returned by inputs()
+            outputs (list): Files written by the export
+            kwargs: Additional information stored in the record
+        """
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        record = dict(kwargs)
+        record.update({
+            'fingerprint': fingerprint(inputs),
+            'inputs': inputs,
+            'outputs': dict((p, file_signature(p)) for p in outputs),
+        })
+        path = self.record_path(abc_path)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(record, f, indent=2, sort_keys=True)
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(path + '.tmp', path)
@@ -0,0 +1,210 @@
+"""
+Split the frame range of an alembic bake into chunks and export the chunks in
+parallel, each one by its own mayapy process.
+
+The chunks overlap by a few frames, so they can be stitched together or
+loaded one after another without gaps. Every export writes a manifest next to
+the chunk files which lists them in frame order:
+
+    TB_01130_anim_v03.chunks.json
+    TB_01130_anim_v03.chunk000.abc
+    TB_01130_anim_v03.chunk001.abc
+    ...
+
+The manifest also stores the measured seconds per frame. The next export of
+the same shot uses it to decide how many chunks are worth it: a chunk should
+take at least as long to bake as a mayapy process needs to load the scene.
+"""
+
+import os
+import json
+import logging
+
+import mayapy_pool
+import tbt_metrics
+
+logger = logging.getLogger('alembic_shards')
+
+CHUNK_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'export_alembic_chunk.py')
+
+# frames every chunk reaches into its neighbours
+OVERLAP = 1
+# the bake of one chunk should take at least this long, otherwise the
+# startup of another mayapy process costs more than it saves
+MIN_CHUNK_SECONDS = 30.0
+
+
+def split_frame_range(start, stop, chunks, overlap=OVERLAP):
+    """Split a frame range into overlapping chunks
+
+    Args:
+        start (float): Start frame
+        stop (float): End frame
+        chunks (int): Number of chunks
+        overlap (int): Frames every chunk extends into its neighbours
+
+    Returns:
+        list: List of (start, stop) tuples in frame order
+    """
+    start, stop = int(round(start)), int(round(stop))
+    frames = stop - start
+    chunks = max(1, min(int(chunks), frames or 1))
+    bounds = [start + int(round(i * frames / float(chunks))) for i in range(chunks + 1)]
+    return [(max(start, bounds[i] - overlap), min(stop, bounds[i + 1] + overlap))
+            for i in range(chunks)]
+
+
+def plan_chunks(start, stop, chunks=None, workers=None, sec_per_frame=None,
+                load_seconds=None, min_chunk_seconds=MIN_CHUNK_SECONDS):
+    """Return the number of chunks to split a frame range into
+
+    Args:
+        start (float): Start frame
+        stop (float): End frame
+        chunks (int): Fixed number of chunks. Disables the adaptive sizing
+        workers (int): Max number of parallel processes
+        sec_per_frame (float): Measured bake time per frame
+        load_seconds (float): Measured time to load the scene in a worker
+        min_chunk_seconds (float): Min bake time of a chunk
+
+    Returns:
+        int: Number of chunks
+    """
+    if chunks:
+        return int(chunks)
+    workers = workers or mayapy_pool.default_workers()
+    if not sec_per_frame:
+        return workers
+
+    work = sec_per_frame * (stop - start)
+    min_chunk = max(min_chunk_seconds, load_seconds or 0.0)
+    return int(max(1, min(workers, work // min_chunk)))
+
+
+def manifest_path(abc_path):
+    """Return the path of the chunk manifest of an alembic file"""
+    return os.path.splitext(abc_path)[0] + '.chunks.json'
+
+
+def read_manifest(path):
+    """Return the chunk manifest at path or None if there is none"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def measured_speed(manifest):
+    """Return the seconds per frame and the scene load time measured in the
+    export which wrote the manifest
+
+    Returns:
+        tuple(float, float): Seconds per frame and load seconds or
+            (None, None) if nothing was measured
+    """
+    if not manifest:
+        return None, None
+    return manifest.get('sec_per_frame'), manifest.get('load_seconds')
+
+
+def chunk_timings(chunks):
+    """Read the timings the chunk processes wrote next to their files
+
+    Args:
+        chunks (list): Chunk dicts with file, start and stop keys
+
+    Returns:
+        tuple(float, float): Seconds per frame and mean load time
+    """
+    frames = 0
+    export = 0.0
+    load = []
+    for c in chunks:
+        path = c['file'] + '.json'
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r') as f:
+            timing = json.load(f)
+        os.remove(path)
+        c['export_seconds'] = timing['export_seconds']
+        frames += c['stop'] - c['start'] + 1
+        export += timing['export_seconds']
+        load.append(timing['load_seconds'])
+
+    if not frames:
+        return None, None
+    return export / frames, sum(load) / len(load)
+
+
+@tbt_metrics.timed()
+def export_sharded(start, stop, node, chunks=None, suffix='', workers=None,
+                   overlap=OVERLAP, mayapy=None, timeout=None):
+    """Export an alembic bake of the current scene in parallel chunks
+
+    The current scene is exported to a temp file first, so the chunk
+    processes see the same references as the current session.
+
+    Args:
+        start (float): Start frame
+        stop (float): End frame
+        node (str): Long name of the root node
+        chunks (int): Number of chunks. If None it is based on the speed
+            measured in the last export of the scene
+        suffix (str): Suffix of the alembic file name
+        workers (int): Max number of parallel processes
+        overlap (int): Frames every chunk extends into its neighbours
+        mayapy (str): mayapy interpreter for the chunk processes
+        timeout (float): Timeout per chunk in seconds
+
+    Returns:
+        dict: The written manifest
+    """
+    import pymel.core as pm
+    import tbt_utils
+
+    abc_path = str(tbt_utils.get_alembic_path(suffix))
+    base = os.path.splitext(abc_path)[0]
+    manifest = manifest_path(abc_path)
+    sec_per_frame, load_seconds = measured_speed(read_manifest(manifest))
+    count = plan_chunks(start, stop, chunks=chunks, workers=workers,
+                        sec_per_frame=sec_per_frame, load_seconds=load_seconds)
+    ranges = split_frame_range(start, stop, count, overlap=overlap)
+    logger.info('Exporting frames %s-%s in %d chunks', start, stop, len(ranges))
+
+    # snapshot of the scene with the updated rig references for the workers
+    src = base + '_chunk_src.mb'
+    pm.exportAll(src, preserveReferences=True, force=True, type='mayaBinary')
+
+    project = str(pm.workspace.getPath())
+    mayapy = mayapy or mayapy_pool.MAYAPY
+    result = []
+    jobs = []
+    for i, (s, e) in enumerate(ranges):
+        path = '{}.chunk{:03d}.abc'.format(base, i)
+        result.append({'file': path, 'start': s, 'stop': e})
+        cmd = [mayapy, CHUNK_SCRIPT, src, project, str(s), str(e), node, path]
+        jobs.append(mayapy_pool.Job(os.path.basename(path), cmd, timeout=timeout))
+
+    try:
+        summary = mayapy_pool.run_jobs(
+            jobs, workers=workers or len(jobs), log_dir=base + '_chunk_logs')
+    finally:
+        os.remove(src)
+
+    if summary['failed']:
+        raise IOError('Alembic chunk export failed:\n{}'.format(
+            mayapy_pool.format_summary(summary)))
+
+    sec_per_frame, load_seconds = chunk_timings(result)
+    data = {
+        'frame_range': [start, stop],
+        'node': node,
+        'overlap': overlap,
+        'chunks': result,
+        'sec_per_frame': sec_per_frame,
+        'load_seconds': load_seconds,
+        'wall_time': summary['wall_time'],
+    }
+    mayapy_pool.write_json(manifest, data)
+    logger.info('Wrote chunk manifest: %s', manifest)
+    return data
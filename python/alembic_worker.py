@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+
+"""
+Long running mayapy worker for alembic exports.
+
+Starting maya standalone and loading the AbcExport plugin often takes longer
+than the export itself. The worker initializes maya once and then takes jobs
+from a spool directory. After every job the scene is reset with a new file,
+so every following export only pays for loading its scene.
+
+Start a worker with mayapy:
+
+    mayapy alembic_worker.py serve /path/to/spool
+
+Submit jobs from any python:
+
+    python alembic_worker.py submit /path/to/spool scene.mb /path/to/project --rig-type body
+
+A job is a json file in the spool directory. The worker claims it by renaming
+it, runs it and writes a result file next to it:
+
+    <id>.job      waiting
+    <id>.running  claimed by a worker, which adds its name to the job
+    <id>.done     finished, contains the result
+    <id>.failed   failed or not readable, contains the error
+
+When a worker starts, it puts the running jobs of dead workers on the same
+host back to waiting.
+"""
+
+import os
+import sys
+import json
+import errno
+import glob
+import time
+import uuid
+import socket
+import logging
+import argparse
+import traceback
+
+import tbt_metrics
+
+logger = logging.getLogger('alembic_worker')
+
+JOB = '.job'
+RUNNING = '.running'
+DONE = '.done'
+FAILED = '.failed'
+
+# actions a job can run
+WRITE_ALEMBIC = 'write_alembic'
+EXPORT_ALEMBIC_BAKE = 'export_alembic_bake'
+
+
+def write_json(path, data):
+    """Write json through a temp file, so readers never see half a file"""
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp, path)
+
+
+def is_alive(pid):
+    """Check if a process of this host is running"""
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def submit(spool_dir, job):
+    """Put a job into the spool directory
+
+    Args:
+        spool_dir (str): Spool directory of the worker
+        job (dict): Job with an "action" key and the arguments of the action
+
+    Returns:
+        str: Id of the job
+    """
+    if not os.path.exists(spool_dir):
+        os.makedirs(spool_dir)
+    job_id = job.get('id') or '{:.0f}_{}'.format(time.time() * 1000, uuid.uuid4().hex[:8])
+    # the rename makes the job visible to the worker only when it is complete
+    write_json(os.path.join(spool_dir, job_id + JOB), dict(job, id=job_id))
+    return job_id
+
+
+def result(spool_dir, job_id):
+    """Return the result of a job or None if it is not finished yet"""
+    for ext in (DONE, FAILED):
+        path = os.path.join(spool_dir, job_id + ext)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return json.load(f)
+    return None
+
+
+def wait(spool_dir, job_id, timeout=None, interval=0.5):
+    """Block until a job is finished and return its result"""
+    start = time.time()
+    while True:
+        res = result(spool_dir, job_id)
+        if res is not None:
+            return res
+        if timeout and time.time() - start > timeout:
+            return None
+        time.sleep(interval)
+
+
+class Worker(object):
+    """Maya worker which processes the jobs of a spool directory
+
+    Maya is only imported in initialize(), so the worker can be used with a
+    stub maya module in sys.modules.
+
+    Args:
+        spool_dir (str): Directory to take jobs from
+        poll_interval (float): Seconds to wait between looking for new jobs
+    """
+
+    def __init__(self, spool_dir, poll_interval=0.5):
+        self.spool_dir = spool_dir
+        self.poll_interval = poll_interval
+        self.name = '{}:{}'.format(socket.gethostname(), os.getpid())
+        self.project = None
+        self.pm = None
+        self.tbt_utils = None
+        self.jobs_done = 0
+
+    def initialize(self):
+        """Start maya standalone and load the alembic plugin"""
+        start = time.time()
+        with tbt_metrics.span('maya_init'):
+            import maya.standalone
+            maya.standalone.initialize('Python')
+
+            import pymel.core as pm
+            import tbt_utils
+        self.pm = pm
+        self.tbt_utils = tbt_utils
+
+        with tbt_metrics.span('plugin_load', plugin='AbcExport.bundle'):
+            pm.loadPlugin('AbcExport.bundle')
+        logger.info('Initialized maya in %.1fs', time.time() - start)
+
+    def set_project(self, proj_dir):
+        """Open the workspace if it is not already the current one"""
+        if proj_dir and proj_dir != self.project:
+            logger.info('Setting project to: %s', proj_dir)
+            with tbt_metrics.span('workspace_open', project=proj_dir):
+                self.pm.workspace.open(proj_dir)
+            self.project = proj_dir
+
+    def claim(self):
+        """Claim the oldest waiting job
+
+        Returns:
+            tuple(str, str): Job id and path of the claimed job file or
+                (None, None) if there is nothing to do
+        """
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, '*' + JOB))):
+            job_id = os.path.basename(path)[:-len(JOB)]
+            running = os.path.join(self.spool_dir, job_id + RUNNING)
+            try:
+                os.rename(path, running)
+            except OSError:
+                # another worker was faster
+                continue
+            return job_id, running
+        return None, None
+
+    def recover(self):
+        """Put the running jobs of dead workers of this host back to waiting.
+        Workers of other hosts can not be checked, their jobs are left alone
+
+        Returns:
+            list: Ids of the jobs put back
+        """
+        host = socket.gethostname()
+        recovered = []
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, '*' + RUNNING))):
+            job_id = os.path.basename(path)[:-len(RUNNING)]
+            try:
+                with open(path, 'r') as f:
+                    owner = json.load(f).get('worker') or ''
+            except (IOError, ValueError, AttributeError):
+                continue
+            owner_host, _, pid = owner.rpartition(':')
+            if owner_host != host or not pid.isdigit() or is_alive(int(pid)):
+                continue
+            try:
+                os.rename(path, os.path.join(self.spool_dir, job_id + JOB))
+            except OSError:
+                # recovered by another worker
+                continue
+            logger.warning('Put job %s of dead worker %s back to waiting', job_id, owner)
+            recovered.append(job_id)
+        return recovered
+
+    def run_job(self, job):
+        """Run a single job in the current maya session
+
+        Args:
+            job (dict): Job description
+
+        Returns:
+            dict: Result of the job
+        """
+        action = job.get('action', WRITE_ALEMBIC)
+        self.set_project(job.get('project'))
+
+        if action == WRITE_ALEMBIC:
+            self.tbt_utils.write_alembic(
+                job['scene'], job['project'],
+                rig_type=job.get('rig_type', self.tbt_utils.head),
+                init=False)
+        elif action == EXPORT_ALEMBIC_BAKE:
+            with tbt_metrics.span('scene_open', scene=job['scene']):
+                self.pm.openFile(job['scene'], open=True, force=True)
+            self.tbt_utils.export_alembic_bake(
+                job['start'], job['stop'], job['node'], suffix=job.get('suffix', ''),
+                path=job.get('path'))
+        else:
+            raise ValueError('Unknown action: {}'.format(action))
+        return {'action': action, 'scene': job.get('scene')}
+
+    def reset(self):
+        """Throw away the scene of the last job"""
+        self.pm.newFile(force=True)
+
+    def process(self, job_id, path):
+        start = time.time()
+        res = {'id': job_id, 'worker': self.name}
+        try:
+            with open(path, 'r') as f:
+                job = json.load(f)
+            if not isinstance(job, dict):
+                raise ValueError('job is not an object')
+        except (IOError, ValueError) as e:
+            logger.error('Could not read job %s: %s', job_id, e)
+            res.update(error='Could not read job: {}'.format(e), duration=0.0)
+            self.finish(job_id, path, res, FAILED)
+            return res
+        # marks the job as taken by this worker for recover()
+        write_json(path, dict(job, worker=self.name))
+
+        try:
+            with tbt_metrics.span('job', job=job_id, action=job.get('action', WRITE_ALEMBIC)):
+                res.update(self.run_job(job))
+        except Exception as e:
+            logger.error('Job %s failed: %s', job_id, e)
+            res.update(error=str(e), traceback=traceback.format_exc())
+            ext = FAILED
+        else:
+            ext = DONE
+        finally:
+            try:
+                self.reset()
+            except Exception:
+                logger.exception('Could not reset scene after job %s', job_id)
+
+        res['duration'] = time.time() - start
+        self.finish(job_id, path, res, ext)
+        logger.info('Job %s %s in %.1fs', job_id, ext[1:], res['duration'])
+        return res
+
+    def finish(self, job_id, path, res, ext):
+        """Write the result file of a job and remove the running job"""
+        write_json(os.path.join(self.spool_dir, job_id + ext), res)
+        os.remove(path)
+        self.jobs_done += 1
+
+    def serve(self, idle_timeout=None, max_jobs=None):
+        """Process jobs until the idle timeout or the max number of jobs is
+        reached. Runs forever if both are None.
+
+        Args:
+            idle_timeout (float): Seconds without a job after which the worker stops
+            max_jobs (int): Number of jobs after which the worker stops
+        """
+        if not os.path.exists(self.spool_dir):
+            os.makedirs(self.spool_dir)
+        self.recover()
+        if self.pm is None:
+            self.initialize()
+
+        logger.info('Worker %s waiting for jobs in %s', self.name, self.spool_dir)
+        idle_since = time.time()
+        while True:
+            if max_jobs and self.jobs_done >= max_jobs:
+                break
+            job_id, path = self.claim()
+            if job_id:
+                self.process(job_id, path)
+                idle_since = time.time()
+                continue
+            if idle_timeout and time.time() - idle_since > idle_timeout:
+                logger.info('No jobs for %.0fs, stopping', idle_timeout)
+                break
+            time.sleep(self.poll_interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Warm mayapy alembic export worker')
+    sub = parser.add_subparsers(dest='command')
+
+    serve = sub.add_parser('serve', help='run a worker, needs mayapy')
+    serve.add_argument('spool_dir')
+    serve.add_argument('--idle-timeout', type=float, default=None)
+    serve.add_argument('--max-jobs', type=int, default=None)
+
+    add = sub.add_parser('submit', help='submit a write_alembic job')
+    add.add_argument('spool_dir')
+    add.add_argument('scene')
+    add.add_argument('project')
+    add.add_argument('--rig-type', default='head', choices=['head', 'body'])
+    add.add_argument('--wait', action='store_true', help='wait for the result')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s: %(message)s')
+
+    if args.command == 'serve':
+        Worker(args.spool_dir).serve(idle_timeout=args.idle_timeout, max_jobs=args.max_jobs)
+        return 0
+
+    job_id = submit(args.spool_dir, {
+        'action': WRITE_ALEMBIC,
+        'scene': os.path.abspath(args.scene),
+        'project': args.project,
+        'rig_type': args.rig_type,
+    })
+    logger.info('Submitted job %s', job_id)
+    if args.wait:
+        res = wait(args.spool_dir, job_id)
+        logger.info('Result: %s', res)
+        return 1 if 'error' in res else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
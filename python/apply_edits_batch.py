@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+"""
+Apply reference edit files to many shots in parallel. Every scene of the
+manifest is opened by apply_edits_worker.py in its own mayapy process, the
+edits are applied with ReferenceTools.apply_edits and the scene is saved if
+anything changed.
+
+The manifest is either a text file with one scene path per line, using the
+edit files given with --edits, or a json file:
+
+    {
+        "project": "/path/to/project",
+        "edits": [{"file": "/path/to/lookdev_edits.jsonl.gz", "namespace": "horse"}],
+        "scenes": [
+            "/path/to/project/scenes/TB_01130/TB_01130_anim_v03.mb",
+            {"scene": "/path/to/other.mb",
+             "edits": [{"file": "/path/to/lookdev_edits.jsonl.gz", "namespace": "horse1"}]}
+        ]
+    }
+
+The namespace of an edit is passed as namespace_override, so one edit file
+can target rigs referenced with different namespaces. Run it with a normal
+python interpreter:
+
+    python apply_edits_batch.py shots.json --workers 4
+    python apply_edits_batch.py shots.txt --edits lookdev_edits.jsonl.gz --namespace horse
+
+The job ledger and a report with the result of every shot are written next to
+the manifest. Running the same command again only processes the shots which
+are not done yet.
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+
+import mayapy_pool
+
+logger = logging.getLogger('apply_edits_batch')
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'apply_edits_worker.py')
+
+
+def read_manifest(path, project=None, edits=None):
+    """Read the scenes and their edit files from a manifest file
+
+    Args:
+        path (str): Json or text manifest
+        project (str): Default project directory
+        edits (list): Default edits, list of {'file', 'namespace'} dicts
+
+    Returns:
+        list: List of dicts with scene, project and edits keys
+    """
+    with open(path, 'r') as f:
+        content = f.read()
+
+    if path.endswith('.json'):
+        data = json.loads(content)
+        project = data.get('project', project)
+        edits = data.get('edits', edits)
+        scenes = data.get('scenes', [])
+    else:
+        scenes = [l.strip() for l in content.splitlines()
+                  if l.strip() and not l.strip().startswith('#')]
+
+    entries = []
+    for s in scenes:
+        if not isinstance(s, dict):
+            s = {'scene': s}
+        entry = {
+            'scene': s['scene'],
+            'project': s.get('project', project),
+            'edits': [e if isinstance(e, dict) else {'file': e} for e in s.get('edits', edits) or []],
+        }
+        if not entry['edits']:
+            raise ValueError('No edit files set for scene: {}'.format(entry['scene']))
+        entries.append(entry)
+    return entries
+
+
+def report_path(report_dir, scene):
+    return os.path.join(report_dir, mayapy_pool.safe_name(scene) + '.json')
+
+
+def create_jobs(entries, report_dir, mayapy=mayapy_pool.MAYAPY, timeout=None,
+                retries=0, dry_run=False):
+    """Create one job per manifest entry
+
+    Args:
+        entries (list): Entries returned by read_manifest()
+        report_dir (str): Directory the workers write their reports to
+        mayapy (str): Path of the mayapy interpreter
+        timeout (float): Timeout per job in seconds
+        retries (int): Retries per job
+        dry_run (bool): Only report what would change, do not save
+
+    Returns:
+        list: List of mayapy_pool.Job
+    """
+    jobs = []
+    for e in entries:
+        cmd = [mayapy, WORKER_SCRIPT, e['scene'], e['project'] or '',
+               report_path(report_dir, e['scene']), json.dumps(e['edits'])]
+        if dry_run:
+            cmd.append('1')
+        jobs.append(mayapy_pool.Job(e['scene'], cmd, timeout=timeout, retries=retries))
+    return jobs
+
+
+def collect_reports(entries, report_dir, ledger):
+    """Combine the worker reports into one entry per shot
+
+    Args:
+        entries (list): Entries returned by read_manifest()
+        report_dir (str): Directory the workers wrote their reports to
+        ledger (mayapy_pool.Ledger): Ledger of the batch
+
+    Returns:
+        list: List of dicts with scene, state, saved and edit counts
+    """
+    shots = []
+    for e in entries:
+        shot = {'scene': e['scene'], 'state': ledger.state(e['scene']),
+                'saved': False, 'changed': 0, 'unchanged': 0, 'missing': 0, 'errors': []}
+        path = report_path(report_dir, e['scene'])
+        if shot['state'] == mayapy_pool.DONE and os.path.exists(path):
+            with open(path, 'r') as f:
+                report = json.load(f)
+            shot['saved'] = report['saved']
+            for result in report['edits']:
+                shot['changed'] += len(result['changed'])
+                shot['unchanged'] += result['unchanged']
+                shot['missing'] += len(result['missing'])
+                shot['errors'].extend(result['errors'])
+        elif shot['state'] != mayapy_pool.DONE:
+            shot['errors'].append({'attr': None, 'error': ledger.entries.get(e['scene'], {}).get('error')})
+        shots.append(shot)
+    return shots
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply reference edits to many scenes')
+    parser.add_argument('manifest', help='json or text file with the scenes to update')
+    parser.add_argument('--project', help='project directory if not set in the manifest')
+    parser.add_argument('--edits', nargs='+', default=[], help='edit files if not set in the manifest')
+    parser.add_argument('--namespace', help='namespace override for the --edits files')
+    parser.add_argument('--dry-run', action='store_true', help='report changes without saving')
+    parser.add_argument('--workers', type=int, default=mayapy_pool.default_workers())
+    parser.add_argument('--timeout', type=float, default=None, help='seconds per job')
+    parser.add_argument('--retries', type=int, default=0)
+    parser.add_argument('--mayapy', default=mayapy_pool.MAYAPY)
+    parser.add_argument('--ledger', help='job ledger, defaults to <manifest>.ledger.json')
+    parser.add_argument('--log-dir', help='job logs, defaults to <manifest>_logs')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s: %(message)s')
+
+    base = os.path.splitext(args.manifest)[0]
+    ledger_path = args.ledger or base + '.ledger.json'
+    log_dir = args.log_dir or base + '_logs'
+    report_dir = os.path.join(log_dir, 'reports')
+    if not os.path.exists(report_dir):
+        os.makedirs(report_dir)
+
+    edits = [{'file': os.path.abspath(f), 'namespace': args.namespace} for f in args.edits]
+    entries = read_manifest(args.manifest, project=args.project, edits=edits)
+    jobs = create_jobs(entries, report_dir, mayapy=args.mayapy, timeout=args.timeout,
+                       retries=args.retries, dry_run=args.dry_run)
+    logger.info('Applying edits to %d scenes with %d workers', len(jobs), args.workers)
+
+    # a dry run must not mark the shots as done for the real run
+    ledger = mayapy_pool.Ledger(None if args.dry_run else ledger_path)
+    summary = mayapy_pool.run_jobs(jobs, workers=args.workers, ledger=ledger, log_dir=log_dir)
+    summary['shots'] = collect_reports(entries, report_dir, ledger)
+
+    mayapy_pool.write_json(base + '.report.json', summary)
+    for shot in summary['shots']:
+        logger.info('%s: %s, %d changed, %d unchanged, %d missing, %d errors%s',
+                    shot['scene'], shot['state'], shot['changed'], shot['unchanged'],
+                    shot['missing'], len(shot['errors']), ', saved' if shot['saved'] else '')
+    logger.info('Summary:\n%s', mayapy_pool.format_summary(summary))
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
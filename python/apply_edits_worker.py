@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+"""
+Apply reference edit files to one scene and save it. Started by
+apply_edits_batch in its own mayapy process:
+
+    mayapy apply_edits_worker.py scene project report edits [dry_run]
+
+edits is a json list of {"file": edit file, "namespace": namespace or null}.
+The project may be an empty string. The result of every edit file is written
+to the report json file. The worker exits with 1 before opening the scene if
+an edit file does not exist, so the batch records the shot as failed.
+"""
+
+import os
+import sys
+import json
+import time
+
+import tbt_metrics
+
+scene, proj_dir, report_path, edits = sys.argv[1:5]
+dry_run = len(sys.argv) > 5 and sys.argv[5] == '1'
+edits = json.loads(edits)
+
+missing = [e['file'] for e in edits if not os.path.exists(e['file'])]
+if missing:
+    sys.stderr.write('Edit files do not exist: {}\n'.format(', '.join(missing)))
+    sys.exit(1)
+
+with tbt_metrics.span('maya_init'):
+    import maya.standalone
+    maya.standalone.initialize('Python')
+
+import maya.cmds as mc
+
+import ReferenceTools
+import mayapy_pool
+
+start = time.time()
+if proj_dir:
+    mc.workspace(proj_dir, openWorkspace=True)
+with tbt_metrics.span('scene_open', scene=scene):
+    mc.file(scene, open=True, force=True)
+
+results = []
+for e in edits:
+    results.append(ReferenceTools.apply_edits(
+        e['file'], namespace_override=e.get('namespace'), dry_run=dry_run))
+
+changed = sum(len(r['changed']) for r in results)
+saved = bool(changed) and not dry_run
+if saved:
+    with tbt_metrics.span('scene_save', scene=scene):
+        mc.file(save=True, force=True)
+
+mayapy_pool.write_json(report_path, {
+    'scene': scene,
+    'dry_run': dry_run,
+    'saved': saved,
+    'duration': time.time() - start,
+    'edits': results,
+})
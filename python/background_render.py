@@ -0,0 +1,247 @@
+"""
+Render frames in a separate process without blocking maya.
+
+The scene is exported to a temp file when a frame is submitted, so the
+render uses the scene as it was at that moment and the render globals of
+the artist's scene are never touched. The frames are rendered one after the
+other by the Render command line renderer. Its output is read in a
+background thread and progress, log lines and the end of every frame are
+passed to callbacks in maya's main thread.
+
+    import background_render
+    renderer = background_render.BackgroundRender(on_progress=print_progress)
+    renderer.submit(frame=101)
+    renderer.cancel()
+"""
+
+import os
+import re
+import time
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+from collections import deque
+
+logger = logging.getLogger('tbt_settings')
+
+# maya command line renderer, can be overridden with $MAYA_RENDER
+RENDER = os.environ.get(
+    'MAYA_RENDER', '/Applications/Autodesk/maya2016/Maya.app/Contents/bin/Render')
+
+PROGRESS_RE = re.compile(r'(\d+)\s*% done')
+
+# frame states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELED = 'canceled'
+
+
+def render_command(scene, frame, project=None, renderer='arnold', render=RENDER):
+    """Return the command line which renders one frame of a scene
+
+    Args:
+        scene (str): Scene file
+        frame (float): Frame to render
+        project (str): Project directory
+        renderer (str): Render -r flag
+        render (str): Render executable
+
+    Returns:
+        list: Command line
+    """
+    cmd = [render, '-r', renderer, '-s', str(frame), '-e', str(frame)]
+    if renderer == 'arnold':
+        # log level which prints the progress
+        cmd += ['-ai:lve', '2']
+    if project:
+        cmd += ['-proj', project]
+    return cmd + [scene]
+
+
+def snapshot_scene(folder):
+    """Export the current scene with its references to a file in folder. The
+    file keeps the name of the scene, which the <Scene> token of the image
+    prefix resolves to, so the images land next to the other renders of it
+
+    Returns:
+        str: Path of the exported scene
+    """
+    import pymel.core as pm
+
+    name = os.path.splitext(os.path.basename(pm.sceneName()))[0] or 'untitled'
+    scene = os.path.join(folder, name + '.mb')
+    pm.exportAll(scene, preserveReferences=True, force=True, type='mayaBinary')
+    return scene
+
+
+class RenderFrame(object):
+    """A frame submitted to the background renderer
+
+    Args:
+        frame (float): Frame number
+        scene (str): Snapshot of the scene
+        cmd (list): Command line of the render
+    """
+
+    def __init__(self, frame, scene, cmd):
+        self.frame = frame
+        self.scene = scene
+        self.cmd = cmd
+        self.state = QUEUED
+        self.progress = 0
+        self.returncode = None
+        self.start = None
+        self.duration = None
+        self.process = None
+
+    def __repr__(self):
+        return 'RenderFrame({}, {})'.format(self.frame, self.state)
+
+
+class BackgroundRender(object):
+    """Queue of frames rendered one after the other in a separate process
+
+    Args:
+        on_progress (callable): Called with frame and percent
+        on_log (callable): Called with frame and a line of the render log
+        on_done (callable): Called with the frame when it finished, failed or
+            was canceled
+        project (str): Project directory, defaults to the current workspace
+        render (str): Render executable
+        deferred (bool): Call the callbacks in maya's main thread
+    """
+
+    def __init__(self, on_progress=None, on_log=None, on_done=None, project=None,
+                 render=RENDER, deferred=True):
+        self.on_progress = on_progress
+        self.on_log = on_log
+        self.on_done = on_done
+        self.project = project
+        self.render = render
+        self.deferred = deferred
+
+        self.queue = deque()
+        self.current = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, frame=None, scene=None):
+        """Queue a frame of the current scene. Has to run in the main thread
+
+        Args:
+            frame (float): Frame to render, defaults to the current frame
+            scene (str): Scene to render instead of a snapshot of the current
+                scene
+
+        Returns:
+            RenderFrame: The queued frame
+        """
+        import pymel.core as pm
+
+        if frame is None:
+            frame = pm.currentTime()
+        if scene is None:
+            scene = snapshot_scene(tempfile.mkdtemp(prefix='tbt_render_'))
+        project = self.project or str(pm.workspace.getPath())
+        job = RenderFrame(frame, scene, render_command(scene, frame, project, render=self.render))
+
+        with self._lock:
+            self.queue.append(job)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._work)
+                self._thread.daemon = True
+                self._thread.start()
+        logger.info('Queued frame %s for background render', frame)
+        return job
+
+    def cancel(self, job=None):
+        """Cancel a queued or running frame
+
+        Args:
+            job (RenderFrame): Frame to cancel, None cancels all frames
+        """
+        with self._lock:
+            jobs = [job] if job else list(self.queue) + [self.current]
+            for j in jobs:
+                if j is None or j.state not in (QUEUED, RUNNING):
+                    continue
+                if j in self.queue:
+                    self.queue.remove(j)
+                    j.state = CANCELED
+                    self._cleanup(j)
+                    self._notify(self.on_done, j)
+                elif j.process is not None:
+                    j.state = CANCELED
+                    j.process.terminate()
+
+    def is_busy(self):
+        return self.current is not None or bool(self.queue)
+
+    def _work(self):
+        while True:
+            with self._lock:
+                if not self.queue:
+                    self._thread = None
+                    return
+                job = self.current = self.queue.popleft()
+                job.state = RUNNING
+                job.start = time.time()
+                try:
+                    job.process = subprocess.Popen(job.cmd, stdout=subprocess.PIPE,
+                                                   stderr=subprocess.STDOUT)
+                except OSError as e:
+                    job.process = None
+                    job.state = FAILED
+                    logger.error('Could not start %s: %s', job.cmd[0], e)
+            if job.process is not None:
+                self._read(job)
+            job.duration = time.time() - job.start
+            self._cleanup(job)
+            with self._lock:
+                self.current = None
+            logger.info('Frame %s %s after %.1fs', job.frame, job.state, job.duration)
+            self._notify(self.on_done, job)
+
+    def _read(self, job):
+        for line in iter(job.process.stdout.readline, b''):
+            line = line.decode('utf-8', 'replace').rstrip()
+            self._notify(self.on_log, job, line)
+            match = PROGRESS_RE.search(line)
+            if match:
+                job.progress = int(match.group(1))
+                self._notify(self.on_progress, job, job.progress)
+        job.returncode = job.process.wait()
+        job.process.stdout.close()
+        if job.state != CANCELED:
+            job.state = DONE if job.returncode == 0 else FAILED
+
+    def _cleanup(self, job):
+        # only remove snapshots written by submit
+        folder = os.path.dirname(job.scene)
+        if os.path.basename(folder).startswith('tbt_render_'):
+            if not any(j.scene == job.scene for j in self.queue):
+                shutil.rmtree(folder, ignore_errors=True)
+
+    def _notify(self, callback, *args):
+        if callback is None:
+            return
+        if self.deferred:
+            import maya.utils
+            maya.utils.executeDeferred(callback, *args)
+        else:
+            callback(*args)
+
+
+_renderer = None
+
+
+def get_renderer():
+    """Return the background renderer shared by all callers in this session"""
+    global _renderer
+    if _renderer is None:
+        _renderer = BackgroundRender()
+    return _renderer
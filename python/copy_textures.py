@@ -1,12 +1,467 @@
-import pymel.core as pm
-import shutil
+"""
+Collect the textures of all file nodes into the sourceimages directory of the
+project.
+
+Textures whose copy in sourceimages already has the same size and
+modification time are skipped, the rest is copied with a pool of threads.
+Missing textures are reported instead of stopping the collection. Collected
+files are recorded in a manifest in the target directory, so an interrupted
+collection can just be started again.
+
+Files with the same name but different content get the start of their
+content hash appended to the name, so they do not overwrite each other. This
+includes files already in the target directory which the manifest records
+for another source or which were put there by hand.
+
+Instead of copying, the textures can be hard linked or symlinked. With a
+content store the textures are put into a shared directory addressed by
+their content hash once, and every project only links to it:
+
+    <store>/3f/3f2a...e1.exr
+
+Run in maya:
+
+    import copy_textures
+    copy_textures.collect()
+    copy_textures.collect(mode='hardlink', store='/mnt/share/texture_store', relink_nodes=True)
+"""
+
 import os
+import sys
+import json
+import errno
+import shutil
+import hashlib
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+import tbt_metrics
+
+logger = logging.getLogger('copy_textures')
+
+WORKERS = 8
+COPY = 'copy'
+HARDLINK = 'hardlink'
+SYMLINK = 'symlink'
+MODES = (COPY, HARDLINK, SYMLINK)
+MANIFEST = '.collect_manifest.json'
+# files bigger than this are copied by the kernel if the os supports it
+LARGE_FILE = 8 * 1024 * 1024
+# write the manifest after this many copies
+SAVE_INTERVAL = 20
+
+
+def is_up_to_date(src, dst):
+    """Check if dst is a copy of src by comparing size and modification time"""
+    try:
+        s = os.stat(src)
+        d = os.stat(dst)
+    except OSError:
+        return False
+    return s.st_size == d.st_size and int(s.st_mtime) == int(d.st_mtime)
+
+
+def _kernel_copy(fsrc, fdst, size):
+    """Copy a file without moving the data through python. Raises OSError if
+    the os does not support it"""
+    infd, outfd = fsrc.fileno(), fdst.fileno()
+    if hasattr(os, 'copy_file_range'):
+        copy = os.copy_file_range
+    elif hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+        # sendfile takes the target first, None reads from the file position
+        def copy(infd, outfd, count):
+            return os.sendfile(outfd, infd, None, count)
+    else:
+        raise OSError(errno.ENOSYS, 'no kernel copy available')
+
+    copied = 0
+    while copied < size:
+        n = copy(infd, outfd, size - copied)
+        if n == 0:
+            break
+        copied += n
+    if copied != size:
+        raise OSError(errno.EIO, 'short copy')
+
+
+def copy_file(src, dst):
+    """Copy a file with its modification time. The data is written to a temp
+    file first, so dst is never a half copied texture
+
+    Args:
+        src (str): Source file
+        dst (str): Target file
+    """
+    # unique per thread, two threads may put the same content into a store
+    tmp = '{}.{}.part'.format(dst, threading.current_thread().ident)
+    size = os.path.getsize(src)
+    with open(src, 'rb') as fsrc:
+        with open(tmp, 'wb') as fdst:
+            try:
+                if size < LARGE_FILE:
+                    raise OSError(errno.ENOSYS, 'small file')
+                _kernel_copy(fsrc, fdst, size)
+            except OSError:
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+                shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+    shutil.copystat(src, tmp)
+    if os.name == 'nt' and os.path.exists(dst):
+        os.remove(dst)
+    os.rename(tmp, dst)
+
+
+def file_hash(path):
+    """Return the sha1 hex digest of a file's content"""
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(1024 * 1024)
+            if not block:
+                break
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def file_signature(path):
+    st = os.stat(path)
+    return [st.st_size, int(st.st_mtime)]
+
+
+class Manifest(object):
+    """Record of the collected files in a target directory. Also remembers
+    the content hash of every source, so unchanged files are not hashed again
+    """
+
+    def __init__(self, target_dir):
+        self.path = os.path.join(target_dir, MANIFEST)
+        self.files = {}
+        self._lock = threading.Lock()
+        self._changes = 0
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self.files = json.load(f)
+            except ValueError:
+                logger.warning('Ignoring broken manifest: %s', self.path)
+
+    def add(self, src, dst, digest=None):
+        with self._lock:
+            entry = self.files.get(src)
+            if not isinstance(entry, dict):
+                entry = self.files[src] = {}
+            entry['dst'] = dst
+            if digest:
+                entry['sha1'] = digest
+                entry['signature'] = file_signature(src)
+            self._changes += 1
+            if self._changes >= SAVE_INTERVAL:
+                self._save()
+
+    def owners(self):
+        """Return the target to source mapping of the collected files"""
+        owners = {}
+        for src, entry in self.files.items():
+            dst = entry.get('dst') if isinstance(entry, dict) else entry
+            if dst:
+                owners[os.path.normpath(dst)] = src
+        return owners
+
+    def digest(self, src):
+        """Return the content hash of a source file, from the manifest if the
+        file did not change"""
+        entry = self.files.get(src)
+        sig = file_signature(src)
+        if isinstance(entry, dict) and entry.get('signature') == sig and entry.get('sha1'):
+            return entry['sha1']
+        digest = file_hash(src)
+        with self._lock:
+            if not isinstance(entry, dict):
+                entry = self.files[src] = {}
+            entry['sha1'] = digest
+            entry['signature'] = sig
+        return digest
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(self.files, f, indent=2, sort_keys=True)
+        if os.name == 'nt' and os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(self.path + '.tmp', self.path)
+        self._changes = 0
+
+
+class ContentStore(object):
+    """Directory of files addressed by their content hash
+
+    Args:
+        root (str): Store directory
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, digest, ext):
+        return os.path.join(self.root, digest[:2], digest + ext.lower())
+
+    def add(self, src, digest):
+        """Put a file into the store if its content is not there yet
+
+        Returns:
+            str: Path of the file in the store
+        """
+        path = self.path(digest, os.path.splitext(src)[1])
+        if not os.path.exists(path):
+            folder = os.path.dirname(path)
+            if not os.path.exists(folder):
+                try:
+                    os.makedirs(folder)
+                except OSError:
+                    # created by another thread
+                    pass
+            copy_file(src, path)
+        return path
+
+
+def is_placed(origin, dst, mode):
+    """Check if dst is already the copy or link of origin"""
+    if mode == SYMLINK:
+        return os.path.islink(dst) and os.readlink(dst) == origin
+    if mode == HARDLINK:
+        try:
+            return os.path.samefile(origin, dst)
+        except OSError:
+            return False
+    return is_up_to_date(origin, dst)
+
+
+def place(origin, dst, mode):
+    """Copy or link origin to dst. Links fall back to a copy if the file
+    system does not support them
+
+    Args:
+        origin (str): File to copy or link to
+        dst (str): Target path
+        mode (str): copy, hardlink or symlink
+    """
+    if mode != COPY:
+        tmp = dst + '.part'
+        try:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+            if mode == HARDLINK:
+                os.link(origin, tmp)
+            else:
+                os.symlink(origin, tmp)
+        except (AttributeError, OSError) as e:
+            logger.warning('Could not %s %s, copying instead: %s', mode, origin, e)
+        else:
+            if os.name == 'nt' and os.path.lexists(dst):
+                os.remove(dst)
+            os.rename(tmp, dst)
+            return
+    copy_file(origin, dst)
+
+
+def is_free(src, dst, digest=file_hash, owners=None):
+    """Check if src can be collected to dst without overwriting a file of
+    another source. dst is free if it does not exist, was collected from src
+    before or has the same content
+
+    Args:
+        src (str): Source file
+        dst (str): Target path
+        digest (callable): Returns the content hash of a source file
+        owners (dict): Target to source mapping of Manifest.owners()
+
+    Returns:
+        bool: True if src can use dst
+    """
+    if not os.path.lexists(dst):
+        return True
+    owner = (owners or {}).get(os.path.normpath(dst))
+    if owner is not None:
+        return owner == src
+    if not os.path.isfile(src):
+        # reported as missing, nothing is written
+        return True
+    try:
+        return os.path.isfile(dst) and digest(src) == file_hash(dst)
+    except (IOError, OSError):
+        return False
+
+
+def plan(sources, target_dir, digest=file_hash, owners=None):
+    """Map every unique source file to its target path. Files which share
+    their name with a different file, of the sources or already in the
+    target directory, get a part of their content hash appended to the name
+
+    Args:
+        sources (list): Source file paths
+        target_dir (str): Directory to collect into
+        digest (callable): Returns the content hash of a file
+        owners (dict): Target to source mapping of Manifest.owners()
+
+    Returns:
+        dict: Source to target mapping
+    """
+    by_name = {}
+    for src in sources:
+        src = os.path.normpath(src)
+        names = by_name.setdefault(os.path.basename(src), [])
+        if src not in names:
+            names.append(src)
+
+    mapping = {}
+    for name, srcs in by_name.items():
+        dst = os.path.join(target_dir, name)
+        if len(srcs) == 1 and is_free(srcs[0], dst, digest=digest, owners=owners):
+            mapping[srcs[0]] = dst
+            continue
+        stem, ext = os.path.splitext(name)
+        for src in srcs:
+            if not os.path.isfile(src):
+                mapping[src] = os.path.join(target_dir, name)
+                continue
+            unique = '{}_{}{}'.format(stem, digest(src)[:8], ext)
+            mapping[src] = os.path.join(target_dir, unique)
+    return mapping
+
+
+def collect_files(sources, target_dir, workers=WORKERS, mode=COPY, store=None):
+    """Copy or link files into a directory, skipping the ones which are up
+    to date
+
+    Args:
+        sources (list): Source file paths, duplicates are ignored
+        target_dir (str): Directory to collect into
+        workers (int): Number of copy threads
+        mode (str): copy, hardlink or symlink
+        store (str): Content store directory. If set the files are put into
+            the store and the target directory gets copies or links of them
+
+    Returns:
+        dict: Report with copied, skipped, missing and failed lists and the
+            source to target mapping in targets
+    """
+    if mode not in MODES:
+        raise ValueError('Unknown mode {}, use one of {}'.format(mode, MODES))
+    if not os.path.exists(target_dir):
+        os.makedirs(target_dir)
+
+    manifest = Manifest(target_dir)
+    content_store = ContentStore(store) if store else None
+    mapping = plan(sources, target_dir, digest=manifest.digest, owners=manifest.owners())
+    report = {'copied': [], 'skipped': [], 'missing': [], 'failed': [], 'targets': mapping}
+
+    # sources with the same content share their target, collect it once
+    jobs = {}
+    for src, dst in mapping.items():
+        jobs.setdefault(dst, []).append(src)
+
+    def work(item):
+        dst, srcs = item
+        src = srcs[0]
+        if not os.path.isfile(src):
+            return 'missing', srcs
+        try:
+            digest = None
+            origin = os.path.abspath(src)
+            if content_store:
+                digest = manifest.digest(src)
+                origin = os.path.abspath(content_store.add(src, digest))
+            state = 'skipped'
+            if not is_placed(origin, dst, mode):
+                place(origin, dst, mode)
+                state = 'copied'
+        except (IOError, OSError) as e:
+            logger.error('Could not collect %s: %s', src, e)
+            return 'failed', srcs
+        for s in srcs:
+            manifest.add(s, dst, digest)
+        return state, srcs
+
+    pool = ThreadPool(max(1, min(workers, len(jobs) or 1)))
+    try:
+        for state, srcs in pool.imap_unordered(work, sorted(jobs.items())):
+            report[state].extend(srcs)
+    finally:
+        pool.close()
+        pool.join()
+        manifest.save()
+
+    for src in report['missing']:
+        logger.warning('Missing texture: %s', src)
+    logger.info('Collected textures: %d copied, %d up to date, %d missing, %d failed',
+                len(report['copied']), len(report['skipped']),
+                len(report['missing']), len(report['failed']))
+    return report
+
+
+def get_file_nodes():
+    """Return the file nodes of the scene with their texture paths
+
+    Returns:
+        list: List of (node, texture path) tuples
+    """
+    import pymel.core as pm
+    return [(f, f.fileTextureName.get()) for f in pm.ls(type='file')]
+
+
+def relink(nodes, targets):
+    """Point file nodes to their collected textures in one undo chunk
+
+    Args:
+        nodes (list): (node, texture path) tuples from get_file_nodes()
+        targets (dict): Source to target mapping of collect_files()
+
+    Returns:
+        int: Number of changed nodes
+    """
+    import pymel.core as pm
+
+    changed = 0
+    pm.undoInfo(openChunk=True, chunkName='relink_textures')
+    try:
+        for node, path in nodes:
+            new_path = targets.get(os.path.normpath(path))
+            if new_path and new_path != path:
+                node.fileTextureName.set(new_path)
+                changed += 1
+    finally:
+        pm.undoInfo(closeChunk=True)
+    logger.info('Relinked %d file nodes', changed)
+    return changed
+
+
+@tbt_metrics.timed('collect_textures')
+def collect(workers=WORKERS, mode=COPY, store=None, relink_nodes=False):
+    """Collect the textures of the scene into the sourceimages directory
+
+    Args:
+        workers (int): Number of copy threads
+        mode (str): copy, hardlink or symlink
+        store (str): Content store directory
+        relink_nodes (bool): Point the file nodes to the collected textures
+    """
+    import pymel.core as pm
+
+    w = pm.workspace
+    root = w.path
+    source_images = w.fileRules['sourceImages']
+    new_path = os.path.join(root, source_images)
 
-w=pm.workspace
-root = w.path
-source_images = w.fileRules['sourceImages']
-new_path = os.path.join(root, source_images)
-for f in pm.ls(type='file'):
-    to_copy = f.fileTextureName.get()
-    copy_path = os.path.join(new_path, os.path.basename(to_copy))
-    shutil.copy2(to_copy, copy_path)
+    nodes = get_file_nodes()
+    report = collect_files([p for _, p in nodes], new_path,
+                           workers=workers, mode=mode, store=store)
+    if relink_nodes:
+        collected = set(report['copied'] + report['skipped'])
+        targets = dict((k, v) for k, v in report['targets'].items() if k in collected)
+        relink(nodes, targets)
+    return report
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+"""
+Diff and merge reference edit files without maya.
+
+The first file is read into a key index of attribute name to value and type,
+the second file is streamed against it. Values are compared like
+ReferenceTools.apply_edits compares them, numbers with a small tolerance.
+Both the old *_edits.json and the current *_edits.jsonl.gz files are
+accepted.
+
+    python edit_diff.py diff old_edits.jsonl.gz new_edits.jsonl.gz
+    python edit_diff.py merge ours_edits.jsonl.gz theirs_edits.jsonl.gz \\
+        -o merged_edits.jsonl.gz --policy theirs
+"""
+
+import sys
+import json
+import logging
+import argparse
+
+import edit_files
+
+logger = logging.getLogger(__name__)
+
+# conflict policies of merge: keep our value, keep their value, leave the
+# attribute out of the merged file or raise a MergeConflict
+OURS = 'ours'
+THEIRS = 'theirs'
+SKIP = 'skip'
+FAIL = 'fail'
+POLICIES = (OURS, THEIRS, SKIP, FAIL)
+
+
+class MergeConflict(Exception):
+    pass
+
+
+def index_edits(path):
+    """
+    Read an edit file into a key index
+    :param path: edit file
+    :return: dict of attr name to {'value', 'type'}
+    """
+    return dict(edit_files.iter_edits(path))
+
+
+def same_edit(a, b):
+    """
+    Check if two edits set the same value
+    :param a: {'value', 'type'} dict
+    :param b: {'value', 'type'} dict
+    :return:
+    """
+    return a['type'] == b['type'] and edit_files.values_equal(
+        edit_files.normalize_value(a['value']), edit_files.normalize_value(b['value']))
+
+
+def diff(path_a, path_b, values=False):
+    """
+    Compare two edit files
+    :param path_a: old edit file
+    :param path_b: new edit file
+    :param values: also return the old and new value of changed attributes
+    :return: dict with sorted added, removed and changed lists and the
+        number of unchanged attributes
+    """
+    index = index_edits(path_a)
+    result = {'added': [], 'removed': [], 'changed': [], 'unchanged': 0}
+    for k, edit in edit_files.iter_edits(path_b):
+        old = index.pop(k, None)
+        if old is None:
+            result['added'].append(k)
+        elif same_edit(old, edit):
+            result['unchanged'] += 1
+        elif values:
+            result['changed'].append((k, old, edit))
+        else:
+            result['changed'].append(k)
+    # whatever is left in the index is not in the new file
+    result['removed'] = list(index)
+    for key in ('added', 'removed', 'changed'):
+        result[key].sort()
+    return result
+
+
+def merge(path_a, path_b, output, policy=THEIRS, compress=True):
+    """
+    Merge two edit files into a new one
+    :param path_a: our edit file
+    :param path_b: their edit file
+    :param output: merged edit file
+    :param policy: what to do with attributes both files set to different
+        values, one of POLICIES
+    :param compress: gzip the merged file
+    :return: dict with the number of written edits and a sorted list of conflicts
+    """
+    if policy not in POLICIES:
+        raise ValueError('Unknown conflict policy: {}'.format(policy))
+
+    merged = index_edits(path_a)
+    conflicts = []
+    for k, edit in edit_files.iter_edits(path_b):
+        ours = merged.get(k)
+        if ours is None or same_edit(ours, edit):
+            merged[k] = edit
+            continue
+        conflicts.append(k)
+        if policy == FAIL:
+            raise MergeConflict('{} is set to {!r} and {!r}'.format(k, ours['value'], edit['value']))
+        elif policy == THEIRS:
+            merged[k] = edit
+        elif policy == SKIP:
+            del merged[k]
+
+    count = edit_files.write_edits(output, merged, compress=compress)
+    conflicts.sort()
+    logger.info('Merged %d edits, %d conflicts resolved with %s', count, len(conflicts), policy)
+    return {'count': count, 'conflicts': conflicts}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Diff and merge reference edit files')
+    sub = parser.add_subparsers(dest='command')
+    p = sub.add_parser('diff', help='list added, removed and changed attributes')
+    p.add_argument('old')
+    p.add_argument('new')
+    p.add_argument('--json', help='write the result to this json file')
+    p = sub.add_parser('merge', help='merge two edit files')
+    p.add_argument('ours')
+    p.add_argument('theirs')
+    p.add_argument('-o', '--output', required=True)
+    p.add_argument('--policy', default=THEIRS, choices=POLICIES)
+    p.add_argument('--no-compress', action='store_true')
+    args = parser.parse_args(argv)
+    if not args.command:
+        parser.error('a command is required')
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    if args.command == 'diff':
+        result = diff(args.old, args.new)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(result, f, indent=2)
+        for key, sign in (('added', '+'), ('removed', '-'), ('changed', '~')):
+            for k in result[key]:
+                logger.info('%s %s', sign, k)
+        logger.info('%d added, %d removed, %d changed, %d unchanged', len(result['added']),
+                    len(result['removed']), len(result['changed']), result['unchanged'])
+        return 1 if result['added'] or result['removed'] or result['changed'] else 0
+
+    try:
+        merge(args.ours, args.theirs, args.output, policy=args.policy,
+              compress=not args.no_compress)
+    except MergeConflict as e:
+        logger.error('Conflict: %s', e)
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Read and write reference edit files.
+
+Edit files map full attribute names to their value and type:
+
+    {"ns:node.translate": {"value": [[0, 1, 2]], "type": "double3"}, ...}
+
+The first version was a single json document (*_edits.json) which had to be
+loaded completely. The current version is newline delimited json, gzip
+compressed (*_edits.jsonl.gz). The first line is a header, every following
+line is one edit:
+
+    {"format": "tbt_edits", "version": 2, "count": 2,
+     "nodes": [["ns", "ns:node", 2]]}
+    {"attr": "ns:node.translate", "value": [[0, 1, 2]], "type": "double3"}
+    {"attr": "ns:node.visibility", "value": true, "type": "bool"}
+
+The "nodes" index of the header lists namespace, node and number of edits
+for every block of consecutive edits in the file. A reader which only needs
+some namespaces can skip the lines of the others without parsing them.
+
+Readers accept both versions, so old edit files keep working. Nothing in
+here needs maya.
+"""
+
+import os
+import gzip
+import itertools
+import json
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 'tbt_edits'
+VERSION = 2
+EXTENSION = '_edits.jsonl.gz'
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def split_key(key):
+    """
+    Return namespace and node of an edit key
+    :param key: attribute name like |ns:grp|ns:node.attr
+    :return: tuple of namespace and node
+    """
+    node = key.partition('.')[0]
+    namespace = node.split('|')[-1].rpartition(':')[0]
+    return namespace, node
+
+
+def normalize_value(value):
+    """Flatten compound values, getAttr returns [(x, y, z)] and json [[x, y, z]]"""
+    if isinstance(value, (list, tuple)):
+        if value and isinstance(value[0], (list, tuple)):
+            value = list(itertools.chain.from_iterable(value))
+        return list(value)
+    return value
+
+
+def values_equal(a, b, tolerance=1e-6):
+    """Compare two normalized values, numbers with a tolerance"""
+    if isinstance(a, list) or isinstance(b, list):
+        if not (isinstance(a, list) and isinstance(b, list)) or len(a) != len(b):
+            return False
+        return all(values_equal(x, y, tolerance) for x, y in zip(a, b))
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return abs(a - b) <= tolerance
+    return a == b
+
+
+def _open(path, mode):
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == GZIP_MAGIC
+    if compressed:
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def _decode(line):
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    return json.loads(line)
+
+
+def _parse_header(line):
+    try:
+        header = _decode(line)
+    except ValueError:
+        return None, None
+    if isinstance(header, dict) and header.get('format') == FORMAT:
+        return header, None
+    # an old single line json file
+    return None, header
+
+
+def read_header(path):
+    """
+    Return the header of an edit file or None for the old json format
+    :param path: edit file
+    :return:
+    """
+    with _open(path, 'rb') as f:
+        return _parse_header(f.readline())[0]
+
+
+def iter_edits(path, namespaces=None):
+    """
+    Iterate over the edits of a file without loading all of it
+    :param path: edit file in the old or the current format
+    :param namespaces: only return edits of these namespaces
+    :return: generator of (attr name, {'value': value, 'type': type})
+    """
+    with _open(path, 'rb') as f:
+        header, data = _parse_header(f.readline())
+        if header is None:
+            # old format: one json document, written on one line by export
+            if data is None or f.readline():
+                f.seek(0)
+                data = _decode(f.read())
+            for k, v in data.items():
+                if namespaces is None or split_key(k)[0] in namespaces:
+                    yield k, v
+            return
+
+        for namespace, node, count in header.get('nodes', []):
+            if namespaces is not None and namespace not in namespaces:
+                for _ in range(count):
+                    f.readline()
+                continue
+            for _ in range(count):
+                record = _decode(f.readline())
+                yield record['attr'], {'value': record['value'], 'type': record['type']}
+
+
+def load_edits(path):
+    """
+    Return all edits of a file as dict
+    :param path: edit file
+    :return:
+    """
+    return dict(iter_edits(path))
+
+
+def write_edits(path, edits, compress=True):
+    """
+    Write edits in the current format. The edits are streamed to a temp file
+    while the header index is built, so they never need to be in memory at
+    once. The file is written next to path and renamed when complete, so a
+    crash never leaves a cut off edit file
+    :param path: output file
+    :param edits: dict or iterable of (attr name, {'value', 'type'}) tuples.
+        A dict is written sorted by attribute name
+    :param compress: gzip the file
+    :return: number of written edits
+    """
+    if isinstance(edits, dict):
+        edits = sorted(edits.items())
+
+    blocks = []
+    count = 0
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as body:
+            for k, v in edits:
+                namespace, node = split_key(k)
+                if blocks and blocks[-1][:2] == [namespace, node]:
+                    blocks[-1][2] += 1
+                else:
+                    blocks.append([namespace, node, 1])
+                record = {'attr': k, 'value': v['value'], 'type': v['type']}
+                body.write(json.dumps(record).encode('utf-8') + b'\n')
+                count += 1
+
+        header = {'format': FORMAT, 'version': VERSION, 'count': count, 'nodes': blocks}
+        opener = gzip.open if compress else open
+        part = path + '.tmp'
+        try:
+            with opener(part, 'wb') as out:
+                out.write(json.dumps(header).encode('utf-8') + b'\n')
+                with open(tmp, 'rb') as body:
+                    while True:
+                        chunk = body.read(1024 * 1024)
+                        if not chunk:
+                            break
+                        out.write(chunk)
+            if os.name == 'nt' and os.path.exists(path):
+                os.remove(path)
+            os.rename(part, path)
+        except Exception:
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+    finally:
+        os.remove(tmp)
+
+    logger.info('Wrote %d edits: %s', count, path)
+    return count
@@ -4,14 +4,21 @@ import sys
 import os
 
 import tbt_utils
+import tbt_metrics
 
-import maya.standalone
-maya.standalone.initialize('Python')
+with tbt_metrics.span('maya_init'):
+    import maya.standalone
+    maya.standalone.initialize('Python')
 
 scene = sys.argv[1]
 proj_dir = sys.argv[2]
+# optional rig type, used by the alembic_batch driver
+rig_type = sys.argv[3] if len(sys.argv) > 3 else tbt_utils.head
+# optional number of parallel chunks, 0 sizes them from the last export
+chunks = int(sys.argv[4]) if len(sys.argv) > 4 else None
 
 if os.path.exists(scene):
-    tbt_utils.write_alembic(scene, proj_dir)
+    tbt_utils.write_alembic(scene, proj_dir, rig_type=rig_type, chunks=chunks)
 else:
-    print 'File {} does not exist'.format(scene)
\ No newline at end of file
+    print 'File {} does not exist'.format(scene)
+    sys.exit(1)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+"""
+Export one chunk of a sharded alembic bake. Started by alembic_shards in its
+own mayapy process:
+
+    mayapy export_alembic_chunk.py scene project start stop node output
+
+The time needed to load the scene and to bake the frames is written to
+<output>.json for the adaptive chunk sizing.
+"""
+
+import sys
+import json
+import time
+
+import tbt_utils
+import tbt_metrics
+
+with tbt_metrics.span('maya_init'):
+    import maya.standalone
+    maya.standalone.initialize('Python')
+
+import pymel.core as pm
+
+scene, proj_dir, start, stop, node, output = sys.argv[1:7]
+
+t0 = time.time()
+tbt_utils.init_alembic_session(proj_dir)
+with tbt_metrics.span('scene_open', scene=scene):
+    pm.openFile(scene, open=True, force=True)
+t1 = time.time()
+tbt_utils.export_alembic_bake(int(start), int(stop), node, path=output)
+t2 = time.time()
+
+with open(output + '.json', 'w') as f:
+    json.dump({'load_seconds': t1 - t0, 'export_seconds': t2 - t1}, f)
@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+
+"""
+Write small PNG proxies and contact sheets of rendered EXR sequences.
+
+Every frame is decoded into a numpy array, downscaled with a box filter,
+tone mapped and written as PNG into a proxy directory next to the
+sequence. Frames are processed in a pool of processes and frames whose
+proxy is newer than the exr are skipped. Every shot directory also gets a
+contact sheet with one row per layer.
+
+Scan line files with the compressions our driver writes are decoded: none,
+ZIPS and ZIP with half, float or uint channels. numpy is needed, which maya
+2016 does not ship, so run it with a system python:
+
+    python exr_proxy.py /path/to/project/images/TB_01130 --width 512 --workers 8
+"""
+
+import os
+import sys
+import zlib
+import struct
+import logging
+import argparse
+import multiprocessing
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import exr_scan
+
+logger = logging.getLogger('exr_proxy')
+
+PROXY_DIR = 'proxy'
+PROXY_WIDTH = 512
+SHEET_WIDTH = 256
+SHEET_COLUMNS = 8
+DTYPES = {'half': '<f2', 'float': '<f4', 'uint': '<u4'}
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError('exr_proxy needs numpy')
+
+
+def _unzip(data, size):
+    """Undo the zlib compression, predictor and byte interleaving of ZIP
+    and ZIPS chunks"""
+    raw = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+    if raw.size != size:
+        raise exr_scan.ExrError('chunk decompressed to {} instead of {} bytes'.format(raw.size, size))
+    # predictor: every byte is stored as difference to the previous one
+    t = raw.astype(np.int64)
+    t[1:] -= 128
+    t = (np.cumsum(t) & 0xff).astype(np.uint8)
+    # the first half holds the even bytes, the second half the odd ones
+    out = np.empty(size, dtype=np.uint8)
+    half = (size + 1) // 2
+    out[0::2] = t[:half]
+    out[1::2] = t[half:]
+    return out
+
+
+def read_image(path, channels=('R', 'G', 'B')):
+    """Decode channels of a scan line EXR file
+
+    Args:
+        path (str): EXR file
+        channels (tuple): Channel names to return
+
+    Returns:
+        numpy.ndarray: float32 array of shape (height, width, len(channels)),
+            channels the file does not have are 0
+    """
+    _require_numpy()
+    with open(path, 'rb') as f:
+        multi_part, tiled, headers = exr_scan.parse_headers(f)
+        header = headers[0]
+        if multi_part or tiled:
+            raise exr_scan.ExrError('only single part scan line files are supported')
+        compression = header.get('compression')
+        if compression not in ('none', 'zips', 'zip'):
+            raise exr_scan.ExrError('{} compression is not supported'.format(compression))
+
+        x_min, y_min, x_max, y_max = header['dataWindow']
+        width, height = x_max - x_min + 1, y_max - y_min + 1
+        count = exr_scan.chunk_count(header, False)
+        table = f.read(8 * count)
+        if len(table) != 8 * count:
+            raise exr_scan.ExrError('offset table is truncated')
+        offsets = np.frombuffer(table, dtype='<u8')
+        data = f.read()
+        base = f.tell() - len(data)
+
+    file_channels = header['channels']
+    sizes = [np.dtype(DTYPES[t]).itemsize for _, t in file_channels]
+    line_size = width * sum(sizes)
+    lines_per_chunk = exr_scan.LINES_PER_CHUNK[compression]
+
+    lines = np.empty((height, line_size), dtype=np.uint8)
+    for offset in offsets:
+        # zeroed offsets and offsets of a cut off file point outside the chunks
+        pos = int(offset) - base
+        if offset == 0 or pos < 0 or pos + 8 > len(data):
+            raise exr_scan.ExrError('chunk offset {} is out of range'.format(int(offset)))
+        y, size = struct.unpack('<ii', data[pos:pos + 8])
+        row = y - y_min
+        if size < 0 or pos + 8 + size > len(data):
+            raise exr_scan.ExrError('chunk of line {} is truncated'.format(y))
+        if row < 0 or row >= height:
+            raise exr_scan.ExrError('chunk line {} is outside of the data window'.format(y))
+        rows = min(lines_per_chunk, height - row)
+        chunk = data[pos + 8:pos + 8 + size]
+        expected = rows * line_size
+        if size < expected:
+            buf = _unzip(chunk, expected)
+        else:
+            buf = np.frombuffer(chunk, dtype=np.uint8)
+        lines[row:row + rows] = buf.reshape(rows, line_size)
+
+    image = np.zeros((height, width, len(channels)), dtype=np.float32)
+    start = 0
+    for (name, pixel_type), item_size in zip(file_channels, sizes):
+        end = start + width * item_size
+        if name in channels:
+            values = lines[:, start:end].copy().view(DTYPES[pixel_type])
+            image[:, :, channels.index(name)] = values
+        start = end
+    return image
+
+
+def downscale(image, width):
+    """Shrink an image to about width pixels with a box filter
+
+    Args:
+        image (numpy.ndarray): Array of shape (height, width, channels)
+        width (int): Target width
+
+    Returns:
+        numpy.ndarray: Downscaled image
+    """
+    factor = max(1, int(np.ceil(image.shape[1] / float(width))))
+    if factor == 1:
+        return image
+    h = image.shape[0] // factor * factor
+    w = image.shape[1] // factor * factor
+    image = image[:h, :w]
+    return image.reshape(h // factor, factor, w // factor, factor, -1).mean(axis=(1, 3))
+
+
+def tone_map(image, exposure=0.0, white=4.0):
+    """Map linear values to 8 bit sRGB with an extended Reinhard curve
+
+    Args:
+        image (numpy.ndarray): Linear float image
+        exposure (float): Exposure in stops
+        white (float): Linear value which maps to white
+
+    Returns:
+        numpy.ndarray: uint8 image
+    """
+    x = np.nan_to_num(np.maximum(image * 2.0 ** exposure, 0.0))
+    x = x * (1.0 + x / (white * white)) / (1.0 + x)
+    x = np.clip(x, 0.0, 1.0)
+    srgb = np.where(x <= 0.0031308, x * 12.92, 1.055 * np.power(x, 1 / 2.4) - 0.055)
+    return (srgb * 255.0 + 0.5).astype(np.uint8)
+
+
+def write_png(path, image):
+    """Write an 8 bit RGB image as PNG
+
+    Args:
+        path (str): Output file
+        image (numpy.ndarray): uint8 array of shape (height, width, 3)
+    """
+    height, width = image.shape[:2]
+    # filter type 0 in front of every row
+    rows = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    rows[:, 1:] = image.reshape(height, width * 3)
+
+    def chunk(tag, data):
+        return (struct.pack('>I', len(data)) + tag + data +
+                struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>2I5B', width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)))
+        f.write(chunk(b'IEND', b''))
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp, path)
+
+
+def read_png(path):
+    """Read a PNG written by write_png"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    pos = 8
+    idat = []
+    while pos < len(data):
+        size, = struct.unpack('>I', data[pos:pos + 4])
+        tag = data[pos + 4:pos + 8]
+        if tag == b'IHDR':
+            width, height = struct.unpack('>2I', data[pos + 8:pos + 16])
+        elif tag == b'IDAT':
+            idat.append(data[pos + 8:pos + 8 + size])
+        pos += size + 12
+    rows = np.frombuffer(zlib.decompress(b''.join(idat)), dtype=np.uint8)
+    return rows.reshape(height, width * 3 + 1)[:, 1:].reshape(height, width, 3)
+
+
+def proxy_path(path):
+    folder, name = os.path.split(path)
+    return os.path.join(folder, PROXY_DIR, os.path.splitext(name)[0] + '.png')
+
+
+def is_up_to_date(path):
+    """Check if the proxy of an exr is newer than the exr"""
+    proxy = proxy_path(path)
+    return os.path.exists(proxy) and os.path.getmtime(proxy) >= os.path.getmtime(path)
+
+
+def make_proxy(args):
+    """Write the proxy of one exr, runs in the worker processes
+
+    Args:
+        args (tuple): exr path, width and exposure
+
+    Returns:
+        tuple: exr path and error message or None
+    """
+    path, width, exposure = args
+    try:
+        image = tone_map(downscale(read_image(path), width), exposure=exposure)
+        proxy = proxy_path(path)
+        if not os.path.exists(os.path.dirname(proxy)):
+            try:
+                os.makedirs(os.path.dirname(proxy))
+            except OSError:
+                # created by another worker
+                pass
+        write_png(proxy, image)
+    except (exr_scan.ExrError, IOError, OSError, ValueError, KeyError,
+            struct.error, zlib.error) as e:
+        return path, str(e)
+    return path, None
+
+
+def contact_sheet(folder, sequences, width=SHEET_WIDTH, columns=SHEET_COLUMNS):
+    """Write a contact sheet of the sequences of a shot directory, one row
+    per layer with frames evenly spread over the sequence
+
+    Args:
+        folder (str): Shot directory
+        sequences (dict): Sequence name to {frame: exr path}
+        width (int): Width of a thumbnail
+        columns (int): Frames per row
+
+    Returns:
+        str: Path of the contact sheet or None if there are no proxies
+    """
+    rows = []
+    for name in sorted(sequences):
+        frames = sorted(sequences[name])
+        step = max(1, len(frames) // columns)
+        thumbs = []
+        for frame in frames[::step][:columns]:
+            proxy = proxy_path(sequences[name][frame])
+            if os.path.exists(proxy):
+                thumb = read_png(proxy).astype(np.float32)
+                thumbs.append(downscale(thumb, width).astype(np.uint8))
+        if thumbs:
+            rows.append(thumbs)
+    if not rows:
+        return None
+
+    cell_h = max(t.shape[0] for row in rows for t in row)
+    cell_w = max(t.shape[1] for row in rows for t in row)
+    sheet = np.zeros((cell_h * len(rows), cell_w * columns, 3), dtype=np.uint8)
+    for r, row in enumerate(rows):
+        for c, thumb in enumerate(row):
+            h, w = thumb.shape[:2]
+            sheet[r * cell_h:r * cell_h + h, c * cell_w:c * cell_w + w] = thumb
+
+    path = os.path.join(folder, PROXY_DIR, os.path.basename(folder.rstrip(os.sep)) + '_contact.png')
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    write_png(path, sheet)
+    return path
+
+
+def make_proxies(root, width=PROXY_WIDTH, exposure=0.0, workers=None, sheets=True, force=False):
+    """Write the proxies of all exr sequences below a directory
+
+    Args:
+        root (str): Render output directory
+        width (int): Proxy width
+        exposure (float): Exposure in stops
+        workers (int): Number of processes
+        sheets (bool): Write a contact sheet per shot directory
+        force (bool): Write proxies even if they are up to date
+
+    Returns:
+        dict: Report with written, skipped, failed ({path: error}) and sheets
+    """
+    _require_numpy()
+    sequences = exr_scan.find_sequences(root)
+    paths = sorted(p for frames in sequences.values() for p in frames.values())
+    todo = [p for p in paths if force or not is_up_to_date(p)]
+    report = {'written': [], 'skipped': len(paths) - len(todo), 'failed': {}, 'sheets': []}
+
+    if todo:
+        pool = multiprocessing.Pool(workers or multiprocessing.cpu_count())
+        try:
+            for path, error in pool.imap_unordered(make_proxy, [(p, width, exposure) for p in todo]):
+                if error:
+                    report['failed'][path] = error
+                    logger.error('%s: %s', path, error)
+                else:
+                    report['written'].append(path)
+        finally:
+            pool.close()
+            pool.join()
+
+    if sheets and (todo or force):
+        shots = {}
+        for (folder, name), frames in sequences.items():
+            shots.setdefault(folder, {})[name] = frames
+        for folder in sorted(shots):
+            sheet = contact_sheet(folder, shots[folder])
+            if sheet:
+                report['sheets'].append(sheet)
+    logger.info('%d proxies written, %d up to date, %d failed, %d contact sheets',
+                len(report['written']), report['skipped'], len(report['failed']),
+                len(report['sheets']))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write proxies of rendered exr sequences')
+    parser.add_argument('directory')
+    parser.add_argument('--width', type=int, default=PROXY_WIDTH)
+    parser.add_argument('--exposure', type=float, default=0.0)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--no-sheets', action='store_true')
+    parser.add_argument('--force', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    report = make_proxies(args.directory, width=args.width, exposure=args.exposure,
+                          workers=args.workers, sheets=not args.no_sheets, force=args.force)
+    return 1 if report['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
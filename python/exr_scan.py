@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+
+"""
+Check rendered EXR sequences without decoding any pixels.
+
+Only the header and the chunk offset table of every file are read. A frame
+is flagged if it is missing from the sequence, empty, not an EXR, has an
+offset table which is incomplete or points past the end of the file, or
+has a resolution different from the render preset. An offset table of zeros
+is what OpenEXR leaves behind when a render was killed while writing.
+
+The output of setup_project is <images>/<Scene>/<name>_<RenderLayer>.####.exr,
+every layer is a sequence and the sequences are checked in parallel. Results
+are cached per file by modification time and size in
+~/.tbt_maya/exr_scan.json, so scanning a sequence again only reads the
+frames which changed.
+
+    python exr_scan.py /path/to/project/images/TB_01130 --preset final --range 101 180
+"""
+
+import os
+import re
+import sys
+import json
+import struct
+import logging
+import argparse
+import threading
+from multiprocessing.pool import ThreadPool
+
+import mayapy_pool
+
+logger = logging.getLogger('exr_scan')
+
+CACHE_FILE = os.path.join(os.path.expanduser('~'), '.tbt_maya', 'exr_scan.json')
+FRAME_RE = re.compile(r'^(?P<name>.+?)[._](?P<frame>-?\d+)\.exr$', re.IGNORECASE)
+
+MAGIC = 20000630
+TILED = 0x200
+LONG_NAMES = 0x400
+DEEP = 0x800
+MULTI_PART = 0x1000
+
+COMPRESSION = ['none', 'rle', 'zips', 'zip', 'piz', 'pxr24', 'b44', 'b44a', 'dwaa', 'dwab']
+# scan lines per chunk of the compression methods
+LINES_PER_CHUNK = {'none': 1, 'rle': 1, 'zips': 1, 'zip': 16, 'piz': 32, 'pxr24': 16,
+                   'b44': 32, 'b44a': 32, 'dwaa': 32, 'dwab': 256}
+PIXEL_TYPES = ['uint', 'half', 'float']
+
+
+class ExrError(Exception):
+    pass
+
+
+def _read(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ExrError('file ends in the header')
+    return data
+
+
+def _read_string(f, limit=256):
+    chars = []
+    while True:
+        c = _read(f, 1)
+        if c == b'\0':
+            return b''.join(chars).decode('latin-1')
+        chars.append(c)
+        if len(chars) > limit:
+            raise ExrError('attribute name too long')
+
+
+def _parse_channels(data):
+    channels = []
+    pos = 0
+    while data[pos:pos + 1] not in (b'\0', b''):
+        end = data.index(b'\0', pos)
+        name = data[pos:end].decode('latin-1')
+        pixel_type, = struct.unpack('<i', data[end + 1:end + 5])
+        channels.append((name, PIXEL_TYPES[pixel_type] if 0 <= pixel_type < 3 else pixel_type))
+        pos = end + 17
+    return channels
+
+
+def _read_part_header(f):
+    """Read the attributes of one header, None for the empty header which
+    ends the headers of a multi part file"""
+    header = {}
+    while True:
+        name = _read_string(f)
+        if not name:
+            return header or None
+        attr_type = _read_string(f)
+        size, = struct.unpack('<i', _read(f, 4))
+        if size < 0:
+            raise ExrError('broken attribute {}'.format(name))
+        data = _read(f, size)
+        if attr_type == 'chlist':
+            header[name] = _parse_channels(data)
+        elif attr_type == 'box2i':
+            header[name] = list(struct.unpack('<4i', data))
+        elif attr_type == 'compression':
+            index = ord(data[:1])
+            header[name] = COMPRESSION[index] if index < len(COMPRESSION) else index
+        elif attr_type == 'int':
+            header[name], = struct.unpack('<i', data)
+        elif attr_type == 'tiledesc':
+            x_size, y_size = struct.unpack('<2I', data[:8])
+            header[name] = [x_size, y_size, ord(data[8:9]) & 0xf]
+        elif attr_type == 'string':
+            header[name] = data.decode('latin-1')
+
+
+def parse_headers(f):
+    """Read the headers of an EXR file, the file is left at the offset table
+
+    Args:
+        f (file): EXR file opened in binary mode
+
+    Returns:
+        tuple: multi part flag, tiled flag and list of header dicts
+    """
+    try:
+        magic, version = struct.unpack('<2i', _read(f, 8))
+        if magic != MAGIC:
+            raise ExrError('not an exr file')
+        flags = version & ~0xff
+        if flags & DEEP:
+            raise ExrError('deep images are not checked')
+        multi_part = bool(flags & MULTI_PART)
+        tiled = bool(flags & TILED)
+
+        headers = []
+        while True:
+            header = _read_part_header(f)
+            if header is None:
+                break
+            headers.append(header)
+            if not multi_part:
+                break
+    except (struct.error, IndexError, ValueError) as e:
+        raise ExrError('broken header: {}'.format(e))
+    return multi_part, tiled, headers
+
+
+def chunk_count(part, tiled):
+    """Number of entries in the offset table of a part"""
+    if 'chunkCount' in part:
+        return part['chunkCount']
+    x_min, y_min, x_max, y_max = part['dataWindow']
+    height = y_max - y_min + 1
+    if tiled:
+        x_size, y_size, mode = part['tiles']
+        if mode != 0:
+            # mip and rip maps, the table size depends on the level rounding
+            return None
+        width = x_max - x_min + 1
+        return -(-width // x_size) * -(-height // y_size)
+    lines = LINES_PER_CHUNK.get(part.get('compression'))
+    if not lines:
+        return None
+    return -(-height // lines)
+
+
+def read_header(path):
+    """Read the headers and check the offset tables of an EXR file
+
+    Args:
+        path (str): EXR file
+
+    Returns:
+        dict: size, parts (list of dicts with channels, data_window,
+            display_window, compression and chunks) and problems
+    """
+    size = os.path.getsize(path)
+    info = {'size': size, 'parts': [], 'problems': []}
+    if size == 0:
+        info['problems'].append('empty file')
+        return info
+
+    with open(path, 'rb') as f:
+        try:
+            multi_part, tiled, headers = parse_headers(f)
+        except ExrError as e:
+            info['problems'].append(str(e))
+            return info
+
+        for header in headers:
+            part_tiled = tiled or header.get('type') == 'tiledimage'
+            info['parts'].append({
+                'channels': header.get('channels', []),
+                'data_window': header.get('dataWindow'),
+                'display_window': header.get('displayWindow'),
+                'compression': header.get('compression'),
+                'chunks': chunk_count(header, part_tiled),
+                'tiled': part_tiled,
+            })
+
+        # offset tables of all parts follow the headers
+        chunks = [p['chunks'] for p in info['parts']]
+        if None in chunks:
+            return info
+        table = f.read(8 * sum(chunks))
+        if len(table) != 8 * sum(chunks):
+            info['problems'].append('truncated offset table')
+            return info
+        offsets = struct.unpack('<{}Q'.format(sum(chunks)), table)
+        data_start = f.tell()
+        if not all(data_start <= o < size for o in offsets):
+            zeros = sum(1 for o in offsets if o == 0)
+            if zeros:
+                info['problems'].append('incomplete, {} of {} chunks not written'.format(zeros, len(offsets)))
+            else:
+                info['problems'].append('truncated, offsets point past the end of the file')
+            return info
+
+        # the chunk written last has to end within the file
+        last = max(offsets)
+        f.seek(last)
+        header_size = (4 if multi_part else 0) + (16 if tiled else 4)
+        chunk_header = f.read(header_size + 4)
+        if len(chunk_header) != header_size + 4:
+            info['problems'].append('truncated last chunk')
+        else:
+            data_size, = struct.unpack('<i', chunk_header[-4:])
+            if last + header_size + 4 + data_size > size:
+                info['problems'].append('truncated last chunk')
+    return info
+
+
+def resolution(info):
+    """Return width and height of the display window of the first part"""
+    if not info['parts'] or not info['parts'][0]['display_window']:
+        return None
+    x_min, y_min, x_max, y_max = info['parts'][0]['display_window']
+    return x_max - x_min + 1, y_max - y_min + 1
+
+
+class ScanCache(object):
+    """Header infos of files, valid as long as mtime and size do not change
+
+    Args:
+        cache_file (str): Json file to persist the cache in, None keeps it
+            only in memory
+    """
+
+    def __init__(self, cache_file=CACHE_FILE):
+        self.cache_file = cache_file
+        self.files = {}
+        self._lock = threading.Lock()
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'r') as f:
+                    self.files = json.load(f)
+            except ValueError:
+                logger.warning('Ignoring broken exr scan cache: %s', cache_file)
+
+    def info(self, path):
+        """Return the header info of a file, read only if the file changed"""
+        st = os.stat(path)
+        entry = self.files.get(path)
+        if entry and entry['mtime'] == st.st_mtime and entry['size'] == st.st_size:
+            return entry['info']
+        info = read_header(path)
+        with self._lock:
+            self.files[path] = {'mtime': st.st_mtime, 'size': st.st_size, 'info': info}
+        return info
+
+    def save(self):
+        if not self.cache_file:
+            return
+        try:
+            folder = os.path.dirname(self.cache_file)
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            with self._lock:
+                mayapy_pool.write_json(self.cache_file, self.files)
+        except (IOError, OSError) as e:
+            logger.warning('Could not write exr scan cache: %s', e)
+
+
+def find_sequences(root):
+    """Find the EXR sequences below a directory
+
+    Returns:
+        dict: (directory, name) to {frame: path}
+    """
+    sequences = {}
+    for folder, dirs, files in os.walk(root):
+        for name in files:
+            match = FRAME_RE.match(name)
+            if match:
+                frames = sequences.setdefault((folder, match.group('name')), {})
+                frames[int(match.group('frame'))] = os.path.join(folder, name)
+    return sequences
+
+
+def check_sequence(folder, name, frames, cache, expected=None, _range=None):
+    """Check all frames of a sequence
+
+    Args:
+        folder (str): Directory of the sequence
+        name (str): Sequence name
+        frames (dict): Frame to path
+        cache (ScanCache): Header cache
+        expected (tuple): Expected width and height
+        _range (tuple): Expected start and end frame
+
+    Returns:
+        dict: Report with sequence, frames, missing, problems ({frame: list})
+            and ok keys
+    """
+    report = {'sequence': os.path.join(folder, name), 'frames': len(frames),
+              'missing': [], 'problems': {}}
+    if frames or _range:
+        start, end = _range or (min(frames), max(frames))
+        report['missing'] = [f for f in range(int(start), int(end) + 1) if f not in frames]
+    for frame, path in sorted(frames.items()):
+        info = cache.info(path)
+        problems = list(info['problems'])
+        res = resolution(info)
+        if expected and res and tuple(res) != tuple(int(x) for x in expected):
+            problems.append('resolution {}x{} instead of {}x{}'.format(
+                res[0], res[1], int(expected[0]), int(expected[1])))
+        if problems:
+            report['problems'][frame] = problems
+    report['ok'] = bool(frames) and not report['missing'] and not report['problems']
+    return report
+
+
+def scan(root, expected=None, _range=None, workers=None, cache=None):
+    """Check all EXR sequences below a directory, one sequence per thread
+
+    Args:
+        root (str): Render output directory
+        expected (tuple): Expected width and height
+        _range (tuple): Expected start and end frame
+        workers (int): Number of threads
+        cache (ScanCache): Header cache, defaults to a cache in CACHE_FILE
+
+    Returns:
+        list: Reports of check_sequence, sorted by sequence
+    """
+    cache = cache or ScanCache()
+    sequences = find_sequences(root)
+    workers = workers or min(8, max(1, len(sequences)))
+
+    def check(key):
+        return check_sequence(key[0], key[1], sequences[key], cache, expected=expected, _range=_range)
+
+    pool = ThreadPool(workers)
+    try:
+        reports = pool.map(check, sorted(sequences))
+    finally:
+        pool.close()
+        pool.join()
+    cache.save()
+    return reports
+
+
+def compact(frames):
+    """Write a list of frames as ranges: [1, 2, 3, 7] -> 1-3 7"""
+    parts = []
+    for f in sorted(frames):
+        if parts and parts[-1][1] == f - 1:
+            parts[-1][1] = f
+        else:
+            parts.append([f, f])
+    return ' '.join(str(a) if a == b else '{}-{}'.format(a, b) for a, b in parts)
+
+
+def format_report(report):
+    lines = ['{}: {} frames{}'.format(report['sequence'], report['frames'],
+                                       ', ok' if report['ok'] else '')]
+    if report['missing']:
+        lines.append('  missing: {}'.format(compact(report['missing'])))
+    for frame, problems in sorted(report['problems'].items()):
+        lines.append('  {}: {}'.format(frame, ', '.join(problems)))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check rendered exr sequences')
+    parser.add_argument('directory')
+    parser.add_argument('--preset', help='render preset with the expected resolution')
+    parser.add_argument('--resolution', nargs=2, type=int, metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--range', nargs=2, type=int, metavar=('START', 'END'))
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--no-cache', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    expected = args.resolution
+    if args.preset:
+        import render_presets
+        expected = render_presets.settings(args.preset)['res']
+    cache = ScanCache(None if args.no_cache else CACHE_FILE)
+    reports = scan(args.directory, expected=expected, _range=args.range,
+                   workers=args.workers, cache=cache)
+    for report in reports:
+        logger.info(format_report(report))
+    return 0 if all(r['ok'] for r in reports) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,302 @@
+"""
+Run headless maya jobs in a bounded pool of worker processes.
+
+Every job is a command line (usually mayapy plus a script and its arguments)
+that is started as its own process. A fixed number of worker threads pull jobs
+from a queue, so at most ``workers`` processes run at the same time. Jobs can
+have a timeout and a number of retries. The state of every job is written to
+a ledger file, so an interrupted batch can be started again and only runs the
+jobs which are not done yet.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+import subprocess
+import multiprocessing
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import tbt_metrics
+
+logger = logging.getLogger('mayapy_pool')
+
+# default location of the mayapy interpreter, can be overridden with $MAYAPY
+MAYAPY = os.environ.get(
+    'MAYAPY', '/Applications/Autodesk/maya2016/Maya.app/Contents/bin/mayapy')
+
+# job states stored in the ledger
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+POLL_INTERVAL = 0.2
+
+
+def default_workers():
+    """Number of worker processes to use if nothing is specified"""
+    try:
+        return max(1, multiprocessing.cpu_count())
+    except NotImplementedError:
+        return 1
+
+
+def write_json(path, data):
+    """Write json data to a file by writing a temp file first and moving it
+    into place, so readers never see a half written file
+
+    Args:
+        path (str): File path
+        data (dict): Json serializable data
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp, path)
+
+
+class Job(object):
+    """A single command to run in a worker process
+
+    Args:
+        job_id (str): Unique name of the job, used as key in the ledger
+        cmd (list): Command line to execute
+        timeout (float): Seconds after which the process is killed
+        retries (int): Number of times a failed job is started again
+        cwd (str): Working directory of the process
+        env (dict): Environment of the process
+    """
+
+    def __init__(self, job_id, cmd, timeout=None, retries=0, cwd=None, env=None):
+        self.job_id = job_id
+        self.cmd = cmd
+        self.timeout = timeout
+        self.retries = retries
+        self.cwd = cwd
+        self.env = env
+
+    def __repr__(self):
+        return 'Job({!r})'.format(self.job_id)
+
+
+class Ledger(object):
+    """Json file which records the state of every job of a batch
+
+    Args:
+        path (str): File path of the ledger. If None the ledger is only kept
+            in memory
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                self.entries = json.load(f).get('jobs', {})
+            logger.info('Loaded ledger: %s', path)
+
+    def state(self, job_id):
+        return self.entries.get(job_id, {}).get('state', PENDING)
+
+    def is_done(self, job_id):
+        return self.state(job_id) == DONE
+
+    def update(self, job_id, **kwargs):
+        with self._lock:
+            entry = self.entries.setdefault(job_id, {'state': PENDING, 'attempts': 0})
+            entry.update(kwargs)
+            self.save()
+
+    def save(self):
+        if self.path:
+            write_json(self.path, {'jobs': self.entries})
+
+
+def run_process(cmd, timeout=None, log_path=None, cwd=None, env=None):
+    """Start a process and wait until it finished or the timeout is reached
+
+    Args:
+        cmd (list): Command line
+        timeout (float): Seconds until the process gets killed
+        log_path (str): File which receives stdout and stderr of the process
+        cwd (str): Working directory
+        env (dict): Environment
+
+    Returns:
+        tuple(int, bool): Return code and if the process was killed because
+            of the timeout
+    """
+    if log_path:
+        out = open(log_path, 'a')
+    else:
+        out = open(os.devnull, 'w')
+
+    try:
+        proc = subprocess.Popen(cmd, stdout=out, stderr=subprocess.STDOUT, cwd=cwd, env=env)
+        start = time.time()
+        while proc.poll() is None:
+            if timeout and time.time() - start > timeout:
+                proc.kill()
+                proc.wait()
+                return proc.returncode, True
+            time.sleep(POLL_INTERVAL)
+        return proc.returncode, False
+    finally:
+        out.close()
+
+
+def run_jobs(jobs, workers=None, ledger=None, log_dir=None):
+    """Run jobs in a bounded pool of processes
+
+    Jobs which are marked as done in the ledger are skipped. Failed jobs are
+    started again until they succeed or run out of retries.
+
+    Args:
+        jobs (list): List of Job instances
+        workers (int): Max number of processes running at the same time
+        ledger (Ledger): Ledger to record the job states in
+        log_dir (str): Directory for the log file of each job
+
+    Returns:
+        dict: Summary of the batch, see summarize()
+    """
+    workers = workers or default_workers()
+    ledger = ledger or Ledger()
+    if log_dir and not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    todo = queue.Queue()
+    skipped = []
+    for job in jobs:
+        if ledger.is_done(job.job_id):
+            skipped.append(job.job_id)
+            continue
+        ledger.update(job.job_id, state=PENDING, attempts=0)
+        todo.put(job)
+    if skipped:
+        logger.info('Skipping %d finished jobs', len(skipped))
+
+    def work():
+        while True:
+            try:
+                job = todo.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                _run_job(job, ledger, log_dir)
+            except Exception as e:
+                logger.exception('Job %s crashed', job.job_id)
+                ledger.update(job.job_id, state=FAILED, error=str(e))
+
+    start = time.time()
+    threads = [threading.Thread(target=work) for _ in range(min(workers, todo.qsize()))]
+    for t in threads:
+        t.daemon = True
+        t.start()
+    for t in threads:
+        # join with a timeout so KeyboardInterrupt reaches the main thread
+        while t.is_alive():
+            t.join(1.0)
+
+    return summarize(jobs, ledger, time.time() - start, skipped)
+
+
+def _run_job(job, ledger, log_dir):
+    log_path = None
+    if log_dir:
+        log_path = os.path.join(log_dir, safe_name(job.job_id) + '.log')
+
+    attempt = 0
+    while True:
+        attempt += 1
+        logger.info('Start %s (attempt %d)', job.job_id, attempt)
+        ledger.update(job.job_id, state=RUNNING, attempts=attempt, log=log_path)
+        start = time.time()
+        with tbt_metrics.span('mayapy_job', job=job.job_id, attempt=attempt) as span:
+            returncode, timed_out = run_process(
+                job.cmd, timeout=job.timeout, log_path=log_path, cwd=job.cwd, env=job.env)
+            span.set(returncode=returncode, timed_out=timed_out)
+        duration = time.time() - start
+
+        if returncode == 0 and not timed_out:
+            ledger.update(job.job_id, state=DONE, duration=duration, returncode=0, error=None)
+            logger.info('Finished %s in %.1fs', job.job_id, duration)
+            return
+
+        if timed_out:
+            error = 'timeout after {:.0f}s'.format(duration)
+        else:
+            error = 'exit code {}'.format(returncode)
+        logger.warning('Failed %s: %s', job.job_id, error)
+        ledger.update(job.job_id, state=FAILED, duration=duration,
+                      returncode=returncode, error=error)
+        if attempt > job.retries:
+            return
+
+
+def safe_name(name):
+    """Turn a job id into something usable as file name"""
+    keep = ('-', '_', '.')
+    return ''.join(c if c.isalnum() or c in keep else '_' for c in name)
+
+
+def summarize(jobs, ledger, wall_time=None, skipped=None):
+    """Create a summary report of a batch
+
+    Args:
+        jobs (list): List of Job instances
+        ledger (Ledger): Ledger holding the job states
+        wall_time (float): Run time of the whole batch
+        skipped (list): Job ids which were already done before the run
+
+    Returns:
+        dict: Summary with counts, durations and failed jobs
+    """
+    summary = {
+        'total': len(jobs),
+        'done': 0,
+        'failed': 0,
+        'skipped': len(skipped or []),
+        'wall_time': wall_time,
+        'job_time': 0.0,
+        'failures': {},
+    }
+    for job in jobs:
+        entry = ledger.entries.get(job.job_id, {})
+        state = entry.get('state', PENDING)
+        if state == DONE:
+            summary['done'] += 1
+        elif state == FAILED:
+            summary['failed'] += 1
+            summary['failures'][job.job_id] = {
+                'error': entry.get('error'),
+                'attempts': entry.get('attempts'),
+                'log': entry.get('log'),
+            }
+        if job.job_id not in (skipped or []):
+            summary['job_time'] += entry.get('duration') or 0.0
+    return summary
+
+
+def format_summary(summary):
+    """Format a summary created by summarize() as readable text"""
+    lines = [
+        'Jobs: {total}  done: {done}  failed: {failed}  skipped: {skipped}'.format(**summary),
+    ]
+    if summary.get('wall_time'):
+        speedup = summary['job_time'] / summary['wall_time'] if summary['wall_time'] else 0
+        lines.append('Wall time: {:.1f}s  job time: {:.1f}s  ({:.1f}x)'.format(
+            summary['wall_time'], summary['job_time'], speedup))
+    for job_id, failure in sorted(summary['failures'].items()):
+        lines.append('FAILED {}: {} ({} attempts) log: {}'.format(
+            job_id, failure['error'], failure['attempts'], failure['log']))
+    return '\n'.join(lines)
@@ -0,0 +1,158 @@
+"""
+Read the values of many maya attributes at once.
+
+The attributes are added to one api selection list and read from their plugs
+instead of two getAttr calls per attribute. Values and types are returned as
+getAttr returns them. Attributes the api path can not read fall back to
+getAttr. Used by the reference edits and the render presets.
+"""
+
+import maya.cmds as mc
+
+try:
+    from maya.api import OpenMaya as om
+except ImportError:
+    om = None
+
+# getAttr type names of numeric and unit attributes
+NUMERIC_TYPES = {}
+UNIT_TYPES = {}
+if om:
+    NUMERIC_TYPES = {
+        om.MFnNumericData.kBoolean: 'bool',
+        om.MFnNumericData.kByte: 'byte',
+        om.MFnNumericData.kChar: 'char',
+        om.MFnNumericData.kShort: 'short',
+        om.MFnNumericData.kInt: 'long',
+        om.MFnNumericData.kFloat: 'float',
+        om.MFnNumericData.kDouble: 'double',
+        om.MFnNumericData.k2Short: 'short2',
+        om.MFnNumericData.k3Short: 'short3',
+        om.MFnNumericData.k2Int: 'long2',
+        om.MFnNumericData.k3Int: 'long3',
+        om.MFnNumericData.k2Float: 'float2',
+        om.MFnNumericData.k3Float: 'float3',
+        om.MFnNumericData.k2Double: 'double2',
+        om.MFnNumericData.k3Double: 'double3',
+        om.MFnNumericData.k4Double: 'double4',
+    }
+    UNIT_TYPES = {
+        om.MFnUnitAttribute.kAngle: 'doubleAngle',
+        om.MFnUnitAttribute.kDistance: 'doubleLinear',
+        om.MFnUnitAttribute.kTime: 'time',
+    }
+
+
+def _attr_type(attr):
+    """Return the getAttr type name of an MObject attribute or None"""
+    if attr.hasFn(om.MFn.kNumericAttribute):
+        return NUMERIC_TYPES.get(om.MFnNumericAttribute(attr).numericType())
+    if attr.hasFn(om.MFn.kUnitAttribute):
+        return UNIT_TYPES.get(om.MFnUnitAttribute(attr).unitType())
+    if attr.hasFn(om.MFn.kEnumAttribute):
+        return 'enum'
+    if attr.hasFn(om.MFn.kTypedAttribute):
+        if om.MFnTypedAttribute(attr).attrType() == om.MFnData.kString:
+            return 'string'
+    return None
+
+
+def _plug_value(plug, attr_type):
+    """Read a plug the way getAttr returns it"""
+    if attr_type == 'doubleAngle':
+        return plug.asMAngle().asUnits(om.MAngle.uiUnit())
+    if attr_type == 'doubleLinear':
+        return plug.asMDistance().asUnits(om.MDistance.uiUnit())
+    if attr_type == 'time':
+        return plug.asMTime().asUnits(om.MTime.uiUnit())
+    if attr_type == 'string':
+        return plug.asString()
+    if attr_type == 'bool':
+        return plug.asBool()
+    if attr_type in ('float', 'double'):
+        return plug.asDouble()
+    return plug.asInt()
+
+
+def _read_plug(plug):
+    """
+    Read value and type of a plug. Compounds of numbers are returned as
+    getAttr does, e.g. ([(x, y, z)], 'double3')
+    :return: tuple of value and type or None if the type is not supported
+    """
+    attr = plug.attribute()
+    if plug.isCompound and not plug.isArray:
+        children = [plug.child(i) for i in range(plug.numChildren())]
+        child_types = [_attr_type(c.attribute()) for c in children]
+        if not 1 < len(children) < 5 or None in child_types:
+            return None
+        base = child_types[0]
+        if base in ('doubleLinear', 'doubleAngle'):
+            base = 'double'
+        if base not in ('double', 'float', 'long', 'short'):
+            return None
+        value = tuple(_plug_value(c, t) for c, t in zip(children, child_types))
+        return [value], '{}{}'.format(base, len(children))
+
+    attr_type = _attr_type(attr)
+    if attr_type is None or attr_type[-1].isdigit():
+        return None
+    return _plug_value(plug, attr_type), attr_type
+
+
+def read_values(attr_names):
+    """
+    Read values and types of many attributes with one selection list
+    instead of two getAttr calls per attribute. Attributes the api path
+    can not read fall back to getAttr
+    :param attr_names: list of node.attr names
+    :return: dict of attr name to {'value': value, 'type': type}
+    """
+    data = {}
+    fallback = []
+    if om:
+        sel = om.MSelectionList()
+        added = []
+        indices = {}
+        for name in attr_names:
+            if name in indices:
+                added.append((indices[name], name))
+                continue
+            index = sel.length()
+            try:
+                sel.add(name)
+            except RuntimeError:
+                fallback.append(name)
+                continue
+            # wildcards, ambiguous names and other names of a plug already in
+            # the list do not add exactly one item
+            if sel.length() == index + 1:
+                indices[name] = index
+                added.append((index, name))
+            else:
+                fallback.append(name)
+        for i, name in added:
+            try:
+                result = _read_plug(sel.getPlug(i))
+            except (RuntimeError, TypeError):
+                result = None
+            if result is None:
+                fallback.append(name)
+            else:
+                data[name] = {'value': result[0], 'type': result[1]}
+    else:
+        fallback = list(attr_names)
+
+    for name in fallback:
+        try:
+            value = mc.getAttr(name)
+            attr_type = mc.getAttr(name, type=True)
+        # except if attr is message
+        except RuntimeError:
+            pass
+        # except if attr is nodeInfo
+        except ValueError:
+            pass
+        else:
+            data[name] = {'value': value, 'type': attr_type}
+    return data
@@ -0,0 +1,233 @@
+"""
+Render presets defined as data and applied as a minimal diff.
+
+A preset lists render attributes as (node.attr, value) pairs. It can extend
+another preset and only list what is different. The shortcuts res and
+aa_samples set the resolution, device aspect ratio and AA samples.
+
+Applying a preset reads the current values of all its attributes in one
+pass and only sets the attributes which differ, in one undo chunk. Switching
+between presets of a heavy scene does not dirty anything that is already set.
+
+Resolving presets does not need maya, so tools outside of maya can read them.
+
+    import render_presets
+    report = render_presets.apply_preset('draft')
+"""
+
+import logging
+from collections import OrderedDict
+
+import edit_files
+import tbt_metrics
+
+logger = logging.getLogger('tbt_settings')
+
+RES_FINAL = (2048.0, 858.0)
+
+PRESETS = {
+    # settings shared by all renders
+    'render': {
+        'attrs': [
+            ('defaultResolution.aspectLock', 0),
+            ('defaultArnoldRenderOptions.GIDiffuseSamples', 4),
+            # ray depth
+            ('defaultArnoldRenderOptions.GIDiffuseDepth', 3),
+            ('defaultArnoldRenderOptions.GIGlossyDepth', 3),
+            ('defaultArnoldRenderOptions.autoTransparencyDepth', 4),
+            ('defaultArnoldRenderOptions.use_existing_tiled_textures', 1),
+            ('defaultArnoldRenderOptions.textureAutomip', 0),
+            ('defaultArnoldRenderOptions.log_verbosity', 1),
+            ('defaultArnoldFilter.width', 2.2),
+        ],
+    },
+    'final': {
+        'extends': 'render',
+        'res': RES_FINAL,
+        'aa_samples': 10,
+        'attrs': [
+            ('defaultArnoldRenderOptions.motion_blur_enable', 1),
+        ],
+    },
+    'draft': {
+        'extends': 'final',
+        'res': (RES_FINAL[0] / 2, RES_FINAL[1] / 2),
+        'aa_samples': 3,
+        'attrs': [
+            ('defaultArnoldRenderOptions.motion_blur_enable', 0),
+        ],
+    },
+    'final_oar': {
+        'extends': 'final',
+        'res': (4480, 1920),
+    },
+    'final_anim': {
+        'extends': 'final',
+        'attrs': [
+            # shutter open on start frame
+            ('defaultArnoldRenderOptions.range_type', 0),
+            ('defaultArnoldRenderOptions.outputOverscan', '10%'),
+            ('defaultArnoldDriver.mergeAOVs', 1),
+        ],
+    },
+    # project defaults written by setup_project
+    'project': {
+        'extends': 'final',
+        'attrs': [
+            ('defaultArnoldRenderOptions.display_gamma', 1.0),
+            ('defaultArnoldRenderOptions.light_gamma', 1.0),
+            ('defaultArnoldRenderOptions.shader_gamma', 1.0),
+            ('defaultArnoldRenderOptions.texture_gamma', 1.0),
+            # image folder structure, filename.#.exr
+            ('defaultRenderGlobals.imageFilePrefix', '<Scene>/<RenderLayer>_<RenderPass>'),
+            ('defaultRenderGlobals.animation', 1),
+            ('defaultRenderGlobals.putFrameBeforeExt', 1),
+            ('defaultRenderGlobals.periodInExt', 1),
+            ('defaultArnoldRenderOptions.range_type', 0),
+            # display driver, half precision exrs to save diskspace
+            ('defaultArnoldDriver.outputMode', 2),
+            ('defaultArnoldDriver.mergeAOVs', 1),
+            ('defaultArnoldDriver.halfPrecision', 1),
+            # yeti plugin pre render mel
+            ('defaultRenderGlobals.preMel', 'pgYetiPreRender'),
+        ],
+    },
+}
+
+
+def resolve(name, presets=None):
+    """Return the attributes of a preset including the ones it inherits
+
+    Args:
+        name (str): Preset name
+        presets (dict): Presets, defaults to PRESETS
+
+    Returns:
+        OrderedDict: node.attr to value, inherited attributes first
+    """
+    presets = PRESETS if presets is None else presets
+    chain = []
+    while name:
+        if name in chain:
+            raise ValueError('Preset inherits from itself: {}'.format(' -> '.join(chain + [name])))
+        if name not in presets:
+            raise KeyError('Unknown render preset: {}'.format(name))
+        chain.append(name)
+        name = presets[name].get('extends')
+
+    attrs = OrderedDict()
+    for name in reversed(chain):
+        preset = presets[name]
+        if 'res' in preset:
+            width, height = preset['res']
+            attrs['defaultResolution.width'] = width
+            attrs['defaultResolution.height'] = height
+            attrs['defaultResolution.deviceAspectRatio'] = float(width) / height
+        if 'aa_samples' in preset:
+            attrs['defaultArnoldRenderOptions.AASamples'] = preset['aa_samples']
+        attrs.update(preset.get('attrs', []))
+    return attrs
+
+
+def settings(name, presets=None):
+    """Return resolution and AA samples of a preset
+
+    Returns:
+        dict: Dict with res and aa_samples keys
+
+    Raises:
+        ValueError: The preset sets no resolution or AA samples, like the
+            render base preset
+    """
+    attrs = resolve(name, presets)
+    keys = ('defaultResolution.width', 'defaultResolution.height',
+            'defaultArnoldRenderOptions.AASamples')
+    if not all(k in attrs for k in keys):
+        raise ValueError('Render preset {} has no resolution or AA samples'.format(name))
+    return {'res': (attrs['defaultResolution.width'], attrs['defaultResolution.height']),
+            'aa_samples': attrs['defaultArnoldRenderOptions.AASamples']}
+
+
+def renderable(presets=None):
+    """Return the names of the presets a render can use, the ones which set
+    resolution and AA samples
+
+    Returns:
+        list: Sorted preset names
+    """
+    presets = PRESETS if presets is None else presets
+    names = []
+    for name in sorted(presets):
+        try:
+            settings(name, presets)
+        except ValueError:
+            continue
+        names.append(name)
+    return names
+
+
+def diff(attrs):
+    """Compare attributes with the scene
+
+    Args:
+        attrs (dict): node.attr to value
+
+    Returns:
+        tuple: list of (attr, old, new) to change, number of unchanged
+            attributes and list of attributes not in the scene
+    """
+    import plug_values
+
+    current = plug_values.read_values(list(attrs))
+    changes = []
+    unchanged = 0
+    missing = []
+    for attr, value in attrs.items():
+        if attr not in current:
+            missing.append(attr)
+            continue
+        old = edit_files.normalize_value(current[attr]['value'])
+        if edit_files.values_equal(old, edit_files.normalize_value(value)):
+            unchanged += 1
+        else:
+            changes.append((attr, old, value))
+    return changes, unchanged, missing
+
+
+@tbt_metrics.timed()
+def apply_preset(name, extra=None, dry_run=False):
+    """Set the render attributes of a preset which differ from the scene
+
+    Args:
+        name (str): Preset name
+        extra (list): (node.attr, value) pairs set after the preset
+        dry_run (bool): Only report what would change
+
+    Returns:
+        dict: Report with preset, changed (list of (attr, old, new)),
+            unchanged and missing keys
+    """
+    import maya.cmds as mc
+
+    attrs = resolve(name)
+    attrs.update(extra or [])
+    changes, unchanged, missing = diff(attrs)
+
+    if changes and not dry_run:
+        mc.undoInfo(openChunk=True, chunkName='render_preset_' + name)
+        try:
+            for attr, old, value in changes:
+                if isinstance(value, basestring):
+                    mc.setAttr(attr, value, type='string')
+                else:
+                    mc.setAttr(attr, value)
+        finally:
+            mc.undoInfo(closeChunk=True)
+
+    for attr in missing:
+        logger.warning('Render attribute not found: %s', attr)
+    for attr, old, value in changes:
+        logger.info('%s: %s -> %s', attr, old, value)
+    logger.info('Preset %s: %d changed, %d unchanged, %d missing',
+                name, len(changes), unchanged, len(missing))
+    return {'preset': name, 'changed': changes, 'unchanged': unchanged, 'missing': missing}
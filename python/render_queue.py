@@ -0,0 +1,600 @@
+#!/usr/bin/env python
+
+"""
+Local render queue for workstations.
+
+A job is a scene, a list of frames and a render preset. It is split into
+frame tasks, sized and ordered by render_schedule from the measured render
+times of the shot unless a fixed chunk size is given. The tasks of all jobs
+are rendered by a number of concurrent renderer processes sized to the cores
+and memory of the machine. Jobs with a
+higher priority are started first, jobs and the whole queue can be paused
+and resumed. Running tasks of a paused job finish, no new ones are started.
+
+The queue lives in a directory, ~/.tbt_maya/render_queue by default:
+
+    state.json    jobs and tasks, written by the service only
+    inbox/        commands of clients, one json file each
+    logs/         renderer output of every task
+    scenes/       scene snapshots of jobs submitted from maya
+    service.pid   pid of the running service
+
+Clients never write the state. They drop commands into the inbox, which the
+service picks up on its next poll, so submitting works while the service
+runs and also before it is started. Tasks which were running when the
+service stopped are started again. Jobs submitted with snapshot=True own
+their scene, the service deletes it when the job is done, failed or canceled.
+
+Start the service and submit a job with any python:
+
+    python render_queue.py serve
+    python render_queue.py submit /path/scene.mb --frames 1-100 --preset draft --priority 80
+    python render_queue.py pause <job id>
+    python render_queue.py list
+
+The renderer executable is taken from $MAYA_RENDER or --render. Any
+executable accepting the Render command line works, so a stand-in script
+can be used to try the scheduling without maya.
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import uuid
+import logging
+import argparse
+import subprocess
+import multiprocessing
+
+import mayapy_pool
+import render_presets
+import tbt_metrics
+import render_schedule
+from background_render import RENDER
+
+logger = logging.getLogger('render_queue')
+
+QUEUE_DIR = os.path.join(os.path.expanduser('~'), '.tbt_maya', 'render_queue')
+# memory one renderer process is expected to use, can be overridden with
+# $TBT_RENDER_MEMORY in GB
+MEMORY_PER_RENDER = float(os.environ.get('TBT_RENDER_MEMORY', 8)) * 1024 ** 3
+DEFAULT_PRIORITY = 50
+POLL_INTERVAL = 1.0
+
+# job and task states
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELED = 'canceled'
+PAUSED = 'paused'
+
+# client commands
+SUBMIT = 'submit'
+PAUSE = 'pause'
+RESUME = 'resume'
+CANCEL = 'cancel'
+PRIORITY = 'priority'
+
+
+def total_memory():
+    """Physical memory of the machine in bytes or None if unknown"""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_slots(memory_per_render=MEMORY_PER_RENDER):
+    """Number of concurrent renders the machine can run
+
+    Arnold uses all cores for one frame, but scene loading and texture
+    reading are mostly single threaded, so running more than one render
+    keeps the cores busy. Limited to a quarter of the cores and by memory.
+
+    Returns:
+        int: Number of renderer processes
+    """
+    try:
+        cores = multiprocessing.cpu_count()
+    except NotImplementedError:
+        cores = 1
+    slots = max(1, cores // 4)
+    memory = total_memory()
+    if memory and memory_per_render:
+        slots = min(slots, int(memory // memory_per_render))
+    return max(1, slots)
+
+
+def parse_frames(text):
+    """Parse a frame list like 1-10,15,20-30x2
+
+    Returns:
+        list: Sorted list of unique frames
+    """
+    frames = set()
+    for part in str(text).replace(' ', '').split(','):
+        if not part:
+            continue
+        step = 1
+        if 'x' in part:
+            part, step = part.split('x')
+            step = int(step)
+        if '-' in part[1:]:
+            i = part.index('-', 1)
+            start, end = int(part[:i]), int(part[i + 1:])
+            frames.update(range(start, end + 1, step))
+        else:
+            frames.add(int(part))
+    return sorted(frames)
+
+
+def frame_runs(frames):
+    """Group frames into runs of consecutive frames
+
+    Returns:
+        list: List of (start, end) tuples
+    """
+    runs = []
+    for f in sorted(frames):
+        if runs and runs[-1][1] == f - 1:
+            runs[-1][1] = f
+        else:
+            runs.append([f, f])
+    return [tuple(r) for r in runs]
+
+
+def split_tasks(frames, chunk_size=1):
+    """Split frames into tasks of at most chunk_size consecutive frames
+
+    Returns:
+        list: List of (start, end) tuples
+    """
+    chunk_size = max(1, int(chunk_size))
+    tasks = []
+    for start, end in frame_runs(frames):
+        for s in range(start, end + 1, chunk_size):
+            tasks.append((s, min(end, s + chunk_size - 1)))
+    return tasks
+
+
+def render_command(job, task, render=RENDER):
+    """Return the renderer command line of a task
+
+    Args:
+        job (dict): Job of the task
+        task (dict): Task with start and end frame
+        render (str): Renderer executable
+
+    Returns:
+        list: Command line
+    """
+    cmd = [render, '-r', job.get('renderer', 'arnold'),
+           '-s', str(task['start']), '-e', str(task['end'])]
+    if job.get('preset'):
+        settings = render_presets.settings(job['preset'])
+        width, height = settings['res']
+        cmd += ['-x', str(int(width)), '-y', str(int(height))]
+        if job.get('renderer', 'arnold') == 'arnold':
+            cmd += ['-ai:as', str(settings['aa_samples'])]
+    if job.get('project'):
+        cmd += ['-proj', job['project']]
+    if job.get('output'):
+        cmd += ['-rd', job['output']]
+    return cmd + [job['scene']]
+
+
+def send(command, queue_dir=QUEUE_DIR, **kwargs):
+    """Drop a command into the inbox of the queue
+
+    Args:
+        command (str): One of SUBMIT, PAUSE, RESUME, CANCEL, PRIORITY
+        queue_dir (str): Queue directory
+        **kwargs: Arguments of the command
+    """
+    inbox = os.path.join(queue_dir, 'inbox')
+    if not os.path.exists(inbox):
+        os.makedirs(inbox)
+    name = '{:.0f}_{}'.format(time.time() * 1000, uuid.uuid4().hex[:8])
+    tmp = os.path.join(inbox, name + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(dict(kwargs, command=command), f)
+    # the rename makes the command visible to the service only when it is complete
+    os.rename(tmp, os.path.join(inbox, name + '.json'))
+
+
+def submit(scene, frames, preset=None, priority=DEFAULT_PRIORITY, project=None,
+           output=None, chunk_size=None, retries=0, shot=None, snapshot=False,
+           queue_dir=QUEUE_DIR):
+    """Submit a render job
+
+    Args:
+        scene (str): Scene file
+        frames (list or str): Frames to render, a list or a string like 1-10,20
+        preset (str): Render preset, sets resolution and AA samples
+        priority (int): Jobs with higher priority are rendered first
+        project (str): Project directory
+        output (str): Image output directory
+        chunk_size (int): Frames per task, None sizes the tasks from the
+            render history of the shot
+        retries (int): Retries of a failed task
+        shot (str): Shot name of the render history, defaults to the scene
+            name without version
+        snapshot (bool): The scene is a copy made for this job, delete it
+            when the job ended
+        queue_dir (str): Queue directory
+
+    Returns:
+        str: Job id
+    """
+    if not isinstance(frames, (list, tuple)):
+        frames = parse_frames(frames)
+    if preset:
+        # fail on the client instead of in the service
+        render_presets.settings(preset)
+    name = os.path.splitext(os.path.basename(scene))[0]
+    job_id = '{}_{:.0f}'.format(mayapy_pool.safe_name(name), time.time() * 1000)
+    send(SUBMIT, queue_dir, job_id=job_id, scene=os.path.abspath(scene),
+         frames=[int(f) for f in frames], preset=preset, priority=int(priority),
+         project=project, output=output, chunk_size=chunk_size, retries=retries,
+         shot=shot or render_schedule.shot_name(scene), snapshot=snapshot)
+    return job_id
+
+
+def pause(job_id=None, queue_dir=QUEUE_DIR):
+    """Pause a job or the whole queue if job_id is None"""
+    send(PAUSE, queue_dir, job_id=job_id)
+
+
+def resume(job_id=None, queue_dir=QUEUE_DIR):
+    """Resume a job or the whole queue if job_id is None"""
+    send(RESUME, queue_dir, job_id=job_id)
+
+
+def cancel(job_id, queue_dir=QUEUE_DIR):
+    send(CANCEL, queue_dir, job_id=job_id)
+
+
+def set_priority(job_id, priority, queue_dir=QUEUE_DIR):
+    send(PRIORITY, queue_dir, job_id=job_id, priority=int(priority))
+
+
+def read_state(queue_dir=QUEUE_DIR):
+    """Return the last state written by the service"""
+    path = os.path.join(queue_dir, 'state.json')
+    if not os.path.exists(path):
+        return {'paused': False, 'jobs': {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def service_pid(queue_dir=QUEUE_DIR):
+    """Return the pid of the running service or None"""
+    path = os.path.join(queue_dir, 'service.pid')
+    try:
+        with open(path, 'r') as f:
+            pid = int(f.read().strip())
+        os.kill(pid, 0)
+    except (IOError, OSError, ValueError):
+        return None
+    return pid
+
+
+def job_state(job):
+    """Derive the state of a job from its tasks"""
+    states = [t['state'] for t in job['tasks']]
+    if job.get('canceled'):
+        return CANCELED
+    if RUNNING in states:
+        return RUNNING
+    if PENDING in states:
+        return PAUSED if job.get('paused') else PENDING
+    if FAILED in states:
+        return FAILED
+    return DONE
+
+
+def format_state(state):
+    lines = ['Queue paused' if state.get('paused') else 'Queue running']
+    jobs = sorted(state['jobs'].values(), key=lambda j: (-j['priority'], j['created']))
+    for job in jobs:
+        done = sum(1 for t in job['tasks'] if t['state'] == DONE)
+        lines.append('{:<40} {:>3} {:<8} {}/{} tasks  {} {}'.format(
+            job['job_id'], job['priority'], job_state(job), done, len(job['tasks']),
+            job.get('preset') or '-', job['scene']))
+    return '\n'.join(lines)
+
+
+class RenderQueue(object):
+    """The queue service. Reads commands, schedules tasks and runs the
+    renderer processes
+
+    Args:
+        queue_dir (str): Queue directory
+        slots (int): Number of concurrent renderer processes
+        render (str): Renderer executable
+        history (render_schedule.RenderHistory): Render times of the shots
+    """
+
+    def __init__(self, queue_dir=QUEUE_DIR, slots=None, render=RENDER, history=None):
+        self.queue_dir = queue_dir
+        self.slots = slots or default_slots()
+        self.render = render
+        self.history = history or render_schedule.get_history()
+        self.state_path = os.path.join(queue_dir, 'state.json')
+        self.log_dir = os.path.join(queue_dir, 'logs')
+        self.running = {}
+        self.state = read_state(queue_dir)
+        self._changed = False
+
+        for path in (queue_dir, self.log_dir, os.path.join(queue_dir, 'inbox')):
+            if not os.path.exists(path):
+                os.makedirs(path)
+        # tasks of an interrupted service run again
+        for job in self.state['jobs'].values():
+            for task in job['tasks']:
+                if task['state'] == RUNNING:
+                    task['state'] = PENDING
+
+    def save(self):
+        mayapy_pool.write_json(self.state_path, self.state)
+        self._changed = False
+
+    def read_inbox(self):
+        """Apply the commands of the inbox in the order they were sent"""
+        for path in sorted(glob.glob(os.path.join(self.queue_dir, 'inbox', '*.json'))):
+            try:
+                with open(path, 'r') as f:
+                    command = json.load(f)
+                self.apply(command)
+            except (ValueError, KeyError) as e:
+                logger.error('Ignoring command %s: %s', os.path.basename(path), e)
+            os.remove(path)
+
+    def apply(self, command):
+        """Apply a client command to the state"""
+        action = command.pop('command')
+        job_id = command.get('job_id')
+        job = self.state['jobs'].get(job_id)
+        if action == SUBMIT:
+            self.add_job(command)
+        elif job_id and job is None:
+            logger.warning('Unknown job: %s', job_id)
+            return
+        elif action in (PAUSE, RESUME):
+            target = job if job else self.state
+            target['paused'] = action == PAUSE
+            logger.info('%s %s', 'Paused' if action == PAUSE else 'Resumed', job_id or 'queue')
+        elif action == CANCEL:
+            job['canceled'] = True
+            for (running_id, index), (proc, _, _) in list(self.running.items()):
+                if running_id == job_id:
+                    proc.terminate()
+            for task in job['tasks']:
+                if task['state'] == PENDING:
+                    task['state'] = CANCELED
+            logger.info('Canceled %s', job_id)
+        elif action == PRIORITY:
+            job['priority'] = command['priority']
+        self._changed = True
+
+    def add_job(self, job):
+        job = dict(job, created=time.time(), paused=False, canceled=False)
+        job['shot'] = job.get('shot') or render_schedule.shot_name(job['scene'])
+        frames = job.pop('frames')
+        if job.get('chunk_size'):
+            chunks = [(s, e, None) for s, e in split_tasks(frames, job['chunk_size'])]
+        else:
+            chunks = render_schedule.plan(job['shot'], job.get('preset'), frames, self.slots,
+                                          history=self.history)
+        job['tasks'] = [{'start': s, 'end': e, 'predicted': p, 'state': PENDING, 'attempts': 0}
+                        for s, e, p in chunks]
+        self.state['jobs'][job['job_id']] = job
+        logger.info('Added %s: %d tasks, priority %d', job['job_id'], len(job['tasks']), job['priority'])
+
+    def next_tasks(self, count):
+        """Return up to count (job, index) of pending tasks, highest priority first"""
+        if self.state.get('paused') or count <= 0:
+            return []
+        jobs = [j for j in self.state['jobs'].values() if not j.get('paused') and not j.get('canceled')]
+        jobs.sort(key=lambda j: (-j['priority'], j['created']))
+        tasks = []
+        for job in jobs:
+            for index, task in enumerate(job['tasks']):
+                if task['state'] == PENDING and (job['job_id'], index) not in self.running:
+                    tasks.append((job, index))
+                    if len(tasks) == count:
+                        return tasks
+        return tasks
+
+    def start_task(self, job, index):
+        task = job['tasks'][index]
+        try:
+            cmd = render_command(job, task, render=self.render)
+        except Exception as e:
+            # a bad job must not stop the service and the other jobs
+            task['state'] = FAILED
+            task['error'] = str(e)
+            logger.error('Could not render %s frames %s-%s: %s', job['job_id'],
+                         task['start'], task['end'], e)
+            return
+        log_path = os.path.join(self.log_dir, '{}_{}-{}.log'.format(job['job_id'], task['start'], task['end']))
+        log = open(log_path, 'a')
+        try:
+            proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+        except OSError as e:
+            log.close()
+            task['state'] = FAILED
+            task['error'] = str(e)
+            logger.error('Could not start %s: %s', cmd[0], e)
+            return
+        task['state'] = RUNNING
+        task['attempts'] += 1
+        self.running[(job['job_id'], index)] = (proc, time.time(), log)
+        logger.info('Started %s frames %s-%s', job['job_id'], task['start'], task['end'])
+
+    def poll(self):
+        """Update finished tasks and fill the free slots"""
+        for key, (proc, start, log) in list(self.running.items()):
+            if proc.poll() is None:
+                continue
+            log.close()
+            del self.running[key]
+            job = self.state['jobs'][key[0]]
+            task = job['tasks'][key[1]]
+            task['duration'] = time.time() - start
+            task['returncode'] = proc.returncode
+            if job.get('canceled'):
+                task['state'] = CANCELED
+            elif proc.returncode == 0:
+                task['state'] = DONE
+                self.history.record(job['shot'], job.get('preset'), task['start'], task['end'],
+                                    task['duration'])
+            elif task['attempts'] <= job.get('retries', 0):
+                task['state'] = PENDING
+            else:
+                task['state'] = FAILED
+            logger.info('%s frames %s-%s %s in %.1fs', key[0], task['start'], task['end'],
+                        task['state'], task['duration'])
+            tbt_metrics.event('render_task', job=key[0], shot=job['shot'], preset=job.get('preset'),
+                              start=task['start'], end=task['end'], state=task['state'],
+                              duration=task['duration'], predicted=task.get('predicted'))
+            self._changed = True
+
+        for job in self.state['jobs'].values():
+            self.remove_snapshot(job)
+
+        for job, index in self.next_tasks(self.slots - len(self.running)):
+            self.start_task(job, index)
+            self._changed = True
+
+    def remove_snapshot(self, job):
+        """Delete the scene snapshot of a job which ended and none of whose
+        renderers still run"""
+        if not job.get('snapshot') or job_state(job) not in (DONE, FAILED, CANCELED):
+            return
+        if any(job_id == job['job_id'] for job_id, _ in self.running):
+            return
+        try:
+            os.remove(job['scene'])
+            # the folder made for the snapshot, fails if it holds anything else
+            os.rmdir(os.path.dirname(job['scene']))
+        except OSError as e:
+            logger.debug('Could not remove snapshot %s: %s', job['scene'], e)
+        job['snapshot'] = False
+        self._changed = True
+
+    def is_idle(self):
+        return not self.running and not self.next_tasks(1)
+
+    def serve(self, poll_interval=POLL_INTERVAL, exit_when_idle=False):
+        """Run the service until interrupted
+
+        Args:
+            poll_interval (float): Seconds between polls
+            exit_when_idle (bool): Return when no task is running or can be started
+        """
+        pid_path = os.path.join(self.queue_dir, 'service.pid')
+        with open(pid_path, 'w') as f:
+            f.write(str(os.getpid()))
+        logger.info('Render queue %s with %d slots', self.queue_dir, self.slots)
+        try:
+            while True:
+                self.read_inbox()
+                self.poll()
+                if self._changed:
+                    self.save()
+                if exit_when_idle and self.is_idle():
+                    return
+                time.sleep(poll_interval)
+        finally:
+            for (job_id, index), (proc, _, log) in self.running.items():
+                proc.terminate()
+                proc.wait()
+                log.close()
+                # the terminated tasks start again with the next service
+                self.state['jobs'][job_id]['tasks'][index]['state'] = PENDING
+            self.running = {}
+            self.save()
+            os.remove(pid_path)
+
+
+def ensure_service(queue_dir=QUEUE_DIR, python=mayapy_pool.MAYAPY, slots=None):
+    """Start the service in the background if it is not running
+
+    Args:
+        queue_dir (str): Queue directory
+        python (str): Python interpreter for the service. Inside maya
+            sys.executable is maya itself, so mayapy is used by default
+        slots (int): Number of concurrent renderer processes
+    """
+    if service_pid(queue_dir):
+        return
+    cmd = [python, os.path.abspath(__file__).replace('.pyc', '.py'), '--queue-dir', queue_dir, 'serve']
+    if slots:
+        cmd += ['--slots', str(slots)]
+    with open(os.devnull, 'w') as devnull:
+        subprocess.Popen(cmd, stdout=devnull, stderr=devnull, close_fds=True)
+    logger.info('Started render queue service')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local render queue')
+    parser.add_argument('--queue-dir', default=QUEUE_DIR)
+    sub = parser.add_subparsers(dest='command')
+    p = sub.add_parser('serve', help='run the queue service')
+    p.add_argument('--slots', type=int, default=None, help='concurrent renders')
+    p.add_argument('--render', default=RENDER, help='renderer executable')
+    p.add_argument('--exit-when-idle', action='store_true')
+    p = sub.add_parser('submit', help='submit a render job')
+    p.add_argument('scene')
+    p.add_argument('--frames', required=True, help='frame list like 1-10,15')
+    p.add_argument('--preset', choices=render_presets.renderable())
+    p.add_argument('--priority', type=int, default=DEFAULT_PRIORITY)
+    p.add_argument('--project')
+    p.add_argument('--output')
+    p.add_argument('--chunk-size', type=int, default=0, help='frames per task, 0 sizes them from the history')
+    p.add_argument('--retries', type=int, default=0)
+    for name in (PAUSE, RESUME):
+        p = sub.add_parser(name, help='{} a job or the whole queue'.format(name))
+        p.add_argument('job_id', nargs='?')
+    p = sub.add_parser(CANCEL, help='cancel a job')
+    p.add_argument('job_id')
+    p = sub.add_parser(PRIORITY, help='change the priority of a job')
+    p.add_argument('job_id')
+    p.add_argument('priority', type=int)
+    sub.add_parser('list', help='show the jobs')
+    args = parser.parse_args(argv)
+    if not args.command:
+        parser.error('a command is required')
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s: %(message)s')
+
+    if args.command == 'serve':
+        if service_pid(args.queue_dir):
+            logger.error('Service is already running')
+            return 1
+        queue = RenderQueue(args.queue_dir, slots=args.slots, render=args.render)
+        try:
+            queue.serve(exit_when_idle=args.exit_when_idle)
+        except KeyboardInterrupt:
+            pass
+    elif args.command == 'submit':
+        print(submit(args.scene, args.frames, preset=args.preset, priority=args.priority,
+                     project=args.project, output=args.output, chunk_size=args.chunk_size or None,
+                     retries=args.retries, queue_dir=args.queue_dir))
+    elif args.command in (PAUSE, RESUME):
+        send(args.command, args.queue_dir, job_id=args.job_id)
+    elif args.command == CANCEL:
+        cancel(args.job_id, args.queue_dir)
+    elif args.command == PRIORITY:
+        set_priority(args.job_id, args.priority, args.queue_dir)
+    elif args.command == 'list':
+        print(format_state(read_state(args.queue_dir)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+Size and order render tasks from measured render times.
+
+Every finished task records its render time per frame for the shot and the
+render preset. When a frame range is split again, the history predicts the
+time of every frame and the range is cut into chunks of about equal
+predicted time. Chunks are big enough to pay for loading the scene, and
+there are a few per render slot so a slow chunk at the end does not leave
+the other slots idle. The chunks are ordered longest predicted first.
+
+The history is kept in ~/.tbt_maya/render_history.json:
+
+    {"TB_01130_anim": {"draft": {"101": 12.5, "102": 14.0}, ...}, ...}
+"""
+
+import os
+import re
+import json
+import logging
+import threading
+
+import mayapy_pool
+
+logger = logging.getLogger('render_queue')
+
+HISTORY_FILE = os.path.join(os.path.expanduser('~'), '.tbt_maya', 'render_history.json')
+# seconds a render process needs to start and load the scene
+LOAD_SECONDS = 20.0
+# seconds per frame if nothing is known about a shot
+DEFAULT_FRAME_SECONDS = 60.0
+# weight of a new measurement against the history
+SMOOTHING = 0.5
+# chunks per render slot, more chunks balance better, fewer load less often
+CHUNKS_PER_SLOT = 3
+
+# snapshot timestamps of the render queue and version numbers
+SHOT_SUFFIX_RE = re.compile(r'(_\d{9,})$|([._-]v\d+)$')
+
+
+def shot_name(scene):
+    """Return the shot of a scene file, without version and snapshot time
+
+    Args:
+        scene (str): Scene file like TB_01130_anim_v03_1792328544.mb
+
+    Returns:
+        str: Shot name like TB_01130_anim
+    """
+    name = os.path.splitext(os.path.basename(scene))[0]
+    while True:
+        stripped = SHOT_SUFFIX_RE.sub('', name)
+        if stripped == name or not stripped:
+            return name
+        name = stripped
+
+
+class RenderHistory(object):
+    """Measured render seconds per frame of shots and presets
+
+    Args:
+        history_file (str): Json file to persist the history in, None keeps
+            it only in memory
+    """
+
+    def __init__(self, history_file=HISTORY_FILE):
+        self.history_file = history_file
+        self.shots = {}
+        self._lock = threading.Lock()
+        if history_file and os.path.exists(history_file):
+            try:
+                with open(history_file, 'r') as f:
+                    self.shots = json.load(f)
+            except ValueError:
+                logger.warning('Ignoring broken render history: %s', history_file)
+
+    def frames(self, shot, preset):
+        """Return the known seconds per frame of a shot and preset
+
+        Returns:
+            dict: Frame to seconds
+        """
+        frames = self.shots.get(shot, {}).get(preset or '', {})
+        return dict((int(f), s) for f, s in frames.items())
+
+    def record(self, shot, preset, start, end, duration, load_seconds=LOAD_SECONDS):
+        """Record the duration of a task which rendered start..end
+
+        Args:
+            shot (str): Shot name
+            preset (str): Render preset
+            start (int): First frame
+            end (int): Last frame
+            duration (float): Seconds the task took
+            load_seconds (float): Part of the duration spent loading the scene
+        """
+        count = end - start + 1
+        seconds = max(duration - load_seconds, duration * 0.1) / count
+        with self._lock:
+            frames = self.shots.setdefault(shot, {}).setdefault(preset or '', {})
+            for f in range(start, end + 1):
+                old = frames.get(str(f))
+                frames[str(f)] = seconds if old is None else old + SMOOTHING * (seconds - old)
+            self.save()
+
+    def predict(self, shot, preset, frames):
+        """Predict the render seconds of frames
+
+        Unknown frames get the value of the nearest known frame. Without
+        history of the preset the other presets of the shot are used, without
+        any history of the shot DEFAULT_FRAME_SECONDS.
+
+        Returns:
+            dict: Frame to predicted seconds
+        """
+        known = self.frames(shot, preset)
+        if not known:
+            for other in self.shots.get(shot, {}):
+                known.update(self.frames(shot, other))
+        if not known:
+            return dict((f, DEFAULT_FRAME_SECONDS) for f in frames)
+
+        keys = sorted(known)
+        prediction = {}
+        for f in frames:
+            if f in known:
+                prediction[f] = known[f]
+            else:
+                nearest = min(keys, key=lambda k: abs(k - f))
+                prediction[f] = known[nearest]
+        return prediction
+
+    def save(self):
+        if self.history_file:
+            try:
+                folder = os.path.dirname(self.history_file)
+                if not os.path.exists(folder):
+                    os.makedirs(folder)
+                mayapy_pool.write_json(self.history_file, self.shots)
+            except (IOError, OSError) as e:
+                logger.warning('Could not write render history: %s', e)
+
+
+_history = None
+
+
+def get_history():
+    """Return the history shared by all callers in this process"""
+    global _history
+    if _history is None:
+        _history = RenderHistory()
+    return _history
+
+
+def plan_chunks(frames, prediction, slots, load_seconds=LOAD_SECONDS,
+                chunks_per_slot=CHUNKS_PER_SLOT):
+    """Cut frames into chunks of consecutive frames with about equal
+    predicted time, longest first
+
+    Args:
+        frames (list): Frames to render
+        prediction (dict): Frame to predicted seconds
+        slots (int): Number of concurrent renders
+        load_seconds (float): Seconds to load the scene per chunk
+        chunks_per_slot (int): Chunks per slot to balance the slots
+
+    Returns:
+        list: List of (start, end, predicted seconds), longest first
+    """
+    frames = sorted(set(frames))
+    if not frames:
+        return []
+    total = sum(prediction[f] for f in frames)
+    # big enough to pay for loading the scene, small enough to balance
+    target = max(total / (max(1, slots) * chunks_per_slot), load_seconds * 2)
+
+    chunks = []
+    start = prev = frames[0]
+    cost = prediction[start]
+    for f in frames[1:]:
+        if f != prev + 1 or cost >= target:
+            chunks.append((start, prev, cost + load_seconds))
+            start = f
+            cost = 0.0
+        cost += prediction[f]
+        prev = f
+    chunks.append((start, prev, cost + load_seconds))
+
+    # longest processing time first
+    chunks.sort(key=lambda c: -c[2])
+    return chunks
+
+
+def plan(shot, preset, frames, slots, history=None):
+    """Plan the chunks of a job from the history of its shot
+
+    Args:
+        shot (str): Shot name
+        preset (str): Render preset
+        frames (list): Frames to render
+        slots (int): Number of concurrent renders
+        history (RenderHistory): Defaults to the shared history
+
+    Returns:
+        list: List of (start, end, predicted seconds), longest first
+    """
+    history = history or get_history()
+    chunks = plan_chunks(frames, history.predict(shot, preset, frames), slots)
+    logger.info('Planned %d chunks for %s %s', len(chunks), shot, preset or '')
+    return chunks
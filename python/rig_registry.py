@@ -0,0 +1,151 @@
+"""
+Index of the rig versions in the rig directories of a project.
+
+The rig directories are listed once and the version is parsed from the file
+names (Horse_Rig_v12.mb -> 12). The index is kept in memory and in a json
+file in the user's home, so the latest rig is known without listing the
+directory again. Only the modification time of the directory is checked on a
+lookup, which changes whenever a rig is added, removed or renamed.
+
+Files without a version number are ranked by their modification time below
+all versioned files.
+
+The batch exports look the rig up with tbt_utils.get_latest_rig. The
+toolboxes have no rig lookup of their own, a toolbox that needs one should go
+through the same function.
+"""
+
+import os
+import re
+import json
+import logging
+import threading
+
+logger = logging.getLogger('rig_registry')
+
+INDEX_FILE = os.path.join(os.path.expanduser('~'), '.tbt_maya', 'rig_index.json')
+EXTENSIONS = ('.ma', '.mb')
+VERSION_RE = re.compile(r'[._-]v(\d+)', re.IGNORECASE)
+
+
+def parse_version(file_name):
+    """Return the version number in a file name or None
+
+    Args:
+        file_name (str): File name like Horse_Rig_v12.mb
+
+    Returns:
+        int: Version number, the last one if there are several
+    """
+    found = VERSION_RE.findall(os.path.splitext(file_name)[0])
+    if found:
+        return int(found[-1])
+    return None
+
+
+def scan(rig_dir):
+    """List the rig files of a directory and sort them by version
+
+    Args:
+        rig_dir (str): Rig directory
+
+    Returns:
+        list: Dicts with file, version and mtime keys, latest rig last
+    """
+    rigs = []
+    for name in os.listdir(rig_dir):
+        if not name.lower().endswith(EXTENSIONS):
+            continue
+        version = parse_version(name)
+        path = os.path.join(rig_dir, name)
+        # only unversioned files need a stat for their rank
+        mtime = os.path.getmtime(path) if version is None else None
+        rigs.append({'file': path, 'version': version, 'mtime': mtime})
+
+    rigs.sort(key=lambda r: (r['version'] is not None, r['version'] or 0, r['mtime'] or 0))
+    return rigs
+
+
+class RigRegistry(object):
+    """Cached rig index
+
+    Args:
+        index_file (str): Json file to persist the index in, None keeps the
+            index only in memory
+    """
+
+    def __init__(self, index_file=INDEX_FILE):
+        self.index_file = index_file
+        self.index = {}
+        self._lock = threading.Lock()
+        if index_file and os.path.exists(index_file):
+            try:
+                with open(index_file, 'r') as f:
+                    self.index = json.load(f)
+            except ValueError:
+                logger.warning('Ignoring broken rig index: %s', index_file)
+
+    def rigs(self, rig_dir):
+        """Return the rigs of a directory, latest last
+
+        Args:
+            rig_dir (str): Rig directory
+
+        Returns:
+            list: Dicts with file, version and mtime keys
+        """
+        rig_dir = os.path.normpath(os.path.abspath(rig_dir))
+        if not os.path.isdir(rig_dir):
+            raise IOError('Rig directory not found: {}'.format(rig_dir))
+        mtime = os.path.getmtime(rig_dir)
+
+        entry = self.index.get(rig_dir)
+        if entry and entry['mtime'] == mtime:
+            return entry['rigs']
+
+        logger.info('Indexing rigs in %s', rig_dir)
+        rigs = scan(rig_dir)
+        with self._lock:
+            self.index[rig_dir] = {'mtime': mtime, 'rigs': rigs}
+            self.save()
+        return rigs
+
+    def latest(self, rig_dir):
+        """Return the file path of the latest rig in a directory"""
+        rigs = self.rigs(rig_dir)
+        if not rigs:
+            raise IOError('No rig found in: {}'.format(rig_dir))
+        return rigs[-1]['file']
+
+    def save(self):
+        if not self.index_file:
+            return
+        try:
+            folder = os.path.dirname(self.index_file)
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            tmp = self.index_file + '.{}.tmp'.format(os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(self.index, f)
+            if os.name == 'nt' and os.path.exists(self.index_file):
+                os.remove(self.index_file)
+            os.rename(tmp, self.index_file)
+        except (IOError, OSError) as e:
+            # the index is only a cache, a read only home is fine
+            logger.warning('Could not write rig index: %s', e)
+
+
+_registry = None
+
+
+def get_registry():
+    """Return the registry shared by all callers in this process"""
+    global _registry
+    if _registry is None:
+        _registry = RigRegistry()
+    return _registry
+
+
+def latest_rig(rig_dir):
+    """Return the file path of the latest rig in a directory"""
+    return get_registry().latest(rig_dir)
@@ -0,0 +1,113 @@
+"""
+In memory copy of the attributes of the tbt_settings node.
+
+The user defined attributes of the node are read once. Maya callbacks mark
+attributes dirty when they are set, added or removed and only those are read
+again on the next status() call. Opening or creating a scene drops the cache,
+because the node belongs to the scene.
+
+    import settings_cache
+    status = settings_cache.get_cache('tbt_settings').status()
+"""
+
+import logging
+
+import maya.cmds as mc
+from maya.api import OpenMaya as om
+
+logger = logging.getLogger('tbt_settings')
+
+
+class SettingsCache(object):
+    """Cached user defined attributes of a settings node
+
+    Args:
+        node_name (str): Name of the settings node
+    """
+
+    def __init__(self, node_name):
+        self.node_name = node_name
+        self.values = None
+        self.dirty = set()
+        self.node_callbacks = []
+        self.scene_callbacks = [
+            om.MSceneMessage.addCallback(om.MSceneMessage.kAfterOpen, self._scene_changed),
+            om.MSceneMessage.addCallback(om.MSceneMessage.kAfterNew, self._scene_changed),
+        ]
+
+    def status(self):
+        """Return the attribute values of the node
+
+        Returns:
+            dict: 'node.attr' to value mapping, None if the node does not exist
+        """
+        if self.values is None:
+            if not self._bind():
+                return None
+            attrs = mc.listAttr(self.node_name, userDefined=True) or []
+            self.values = {}
+            self.dirty = set(self.node_name + '.' + a for a in attrs)
+        for name in self.dirty:
+            self.values[name] = mc.getAttr(name)
+        self.dirty = set()
+        return dict(self.values)
+
+    def invalidate(self):
+        """Read all attributes again on the next status() call"""
+        self.values = None
+        self.dirty = set()
+        self._unbind()
+
+    def close(self):
+        """Remove all callbacks"""
+        self._unbind()
+        for callback in self.scene_callbacks:
+            om.MMessage.removeCallback(callback)
+        self.scene_callbacks = []
+
+    def _bind(self):
+        if self.node_callbacks:
+            return True
+        if not mc.objExists(self.node_name):
+            return False
+        sel = om.MSelectionList()
+        sel.add(self.node_name)
+        node = sel.getDependNode(0)
+        self.node_callbacks = [
+            om.MNodeMessage.addAttributeChangedCallback(node, self._attribute_changed),
+            om.MNodeMessage.addNodePreRemovalCallback(node, self._node_removed),
+            om.MNodeMessage.addNameChangedCallback(node, self._node_removed),
+        ]
+        return True
+
+    def _unbind(self):
+        for callback in self.node_callbacks:
+            om.MMessage.removeCallback(callback)
+        self.node_callbacks = []
+
+    def _attribute_changed(self, msg, plug, other_plug, client_data):
+        if self.values is None:
+            return
+        if msg & (om.MNodeMessage.kAttributeAdded | om.MNodeMessage.kAttributeRemoved):
+            # read the list of user defined attributes again
+            self.values = None
+        elif msg & om.MNodeMessage.kAttributeSet:
+            name = self.node_name + '.' + plug.partialName(useLongNames=True)
+            if name in self.values:
+                self.dirty.add(name)
+
+    def _node_removed(self, *args):
+        self.invalidate()
+
+    def _scene_changed(self, *args):
+        self.invalidate()
+
+
+_caches = {}
+
+
+def get_cache(node_name):
+    """Return the cache of a settings node shared by all callers in this session"""
+    if node_name not in _caches:
+        _caches[node_name] = SettingsCache(node_name)
+    return _caches[node_name]
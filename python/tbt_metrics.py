@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+
+"""
+Timed spans and maya command counts of the toolbox, written as json lines.
+
+Metrics are off unless $TBT_METRICS names a target, which is inherited by the
+mayapy processes of the batch tools:
+
+    export TBT_METRICS=/tmp/tbt_metrics.jsonl     # append to a local file
+    export TBT_METRICS=udp://farm-stats:9999      # send datagrams
+    export TBT_METRICS=tcp://farm-stats:9999      # send over a connection
+
+Code marks its phases with spans. A span is written when it ends, with its
+duration, the number of maya commands called during it (nested spans
+included) and its fields:
+
+    with tbt_metrics.span('scene_open', scene=path):
+        pm.openFile(path, open=True, force=True)
+
+    @tbt_metrics.timed('apply_edits')
+    def apply_edits(...):
+
+    {"type": "span", "name": "scene_open", "duration": 12.3, "commands": 2,
+     "parent": "write_alembic", "scene": "...", "ok": true, ...}
+
+Commands are counted by wrapping the functions of maya.cmds, and of
+pymel.core if it is already imported, once maya is initialized. Plugin
+commands like pm.AbcExport are counted in spans which start after their
+plugin is loaded. Attribute access through PyNodes does not go through them
+and is not counted.
+
+When metrics are off span() returns a shared object which does nothing and
+timed functions are called directly, so the instrumentation can stay in hot
+paths.
+
+Records of many processes are summarized per span name:
+
+    python tbt_metrics.py summary /tmp/tbt_metrics.jsonl --by host
+    python tbt_metrics.py collect /tmp/farm_metrics.jsonl --port 9999
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import functools
+import threading
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+logger = logging.getLogger('tbt_metrics')
+
+ENV = 'TBT_METRICS'
+
+_sink = None
+_local = threading.local()
+_counter = [0]
+_counting = False
+# number of maya.cmds and pymel.core names when the commands were wrapped
+_command_names = [None]
+
+
+class FileSink(object):
+    """Append records to a json lines file. Lines are written in one call,
+    so many processes can append to the same file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+    def write(self, line):
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+    def close(self):
+        pass
+
+
+class SocketSink(object):
+    """Send records over udp, one datagram per record, or over a tcp
+    connection which is opened again after an error. Records which can not
+    be sent are dropped"""
+
+    def __init__(self, url):
+        scheme, _, address = url.partition('://')
+        host, _, port = address.rpartition(':')
+        self.address = (host or 'localhost', int(port))
+        self.tcp = scheme == 'tcp'
+        self.lock = threading.Lock()
+        self.sock = None
+
+    def write(self, line):
+        data = (line + '\n').encode('utf-8')
+        with self.lock:
+            try:
+                if self.tcp:
+                    if self.sock is None:
+                        self.sock = socket.create_connection(self.address, timeout=2.0)
+                    self.sock.sendall(data)
+                else:
+                    if self.sock is None:
+                        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                    self.sock.sendto(data, self.address)
+            except (socket.error, OSError) as e:
+                logger.debug('Dropped metrics record: %s', e)
+                self.close()
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def configure(target=None):
+    """Turn metrics on for a target or off
+
+    Args:
+        target (str): File path, udp://host:port or tcp://host:port. None
+            turns metrics off
+    """
+    global _sink
+    if _sink is not None:
+        _sink.close()
+    if not target:
+        _sink = None
+    elif target.startswith(('udp://', 'tcp://')):
+        _sink = SocketSink(target)
+    else:
+        _sink = FileSink(os.path.expanduser(target))
+
+
+def enabled():
+    return _sink is not None
+
+
+def emit(record):
+    """Write a record with the process it comes from"""
+    if _sink is None:
+        return
+    record.setdefault('time', time.time())
+    record.setdefault('host', _host)
+    record.setdefault('pid', os.getpid())
+    try:
+        line = json.dumps(record, default=str)
+    except (TypeError, ValueError) as e:
+        logger.debug('Could not encode metrics record: %s', e)
+        return
+    _sink.write(line)
+
+
+def event(name, **fields):
+    """Write a record of something that happened at one point in time"""
+    if _sink is not None:
+        fields.update(type='event', name=name)
+        emit(fields)
+
+
+def _count(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _counter[0] += 1
+        return func(*args, **kwargs)
+    wrapper._tbt_counted = True
+    return wrapper
+
+
+def _wrap_commands(module, names=None):
+    for name in names if names is not None else dir(module):
+        if name.startswith('_'):
+            continue
+        func = getattr(module, name, None)
+        if callable(func) and not isinstance(func, type) and not getattr(func, '_tbt_counted', False):
+            try:
+                setattr(module, name, _count(func))
+            except (AttributeError, TypeError):
+                pass
+
+
+def count_commands():
+    """Count the calls of maya.cmds and pymel.core functions
+
+    maya.cmds only has its commands after maya is initialized and plugins
+    like AbcExport add theirs when they are loaded, so every span wraps the
+    commands which are new. pymel wraps the functions of maya.cmds when it is
+    imported. If it is imported later its commands are counted through
+    maya.cmds, if it is already imported its functions of the same name are
+    wrapped.
+
+    Returns:
+        bool: True if the commands are counted
+    """
+    global _counting
+    mc = sys.modules.get('maya.cmds')
+    if mc is None:
+        try:
+            import maya.cmds as mc
+        except ImportError:
+            return False
+    pm = sys.modules.get('pymel.core')
+    names = dir(mc)
+    if (len(names), len(dir(pm)) if pm is not None else 0) == _command_names[0]:
+        return _counting
+    if not hasattr(mc, 'ls'):
+        return False
+    names = [n for n in names if not n.startswith('_')]
+    _wrap_commands(mc, names)
+    if pm is not None:
+        # pymel adds plugin commands to its namespace when the plugin loads
+        _wrap_commands(pm, [n for n in names if hasattr(pm, n)])
+    _command_names[0] = (len(dir(mc)), len(dir(pm)) if pm is not None else 0)
+    _counting = True
+    return True
+
+
+def command_count():
+    """Return the number of maya commands called so far"""
+    return _counter[0]
+
+
+class Span(object):
+    """Time a phase and write it when it ends
+
+    Args:
+        name (str): Name of the phase
+        fields: Extra fields of the record, more can be added with set()
+    """
+
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        count_commands()
+        self.commands = _counter[0]
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.time() - self.start
+        _local.stack.pop()
+        record = dict(self.fields)
+        record.update(type='span', name=self.name, time=self.start, duration=duration,
+                      parent=self.parent, ok=exc_type is None)
+        if _counting:
+            record['commands'] = _counter[0] - self.commands
+        if exc_type is not None:
+            record['error'] = '{}: {}'.format(exc_type.__name__, exc)
+        emit(record)
+        return False
+
+
+class _NullSpan(object):
+    """Span used when metrics are off"""
+
+    def set(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+def span(name, **fields):
+    """Return a context manager which times a phase
+
+    Args:
+        name (str): Name of the phase
+        fields: Extra fields of the record
+
+    Returns:
+        Span: A span or a shared span which does nothing if metrics are off
+    """
+    if _sink is None:
+        return _null_span
+    return Span(name, **fields)
+
+
+def timed(name=None):
+    """Decorator which runs a function in a span
+
+    Args:
+        name (str): Span name, defaults to the function name
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _sink is None:
+                return func(*args, **kwargs)
+            with Span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def read_records(paths):
+    """Iterate over the records of json lines files, broken lines are skipped"""
+    for path in paths:
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarize(records, by=None):
+    """Aggregate the spans of records per name
+
+    Args:
+        records (iterable): Records as written by span()
+        by (str): Also group by this field, e.g. host or scene
+
+    Returns:
+        dict: (name, field value) to a dict with count, errors, total, mean,
+            p50, p95, max and commands
+    """
+    groups = {}
+    for record in records:
+        if record.get('type') != 'span':
+            continue
+        key = (record.get('name'), record.get(by) if by else None)
+        group = groups.setdefault(key, {'durations': [], 'errors': 0, 'commands': 0})
+        group['durations'].append(record.get('duration', 0.0))
+        group['commands'] += record.get('commands', 0)
+        if not record.get('ok', True):
+            group['errors'] += 1
+
+    summary = {}
+    for key, group in groups.items():
+        durations = sorted(group['durations'])
+        total = sum(durations)
+        summary[key] = {
+            'count': len(durations),
+            'errors': group['errors'],
+            'total': total,
+            'mean': total / len(durations),
+            'p50': _percentile(durations, 0.5),
+            'p95': _percentile(durations, 0.95),
+            'max': durations[-1],
+            'commands': group['commands'],
+        }
+    return summary
+
+
+def format_summary(summary, by=None):
+    """Format a summary as a table, the biggest total time first"""
+    header = '{:<28}{:<20}{:>7}{:>7}{:>11}{:>10}{:>10}{:>10}{:>10}'.format(
+        'span', by or '', 'count', 'errors', 'total', 'mean', 'p95', 'max', 'commands')
+    lines = [header]
+    for (name, value), s in sorted(summary.items(), key=lambda i: -i[1]['total']):
+        lines.append('{:<28}{:<20}{:>7}{:>7}{:>11.2f}{:>10.3f}{:>10.3f}{:>10.3f}{:>10}'.format(
+            name, '' if value is None else str(value)[:19], s['count'], s['errors'],
+            s['total'], s['mean'], s['p95'], s['max'], s['commands']))
+    return '\n'.join(lines)
+
+
+class _Collector(object):
+    """Append the received lines to a file"""
+
+    def __init__(self, output):
+        self.sink = FileSink(output)
+
+    def handle_lines(self, data):
+        for line in data.decode('utf-8', 'replace').splitlines():
+            if line.strip():
+                self.sink.write(line)
+
+
+def collect(output, port, host='', tcp=False):
+    """Receive records from SocketSinks and append them to a file, runs
+    until interrupted
+
+    Args:
+        output (str): json lines file
+        port (int): Port to listen on
+        host (str): Address to listen on, all by default
+        tcp (bool): Listen for tcp connections instead of udp datagrams
+    """
+    collector = _Collector(output)
+
+    class UDPHandler(socketserver.BaseRequestHandler):
+        def handle(self):
+            collector.handle_lines(self.request[0])
+
+    class TCPHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                collector.handle_lines(line)
+
+    if tcp:
+        server = socketserver.ThreadingTCPServer((host, port), TCPHandler)
+    else:
+        server = socketserver.UDPServer((host, port), UDPHandler)
+    logger.info('Collecting metrics on %s port %d into %s', 'tcp' if tcp else 'udp', port, output)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+_host = socket.gethostname()
+configure(os.environ.get(ENV))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarize and collect toolbox metrics')
+    sub = parser.add_subparsers(dest='command')
+
+    summary = sub.add_parser('summary', help='summarize json lines files')
+    summary.add_argument('files', nargs='+')
+    summary.add_argument('--by', help='also group by this field, e.g. host or scene')
+    summary.add_argument('--json', action='store_true', help='print the summary as json')
+
+    receive = sub.add_parser('collect', help='receive records from udp or tcp sinks')
+    receive.add_argument('output')
+    receive.add_argument('--port', type=int, default=9999)
+    receive.add_argument('--host', default='')
+    receive.add_argument('--tcp', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.command == 'collect':
+        try:
+            collect(args.output, args.port, host=args.host, tcp=args.tcp)
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    result = summarize(read_records(args.files), by=args.by)
+    if args.json:
+        print(json.dumps([dict(s, name=k[0], group=k[1]) for k, s in sorted(result.items())],
+                         indent=2))
+    else:
+        print(format_summary(result, by=args.by))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
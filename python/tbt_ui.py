@@ -0,0 +1,16 @@
+"""
+Qt helpers shared by the toolboxes.
+"""
+
+from PySide.QtGui import QWidget
+from shiboken import wrapInstance
+
+
+def maya_main_window():
+    """Return the maya main window or None without maya ui"""
+    from maya import OpenMayaUI as omui
+
+    ptr = omui.MQtUtil.mainWindow()
+    if ptr is None:
+        return None
+    return wrapInstance(long(ptr), QWidget)
@@ -1,24 +1,29 @@
-import pymel.core as pm
-
+import os
+import time
 import logging
 
-RES_FINAL = (2048.0, 858.0)
+import tbt_metrics
+import settings_cache
+import background_render
+import render_presets
+import render_queue
 
+RES_FINAL = render_presets.RES_FINAL
 
-SETTINGS = {
-              'final': {'res': RES_FINAL,
-                        'aa_samples': 10
-                        },
-              'draft': {'res': [RES_FINAL[0]/2, RES_FINAL[1]/2],
-                        'aa_samples': 3},
-              'final_oar': {'res': (4480, 1920),
-                            'aa_samples': 10},
-              }
+# resolution and aa samples of the render presets
+SETTINGS = dict((name, render_presets.settings(name)) for name in ('final', 'draft', 'final_oar'))
 
 # Rig types: currently two
 head = 'head'
 body = 'body'
 
+# rig directories, rig reference names and export root nodes per rig type
+RIG_DIRS = {head: 'scenes/Horse_rig', body: 'scenes/HorseBody_rig'}
+RIG_REFS = {head: '*horseHeadRig*', body: '*HorseBodyRig*'}
+ROOT_NODES = {head: '*:render_GEO_GRP', body: '*:Grp_Mesh'}
+
+ABC_OPTIONS = '-noNormals -dataFormat ogawa'
+
 # projectSetup
 # setCamera
 # renderPasses
@@ -30,21 +35,16 @@ body = 'body'
 logger = logging.getLogger('tbt_settings')
 
 def set_status(attr, value):
+    import pymel.core as pm
     pm.setAttr('tbt_settings.' + attr, value)
 
 
 def get_status(node_name):
-    """Get the status of settings in the scene from tbt_settings node"""
-    try:
-        attrs = pm.PyNode(node_name).listAttr(ud=True)
-    except pm.MayaNodeError:
+    """Get the status of settings in the scene from tbt_settings node.
+    The values are kept in memory and updated by callbacks when they change"""
+    status = settings_cache.get_cache(node_name).status()
+    if status is None:
         create_node(node_name)
-        return
-
-    status = {}
-    for i in attrs:
-        status[str(i)] = i.get()
-
     return status
 
 
@@ -55,84 +55,59 @@ def create_node(node_name):
         node_name (str): node name
     """
 
+    # maya.cmds instead of pymel, this runs when the toolbox opens
+    import maya.cmds as mc
+
     # if there is already a node in the scene by query all user defined attrs
 
-    try:
-        attrs = pm.PyNode(node_name).listAttr(ud=True)
-    except pm.MayaNodeError:
-        node = pm.createNode('', n=node_name)
-    else:
+    if mc.objExists(node_name):
         # update older nodes
-        node = pm.PyNode(node_name)
-        pm.lockNode(node, lock=False)
-        attr_names = [x.name() for x in attrs]
-        if 'tbt_settings.sceneName' not in attr_names:
-            node.addAttr('sceneName', dt='string')
+        attrs = mc.listAttr(node_name, userDefined=True) or []
+        mc.lockNode(node_name, lock=False)
+        if 'sceneName' not in attrs:
+            mc.addAttr(node_name, longName='sceneName', dataType='string')
             logger.info('Added new attribute: sceneName')
-        # pm.lockNode(node, lock=True)
+        # mc.lockNode(node_name, lock=True)
 
         return
 
-    node.addAttr('projectSetup', attributeType='bool')
-    node.addAttr('setCamera', attributeType='bool')
-    node.addAttr('renderPasses', attributeType='bool')
-    node.addAttr('frameRange', attributeType='bool')
-    node.addAttr('startFrame', attributeType='float')
-    node.addAttr('endFrame', attributeType='float')
-    node.addAttr('renderSettings', dt='string')
-    node.addAttr('sceneName', dt='string')
+    node = mc.createNode('', name=node_name)
+
+    mc.addAttr(node, longName='projectSetup', attributeType='bool')
+    mc.addAttr(node, longName='setCamera', attributeType='bool')
+    mc.addAttr(node, longName='renderPasses', attributeType='bool')
+    mc.addAttr(node, longName='frameRange', attributeType='bool')
+    mc.addAttr(node, longName='startFrame', attributeType='float')
+    mc.addAttr(node, longName='endFrame', attributeType='float')
+    mc.addAttr(node, longName='renderSettings', dataType='string')
+    mc.addAttr(node, longName='sceneName', dataType='string')
 
-    pm.lockNode(node, lock=True)
+    mc.lockNode(node, lock=True)
 
 
+@tbt_metrics.timed()
 def setup_project(name=''):
     """projectSetup"""
-
-    # get the scene instance
-    scene = pm.Scene()
+    import pymel.core as pm
 
     # Set project fps
     pm.currentUnit(time='pal')
 
     # load arnold plugin
-    pm.loadPlugin('mtoa.bundle')
-
-    # Set render resolution
-    scene.defaultResolution.aspectLock.set(0)
-    set_render_settings('final')
+    with tbt_metrics.span('plugin_load', plugin='mtoa.bundle'):
+        pm.loadPlugin('mtoa.bundle')
 
-    # set gamma to 1.0
-    scene.defaultArnoldRenderOptions.display_gamma.set(1.0)
-    scene.defaultArnoldRenderOptions.light_gamma.set(1.0)
-    scene.defaultArnoldRenderOptions.shader_gamma.set(1.0)
-    scene.defaultArnoldRenderOptions.texture_gamma.set(1.0)
-
-    # set image folder structure
-    scene.defaultRenderGlobals.imageFilePrefix.set('<Scene>/<RenderLayer>_<RenderPass>')
-    # activate animation and set file name to filename.#.exr
-    scene.defaultRenderGlobals.animation.set(True)
-    scene.defaultRenderGlobals.putFrameBeforeExt.set(True)
-    scene.defaultRenderGlobals.periodInExt.set(1)
-
-    # Shutter open on start frame
-    scene.defaultArnoldRenderOptions.range_type.set(0)
-    # Enable motion blur
-    scene.defaultArnoldRenderOptions.motion_blur_enable.set(1)
-    # Display driver settings
-    scene.defaultArnoldDriver.outputMode.set(2)
-    scene.defaultArnoldDriver.mergeAOVs.set(1)
+    # render settings and project defaults in one undo chunk
     if name: name = name + '_'
-    scene.defaultArnoldDriver.prefix.set('<Scene>/{}<RenderLayer>'.format(name))
-    # half precision exrs to save diskspace
-    scene.defaultArnoldDriver.halfPrecision.set(1)
+    render_presets.apply_preset('project', extra=[
+        ('defaultArnoldDriver.prefix', '<Scene>/{}<RenderLayer>'.format(name))])
 
-    # Set yeti plugin premel
-    scene.defaultRenderGlobals.preMel.set('pgYetiPreRender')
     set_status('projectSetup', 1)
 
 
 def setup_render_layer():
     """renderPasses"""
+    import pymel.core as pm
 
     # select head yeti and lightsetup
     select_ = [
@@ -182,6 +157,8 @@ def get_frame_range():
     Returns:
         tuple(float, float): Start and end frame of frame range
     """
+    import pymel.core as pm
+
     start = pm.SCENE.defaultRenderGlobals.startFrame.get()
     end = pm.SCENE.defaultRenderGlobals.endFrame.get()
 
@@ -190,6 +167,7 @@ def get_frame_range():
 
 def set_frame_range(start_frame, end_frame):
     """Set the frame range in the maya scene and the render globals"""
+    import pymel.core as pm
 
     # set timeline
     pm.animation.playbackOptions(ast=start_frame, aet=end_frame, min=start_frame, max=end_frame)
@@ -206,6 +184,8 @@ def set_aspect_ratio():
     Set the film gate height of a selected camera based on our render
     resolution to meet the correct aspect ratio
     """
+    import pymel.core as pm
+
     sel = pm.ls(selection=True)
     if not sel:
         print 'Please select a camera'
@@ -233,11 +213,7 @@ def preview_setup():
     Set render settings to draft settings
     and disable motion blur
     """
-    # get the scene instance
-    scene = pm.Scene()
-
     set_render_settings('draft')
-    scene.defaultArnoldRenderOptions.motion_blur_enable.set(0)
     set_status('renderSettings', 'draft')
 
 
@@ -257,73 +233,139 @@ def final_oar_setup():
 
 
 def final_render_animation():
-    # get the scene instance
-    scene = pm.Scene()
-
-    set_render_settings('final')
-    # enable motion blur
-    scene.defaultArnoldRenderOptions.motion_blur_enable.set(1)
-    scene.defaultArnoldRenderOptions.range_type.set(0)
-    scene.defaultArnoldRenderOptions.outputOverscan.set('10%')
-    scene.defaultArnoldDriver.mergeAOVs.set(1)
+    # final settings with motion blur and overscan
+    set_render_settings('final_anim')
     set_status('renderSettings', 'final_anim')
 
 
 def set_render_settings(preset, pixel_ar=1.0):
-    """Set render settings to preset value
+    """Set render settings to preset value. Only attributes which differ
+    from the preset are set
 
     Args:
-        preset (str):
+        preset (str): Name of a preset in render_presets.PRESETS
         pixel_ar (float):
+
+    Returns:
+        dict: Report of render_presets.apply_preset or None for unknown presets
     """
 
-    if preset in SETTINGS.keys():
-        settings = SETTINGS[preset]
-    else:
+    if preset not in render_presets.PRESETS:
         return
 
-    width, height = settings['res']
+    return render_presets.apply_preset(preset)
 
-    # get the scene instance
-    scene = pm.Scene()
 
-    scene.defaultResolution.width.set(width)
-    scene.defaultResolution.height.set(height)
-    scene.defaultResolution.deviceAspectRatio.set(width / height)
-    # samples
-    scene.defaultArnoldRenderOptions.AASamples.set(settings['aa_samples'])
-    scene.defaultArnoldRenderOptions.GIDiffuseSamples.set(4)
-    # ray depth
-    scene.defaultArnoldRenderOptions.GIDiffuseDepth.set(3)
-    scene.defaultArnoldRenderOptions.GIGlossyDepth.set(3)
-    scene.defaultArnoldRenderOptions.autoTransparencyDepth.set(4)
-    scene.defaultArnoldRenderOptions.use_existing_tiled_textures.set(1)
-    scene.defaultArnoldRenderOptions.textureAutomip.set(0)
-    scene.defaultArnoldRenderOptions.log_verbosity.set(1)
-    scene.defaultArnoldFilter.width.set(2.2)
+def render_current_frame(background=False):
+    """Render the current frame
+
+    Args:
+        background (bool): Render a snapshot of the scene in a separate
+            process instead of blocking maya
+
+    Returns:
+        background_render.RenderFrame: The queued frame if rendered in background
+    """
+    import pymel.core as pm
 
+    if background:
+        return background_render.get_renderer().submit()
 
-def render_current_frame():
     start_f = pm.SCENE.defaultRenderGlobals.startFrame.get()
     end_f = pm.SCENE.defaultRenderGlobals.endFrame.get()
     current_frame = pm.currentTime()
 
     pm.SCENE.defaultRenderGlobals.startFrame.set(current_frame)
     pm.SCENE.defaultRenderGlobals.endFrame.set(current_frame)
-    pm.mel.eval('mayaBatchRender();')
-    # reset frame settings
-    pm.SCENE.defaultRenderGlobals.startFrame.set(start_f)
-    pm.SCENE.defaultRenderGlobals.endFrame.set(end_f)
+    try:
+        with tbt_metrics.span('render', frame=current_frame):
+            pm.mel.eval('mayaBatchRender();')
+    finally:
+        # reset frame settings
+        pm.SCENE.defaultRenderGlobals.startFrame.set(start_f)
+        pm.SCENE.defaultRenderGlobals.endFrame.set(end_f)
+
+
+def queue_frame_range(preset=None, priority=render_queue.DEFAULT_PRIORITY, chunk_size=None):
+    """Submit the frame range of the render globals to the local render queue.
+    The scene is exported first, so it can be changed while the job waits. The
+    queue deletes the export when the job ended
+
+    Args:
+        preset (str): Render preset, defaults to the render settings of the
+            tbt_settings node
+        priority (int): Jobs with higher priority are rendered first
+        chunk_size (int): Frames per render process, None sizes them from
+            the render times of earlier renders of the shot
+
+    Returns:
+        str: Job id
+    """
+    import pymel.core as pm
+
+    start = int(pm.SCENE.defaultRenderGlobals.startFrame.get())
+    end = int(pm.SCENE.defaultRenderGlobals.endFrame.get())
+    if preset is None:
+        status = get_status('tbt_settings') or {}
+        preset = status.get('tbt_settings.renderSettings')
+        if preset not in render_presets.PRESETS:
+            preset = None
+
+    # the snapshot keeps the scene name, the <Scene> token of the image
+    # prefix resolves to it
+    name = get_filename()[0] or 'untitled'
+    folder = os.path.join(render_queue.QUEUE_DIR, 'scenes', '{:.0f}'.format(time.time() * 1000))
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    scene = os.path.join(folder, name + '.mb')
+    with tbt_metrics.span('scene_export', scene=scene):
+        pm.exportAll(scene, preserveReferences=True, force=True, type='mayaBinary')
+
+    job_id = render_queue.submit(scene, range(start, end + 1), preset=preset, priority=priority,
+                                 project=str(pm.workspace.getPath()), chunk_size=chunk_size,
+                                 snapshot=True)
+    render_queue.ensure_service()
+    logger.info('Queued frames %d-%d as %s', start, end, job_id)
+    return job_id
+
+
+def check_render_output(workers=None):
+    """Check the exr sequences rendered for the current scene against the
+    frame range and the resolution of the active render preset
+
+    Args:
+        workers (int): Number of sequences checked at the same time
+
+    Returns:
+        list: Reports of exr_scan.check_sequence
+    """
+    import pymel.core as pm
+    import exr_scan
+
+    root = os.path.join(str(pm.workspace.getPath()), pm.workspace.fileRules['images'], get_filename()[0])
+    status = get_status('tbt_settings') or {}
+    preset = status.get('tbt_settings.renderSettings')
+    expected = render_presets.settings(preset)['res'] if preset in render_presets.PRESETS else None
+    reports = exr_scan.scan(root, expected=expected, _range=get_frame_range(), workers=workers)
+    for report in reports:
+        if report['ok']:
+            logger.info(exr_scan.format_report(report))
+        else:
+            logger.error(exr_scan.format_report(report))
+    return reports
 
 
 def get_filename():
     """Return the scene name and scene extension"""
+    import pymel.core as pm
+
     scene_name = pm.sceneName()
     name, ext = scene_name.basename().splitext()
     return name, ext
 
 
 def set_file_name(name):
+    import pymel.core as pm
     set_status('sceneName', name)
     pm.SCENE.defaultArnoldDriver.prefix.set('<Scene>/{}_<RenderLayer>'.format(name))
 
@@ -334,69 +376,146 @@ def get_frame_range():
     Returns:
         tuple (float, float): Frame range tuple
     """
-    start = pm.playbackOptions(ast=True, query=True)
-    end = pm.playbackOptions(aet=True, query=True)
+    import maya.cmds as mc
+
+    start = mc.playbackOptions(ast=True, query=True)
+    end = mc.playbackOptions(aet=True, query=True)
     return start, end
 
 
-def export_alembic_bake(start, stop, node, suffix=''):
+def get_alembic_path(suffix='', scene=None):
+    """Return the alembic file path of a scene in the alembicCache file rule
+    directory
+
+    Args:
+        suffix (str): Suffix of the file name
+        scene (str): Scene file path, defaults to the current scene
+    """
+    import pymel.core as pm
+
     path = pm.workspace.getPath().joinpath(pm.workspace.fileRules['alembicCache'])
-    path = path.joinpath(pm.sceneName().basename().splitext()[0] + suffix + '.abc')
+    scene = pm.util.path(scene) if scene else pm.sceneName()
+    return path.joinpath(scene.basename().splitext()[0] + suffix + '.abc')
+
+
+def export_alembic_bake(start, stop, node, suffix='', path=None):
+    import pymel.core as pm
+
+    if not path:
+        path = get_alembic_path(suffix)
     print 'export to: ', path
     print 'start frame: ', start
     print 'end frame: ', stop
-    opt = '-frameRange {start} {stop} -noNormals -dataFormat ogawa -root |{node} -file \"{path}\"'
-    pm.AbcExport(j=opt.format(
-        start=start, stop=stop, node=node, path=path))
+    opt = '-frameRange {start} {stop} {options} -root |{node} -file \"{path}\"'
+    with tbt_metrics.span('export', path=str(path), start=start, stop=stop):
+        pm.AbcExport(j=opt.format(
+            start=start, stop=stop, options=ABC_OPTIONS, node=node, path=path))
 
 
-def write_alembic(path, proj_dir, rig_type=head):
-    """Load maya scene update the horse rig to the latest version found in Horse_rig
-    directory and then export an alembic cache.
+def init_alembic_session(proj_dir):
+    """Load the alembic plugin and set the project. Only needs to be done once
+    per maya session.
 
     Args:
-        path (str): File path of maya file
         proj_dir (str): Project directory
     """
-
-    import glob
-    import os
     import pymel.core as pm
 
     print 'Loading abc plugin'
-    pm.loadPlugin('AbcExport.bundle')
+    with tbt_metrics.span('plugin_load', plugin='AbcExport.bundle'):
+        pm.loadPlugin('AbcExport.bundle')
 
     print 'Setting project to: ', proj_dir
-    pm.workspace.open(proj_dir)
-    # open the file
-    pm.openFile(path, open=True, force=True)
+    with tbt_metrics.span('workspace_open', project=proj_dir):
+        pm.workspace.open(proj_dir)
+
+
+def get_latest_rig(proj_dir, rig_type=head):
+    """Return the rig file with the highest version of a rig type in the project
+
+    Args:
+        proj_dir (str): Project directory
+        rig_type (str): head or body
+
+    Returns:
+        str: File path of the rig
+    """
+    import rig_registry
 
-    # get the reference
     rig_path = None
-    if rig_type == head:
-        refs = pm.ls('*horseHeadRig*', type='reference')
-        rig_path = pm.workspace.path.joinpath('scenes/Horse_rig')
-    if rig_type == body:
-        # todo: check and change file path
-        refs = pm.ls('*HorseBodyRig*', type='reference')
-        rig_path = pm.workspace.path.joinpath('scenes/HorseBody_rig')
+    if rig_type in RIG_DIRS:
+        rig_path = os.path.join(proj_dir, RIG_DIRS[rig_type])
     if not rig_path or not os.path.exists(rig_path):
         raise IOError('Horse_rig directory not found: {}'.format(rig_path))
 
+    return rig_registry.latest_rig(rig_path)
+
+
+@tbt_metrics.timed()
+def write_alembic(path, proj_dir, rig_type=head, init=True, chunks=None, use_cache=True):
+    """Load maya scene update the horse rig to the latest version found in Horse_rig
+    directory and then export an alembic cache.
+
+    Args:
+        path (str): File path of maya file
+        proj_dir (str): Project directory
+        init (bool): Load the plugin and set the project. Can be skipped if
+            init_alembic_session() was already called for proj_dir
+        chunks (int): Split the frame range into this many chunks which are
+            exported in parallel by separate mayapy processes. 0 adapts the
+            number of chunks to the speed measured in the last export
+        use_cache (bool): Skip the export if the scene, the rig and the export
+            settings did not change since the last export
+    """
+
+    import pymel.core as pm
+
+    if init:
+        init_alembic_session(proj_dir)
+
     # get the most recent rig in our folder
-    files = glob.glob(rig_path + '/*')
-    new_path = max(files, key=os.path.getctime)
+    new_path = get_latest_rig(proj_dir, rig_type)
+
+    abc_path = str(get_alembic_path(scene=path))
+    cache = inputs = None
+    if use_cache:
+        import alembic_cache
+        with tbt_metrics.span('cache_lookup', path=abc_path) as span:
+            cache = alembic_cache.ExportCache(os.path.dirname(abc_path))
+            inputs = cache.inputs(abc_path, path, new_path, rig_type, ROOT_NODES[rig_type],
+                                  ABC_OPTIONS, chunked=chunks is not None)
+            hit = cache.lookup(abc_path, inputs)
+            span.set(hit=bool(hit))
+        if hit:
+            logger.info('Nothing changed since last export, reusing: %s', abc_path)
+            return
+
+    # open the file
+    with tbt_metrics.span('scene_open', scene=path):
+        pm.openFile(path, open=True, force=True)
+
     # change reference path
-    for ref in refs:
-        ref.referenceFile().replaceWith(new_path)
-        print 'reference file: ', ref.referenceFile()
+    with tbt_metrics.span('reference_swap', rig=new_path):
+        refs = pm.ls(RIG_REFS[rig_type], type='reference')
+        for ref in refs:
+            ref.referenceFile().replaceWith(new_path)
+            print 'reference file: ', ref.referenceFile()
 
     end = pm.playbackOptions(aet=True, query=True)
-    if rig_type == body:
-        node = pm.ls('*:Grp_Mesh')[0]
-    else:
-        node = pm.ls('*:render_GEO_GRP')[0]
-    if node:
-        export_alembic_bake(0, end, node.longName())
+    nodes = pm.ls(ROOT_NODES[rig_type])
+    if not nodes:
+        raise IOError('Node not found {}'.format(ROOT_NODES[rig_type]))
+    node = nodes[0]
+
+    if chunks is not None:
+        import alembic_shards
+        manifest = alembic_shards.export_sharded(0, end, node.longName(), chunks=chunks or None)
+        outputs = [c['file'] for c in manifest['chunks']]
+        outputs.append(alembic_shards.manifest_path(abc_path))
     else:
-        raise IOError('Node not found *:render_GEO_GRP')
\ No newline at end of file
+        export_alembic_bake(0, end, node.longName(), path=abc_path)
+        outputs = [abc_path]
+
+    if cache:
+        with tbt_metrics.span('abc_cache_store', path=abc_path):
+            cache.store(abc_path, inputs, outputs, roots=[node.longName()], frame_range=[0, end])
@@ -0,0 +1,157 @@
+"""
+Write the caches of yeti nodes in parallel headless mayapy processes.
+
+The current scene is saved to a temp file, every node and optionally every
+part of the frame range is cached by its own mayapy process. The artist's
+maya stays responsive while the processes run in a background thread. When
+they are done the nodes in the live scene are switched to their caches.
+
+    import yeti_batch
+    batch = yeti_batch.CacheBatch(nodes, (1, 100), samples=3, chunks=4)
+    batch.start()
+"""
+
+import os
+import shutil
+import logging
+import tempfile
+import threading
+
+import pymel.core as pm
+
+import YetiHelpers
+import mayapy_pool
+
+logger = logging.getLogger('YetiToolbox')
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'yeti_cache_worker.py')
+
+
+def split_range(start, stop, chunks):
+    """
+    Split a frame range into parts which do not share frames
+    :param start: start frame
+    :param stop: end frame
+    :param chunks: number of parts
+    :return: list of (start, stop) tuples
+    """
+    start, stop = int(start), int(stop)
+    frames = stop - start + 1
+    chunks = max(1, min(int(chunks), frames))
+    bounds = [start + (i * frames) // chunks for i in range(chunks + 1)]
+    return [(bounds[i], bounds[i + 1] - 1) for i in range(chunks)]
+
+
+class CacheBatch(object):
+    """
+    Cache yeti nodes in parallel mayapy processes
+    :param nodes: yeti nodes
+    :param _range: start and end frame
+    :param samples: samples per frame
+    :param cache_dir: output directory
+    :param chunks: number of parts the frame range of every node is split into
+    :param workers: max number of processes
+    :param mayapy: mayapy interpreter
+    """
+
+    def __init__(self, nodes, _range, samples=3, cache_dir=None, chunks=1, workers=None, mayapy=None):
+        self.nodes = nodes
+        self.range = _range
+        self.samples = samples
+        self.cache_dir = cache_dir
+        self.chunks = chunks
+        self.workers = workers
+        self.mayapy = mayapy or mayapy_pool.MAYAPY
+
+        self.tmp_dir = None
+        self.caches = []
+        self.jobs = {}
+        self.ledger = mayapy_pool.Ledger()
+        self.summary = None
+        self.thread = None
+
+    def prepare(self):
+        """
+        Store the groom files, create the jobs and save the scene for the
+        workers. Has to run in the main thread
+        """
+        self.tmp_dir = tempfile.mkdtemp(prefix='yeti_batch_')
+        scene = os.path.join(self.tmp_dir, 'scene.mb')
+        project = str(pm.workspace.getPath())
+        ranges = split_range(self.range[0], self.range[1], self.chunks)
+
+        for node in self.nodes:
+            file_name = YetiHelpers.get_cache_file_name(node, cache_dir=self.cache_dir)
+            ok, groom_file = YetiHelpers.prepare_cache(node)
+            if not ok:
+                continue
+            jobs = []
+            for start, stop in ranges:
+                job_id = '{}.{}-{}'.format(node.name(), start, stop)
+                cmd = [self.mayapy, WORKER_SCRIPT, scene, project, node.longName(),
+                       str(start), str(stop), str(self.samples), file_name]
+                jobs.append(mayapy_pool.Job(job_id, cmd))
+            self.jobs[node] = jobs
+            self.caches.append((node, file_name, groom_file))
+
+        # save after prepare_cache, so the workers see the same nodes
+        pm.exportAll(scene, preserveReferences=True, force=True, type='mayaBinary')
+        logger.info('Caching {} nodes in {} parts each'.format(len(self.caches), len(ranges)))
+
+    def run(self):
+        """
+        Run the worker processes and wait for them. Safe to call from a
+        background thread
+        """
+        jobs = [j for node_jobs in self.jobs.values() for j in node_jobs]
+        try:
+            self.summary = mayapy_pool.run_jobs(
+                jobs, workers=self.workers, ledger=self.ledger,
+                log_dir=os.path.join(self.tmp_dir, 'logs'))
+        finally:
+            os.remove(os.path.join(self.tmp_dir, 'scene.mb'))
+        logger.info(mayapy_pool.format_summary(self.summary))
+        return self.summary
+
+    def apply(self):
+        """
+        Switch every node whose jobs all succeeded and whose cache sequence
+        is complete to its cache. Has to run in the main thread
+        :return: list of nodes which failed
+        """
+        failed = []
+        for node, file_name, groom_file in self.caches:
+            done = all(self.ledger.is_done(j.job_id) for j in self.jobs[node])
+            if done and YetiHelpers.check_cache(file_name, _range=self.range):
+                YetiHelpers.use_cache(node, file_name, groom_file=groom_file)
+            else:
+                failed.append(node)
+                logger.error('Caching failed for {}, see logs in {}'.format(node, self.tmp_dir))
+        if not failed:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        return failed
+
+    def start(self, on_done=None):
+        """
+        Cache the nodes without blocking maya. The nodes are updated in the
+        main thread when all processes are done
+        :param on_done: called with the list of failed nodes
+        """
+        import maya.utils
+
+        self.prepare()
+
+        def finish():
+            failed = self.apply()
+            if on_done:
+                on_done(failed)
+
+        def work():
+            try:
+                self.run()
+            finally:
+                maya.utils.executeDeferred(finish)
+
+        self.thread = threading.Thread(target=work)
+        self.thread.daemon = True
+        self.thread.start()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+
+"""
+Index and validate yeti cache sequences (name.%04d.fur).
+
+A cache directory is listed in one pass and every sequence gets a map of
+frame number to file size. A sequence is flagged if frames are missing,
+files are empty or a frame is much smaller or bigger than the other frames,
+which usually means it was cut off while writing.
+
+The file names are kept in ~/.tbt_maya/fur_index.json and a directory is
+only listed again when its modification time changed. Rewriting files in
+place does not change it, so the sizes are always read from the files of the
+sequence which is validated.
+
+Validate a directory from the command line:
+
+    python yeti_cache_index.py /path/to/cache/yeti --range 1 120
+"""
+
+import os
+import re
+import sys
+import json
+import logging
+import argparse
+import threading
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+logger = logging.getLogger('YetiToolbox')
+
+INDEX_FILE = os.path.join(os.path.expanduser('~'), '.tbt_maya', 'fur_index.json')
+FRAME_RE = re.compile(r'^(?P<name>.+)\.(?P<frame>-?\d+)\.fur$')
+# frames smaller or bigger than these factors of the median size are flagged
+OUTLIER_LOW = 0.5
+OUTLIER_HIGH = 2.0
+
+
+def list_dir(path):
+    """Return name and size of every file in a directory with one listing
+
+    Args:
+        path (str): Directory
+
+    Returns:
+        list: List of (name, size) tuples
+    """
+    if scandir is not None:
+        return [(e.name, e.stat().st_size) for e in scandir(path) if e.is_file()]
+    files = []
+    for name in os.listdir(path):
+        full = os.path.join(path, name)
+        if os.path.isfile(full):
+            files.append((name, os.path.getsize(full)))
+    return files
+
+
+def scan(path):
+    """Find the fur sequences of a directory
+
+    Args:
+        path (str): Cache directory
+
+    Returns:
+        dict: Sequence name to {frame: (file name, size)} mapping
+    """
+    sequences = {}
+    for name, size in list_dir(path):
+        match = FRAME_RE.match(name)
+        if match:
+            frames = sequences.setdefault(match.group('name'), {})
+            frames[int(match.group('frame'))] = (name, size)
+    return sequences
+
+
+def read_sizes(path, files):
+    """Return the current size of files, skipping the ones which are gone
+
+    Args:
+        path (str): Directory
+        files (dict): Frame number to file name
+
+    Returns:
+        dict: Frame number to file size
+    """
+    frames = {}
+    for frame, name in files.items():
+        try:
+            frames[frame] = os.path.getsize(os.path.join(path, name))
+        except OSError:
+            pass
+    return frames
+
+
+def split_pattern(file_name):
+    """Split a cache file name like /cache/node.%04d.fur into directory and
+    sequence name"""
+    folder, name = os.path.split(file_name)
+    return folder, re.sub(r'\.(%0?\d*d|#+)\.fur$', '', name)
+
+
+def validate(frames, _range=None, low=OUTLIER_LOW, high=OUTLIER_HIGH):
+    """Check a frame map for gaps, empty and outlier sized frames
+
+    Args:
+        frames (dict): Frame number to file size
+        _range (tuple): Expected start and end frame, defaults to the first
+            and last frame found
+        low (float): Factor of the median size below which a frame is flagged
+        high (float): Factor of the median size above which a frame is flagged
+
+    Returns:
+        dict: Report with ok, frames, missing, empty and outliers keys
+    """
+    report = {'ok': False, 'frames': len(frames), 'missing': [], 'empty': [], 'outliers': []}
+    if not frames and not _range:
+        return report
+
+    if _range:
+        start, end = int(_range[0]), int(_range[1])
+    else:
+        start, end = min(frames), max(frames)
+    report['missing'] = [f for f in range(start, end + 1) if f not in frames]
+    report['empty'] = sorted(f for f, size in frames.items() if size == 0)
+
+    sizes = sorted(size for size in frames.values() if size)
+    if sizes:
+        median = sizes[len(sizes) // 2]
+        report['outliers'] = sorted(
+            f for f, size in frames.items()
+            if size and (size < median * low or size > median * high))
+
+    report['ok'] = bool(frames) and not (report['missing'] or report['empty'] or report['outliers'])
+    return report
+
+
+class CacheIndex(object):
+    """Persistent index of fur sequences per directory
+
+    Args:
+        index_file (str): Json file to persist the index in, None keeps the
+            index only in memory
+    """
+
+    def __init__(self, index_file=INDEX_FILE):
+        self.index_file = index_file
+        self.index = {}
+        self._lock = threading.Lock()
+        if index_file and os.path.exists(index_file):
+            try:
+                with open(index_file, 'r') as f:
+                    self.index = json.load(f)
+            except ValueError:
+                logger.warning('Ignoring broken fur index: {}'.format(index_file))
+
+    def sequences(self, path, refresh=False, names=None):
+        """Return the sequences of a directory with the current size of every
+        frame. The directory is only listed again if it changed
+
+        Args:
+            path (str): Cache directory
+            refresh (bool): List the directory even if it did not change
+            names (list): Only return these sequences
+
+        Returns:
+            dict: Sequence name to {frame: size} mapping
+        """
+        path = os.path.normpath(os.path.abspath(path))
+        if not os.path.isdir(path):
+            return {}
+        mtime = os.path.getmtime(path)
+        entry = self.index.get(path)
+        # entries of older indexes have no file names
+        if entry and entry['mtime'] == mtime and 'files' in entry and not refresh:
+            sequences = {}
+            for name, files in entry['files'].items():
+                if names is None or name in names:
+                    # json keys are strings
+                    files = dict((int(f), n) for f, n in files.items())
+                    sequences[name] = read_sizes(path, files)
+            return sequences
+
+        found = scan(path)
+        with self._lock:
+            self.index[path] = {'mtime': mtime, 'files': dict(
+                (name, dict((f, n) for f, (n, _) in frames.items()))
+                for name, frames in found.items())}
+            self.save()
+        return dict((name, dict((f, size) for f, (_, size) in frames.items()))
+                    for name, frames in found.items() if names is None or name in names)
+
+    def validate(self, file_name, _range=None, refresh=False):
+        """Validate the sequence of a cache file name
+
+        Args:
+            file_name (str): Cache file name like /cache/node.%04d.fur
+            _range (tuple): Expected start and end frame
+            refresh (bool): List the directory even if it did not change
+
+        Returns:
+            dict: Report of validate() with the file name added
+        """
+        folder, name = split_pattern(file_name)
+        frames = self.sequences(folder, refresh=refresh, names=[name]).get(name, {})
+        report = validate(frames, _range=_range)
+        report['file_name'] = file_name
+        return report
+
+    def save(self):
+        if not self.index_file:
+            return
+        try:
+            folder = os.path.dirname(self.index_file)
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            tmp = self.index_file + '.{}.tmp'.format(os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(self.index, f)
+            if os.name == 'nt' and os.path.exists(self.index_file):
+                os.remove(self.index_file)
+            os.rename(tmp, self.index_file)
+        except (IOError, OSError) as e:
+            logger.warning('Could not write fur index: {}'.format(e))
+
+
+_index = None
+
+
+def get_index():
+    """Return the index shared by all callers in this process"""
+    global _index
+    if _index is None:
+        _index = CacheIndex()
+    return _index
+
+
+def validate_cache(file_name, _range=None, refresh=False):
+    """Validate the sequence of a cache file name with the shared index"""
+    return get_index().validate(file_name, _range=_range, refresh=refresh)
+
+
+def format_report(report):
+    if report['ok']:
+        return '{}: ok, {} frames'.format(report.get('file_name', ''), report['frames'])
+    problems = []
+    for key in ('missing', 'empty', 'outliers'):
+        if report[key]:
+            problems.append('{} {}: {}'.format(len(report[key]), key, compact(report[key])))
+    if not report['frames']:
+        problems.append('no frames found')
+    return '{}: {}'.format(report.get('file_name', ''), ', '.join(problems))
+
+
+def compact(frames):
+    """Write a list of frames as ranges: [1, 2, 3, 7] -> 1-3 7"""
+    parts = []
+    for f in sorted(frames):
+        if parts and parts[-1][1] == f - 1:
+            parts[-1][1] = f
+        else:
+            parts.append([f, f])
+    return ' '.join(str(a) if a == b else '{}-{}'.format(a, b) for a, b in parts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Validate yeti cache sequences')
+    parser.add_argument('directory')
+    parser.add_argument('--range', nargs=2, type=int, metavar=('START', 'END'))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    index = get_index()
+    bad = 0
+    for name, frames in sorted(index.sequences(args.directory).items()):
+        report = validate(frames, _range=args.range)
+        report['file_name'] = os.path.join(args.directory, name + '.%04d.fur')
+        logger.info(format_report(report))
+        bad += not report['ok']
+    return 1 if bad else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
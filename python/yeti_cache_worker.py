@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+
+"""
+Write the yeti cache of one node and frame range. Started by yeti_batch in
+its own mayapy process:
+
+    mayapy yeti_cache_worker.py scene project node start stop samples file_name
+"""
+
+import sys
+
+import tbt_metrics
+
+with tbt_metrics.span('maya_init'):
+    import maya.standalone
+    maya.standalone.initialize('Python')
+
+import pymel.core as pm
+
+import YetiHelpers
+
+scene, proj_dir, node, start, stop, samples, file_name = sys.argv[1:8]
+
+with tbt_metrics.span('plugin_load', plugin='pgYetiMaya'):
+    pm.loadPlugin('pgYetiMaya')
+pm.workspace.open(proj_dir)
+with tbt_metrics.span('scene_open', scene=scene):
+    pm.openFile(scene, open=True, force=True)
+
+YetiHelpers.write_cache(pm.PyNode(node), file_name,
+                        _range=(int(start), int(stop)), samples=int(samples))
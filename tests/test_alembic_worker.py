@@ -0,0 +1,93 @@
+"""
+Run the alembic worker against the recording maya stand-in of the
+benchmarks.
+"""
+
+import os
+import sys
+import json
+import socket
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'python'))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmark'))
+
+import stub_maya
+import alembic_worker
+
+
+@unittest.skipIf(sys.version_info[0] > 2, 'tbt_utils is python 2 like maya 2016')
+class WorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        stub_maya.install()
+        stub_maya.recorder.reset()
+        self.spool = tempfile.mkdtemp(prefix='tbt_test_')
+        self.worker = alembic_worker.Worker(self.spool, poll_interval=0.01)
+
+    def tearDown(self):
+        shutil.rmtree(self.spool)
+
+    def bake_job(self, **kwargs):
+        job = {'action': alembic_worker.EXPORT_ALEMBIC_BAKE, 'scene': '/shots/TB_01130.mb',
+               'project': '/projects/bench', 'start': 1, 'stop': 10, 'node': 'render_GEO_GRP',
+               'path': os.path.join(self.spool, 'TB_01130.abc')}
+        job.update(kwargs)
+        return alembic_worker.submit(self.spool, job)
+
+    def calls(self, command):
+        return stub_maya.recorder.calls.get(command, 0)
+
+    def test_runs_jobs_in_one_session(self):
+        first = self.bake_job()
+        second = self.bake_job(project='/projects/other')
+        self.worker.serve(max_jobs=2)
+
+        for job_id in (first, second):
+            res = alembic_worker.result(self.spool, job_id)
+            self.assertNotIn('error', res)
+            self.assertEqual(res['worker'], self.worker.name)
+        self.assertEqual(self.calls('loadPlugin'), 1)
+        self.assertEqual(self.calls('AbcExport'), 2)
+        self.assertEqual(self.calls('newFile'), 2)
+        self.assertEqual(sorted(os.listdir(self.spool)), sorted([first + '.done', second + '.done']))
+
+    def test_failed_job(self):
+        job_id = self.bake_job(action='unknown')
+        self.worker.serve(max_jobs=1)
+        res = alembic_worker.result(self.spool, job_id)
+        self.assertIn('Unknown action', res['error'])
+        self.assertEqual(self.calls('newFile'), 1)
+
+    def test_malformed_job(self):
+        with open(os.path.join(self.spool, 'broken' + alembic_worker.JOB), 'w') as f:
+            f.write('{"action": ')
+        job_id = self.bake_job()
+        self.worker.serve(max_jobs=2)
+
+        self.assertIn('Could not read job', alembic_worker.result(self.spool, 'broken')['error'])
+        self.assertNotIn('error', alembic_worker.result(self.spool, job_id))
+
+    def test_recovers_jobs_of_dead_workers(self):
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        jobs = {}
+        for name, owner in [('dead', '{}:{}'.format(socket.gethostname(), dead.pid)),
+                            ('alive', self.worker.name),
+                            ('other_host', 'farm01:{}'.format(dead.pid))]:
+            jobs[name] = os.path.join(self.spool, name + alembic_worker.RUNNING)
+            with open(jobs[name], 'w') as f:
+                json.dump({'action': alembic_worker.EXPORT_ALEMBIC_BAKE, 'worker': owner}, f)
+
+        self.assertEqual(self.worker.recover(), ['dead'])
+        self.assertTrue(os.path.exists(os.path.join(self.spool, 'dead' + alembic_worker.JOB)))
+        self.assertTrue(os.path.exists(jobs['alive']))
+        self.assertTrue(os.path.exists(jobs['other_host']))
+
+
+if __name__ == '__main__':
+    unittest.main()
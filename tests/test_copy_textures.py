@@ -0,0 +1,109 @@
+"""
+Collect textures into a directory which already holds textures of other
+shots.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python'))
+
+import copy_textures
+
+
+class CollectFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='tbt_test_')
+        self.target = os.path.join(self.tmp, 'sourceimages')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def texture(self, folder, name, content):
+        path = os.path.join(self.tmp, folder, name)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def read(self, path):
+        with open(path, 'r') as f:
+            return f.read()
+
+    def test_keeps_texture_of_other_shot(self):
+        first = self.texture('shot_a', 'wood.exr', 'oak')
+        copy_textures.collect_files([first], self.target)
+        second = self.texture('shot_b', 'wood.exr', 'pine')
+        report = copy_textures.collect_files([second], self.target)
+
+        self.assertEqual(self.read(os.path.join(self.target, 'wood.exr')), 'oak')
+        dst = report['targets'][os.path.normpath(second)]
+        self.assertNotEqual(dst, os.path.join(self.target, 'wood.exr'))
+        self.assertEqual(self.read(dst), 'pine')
+
+    def test_keeps_texture_put_there_by_hand(self):
+        self.texture('sourceimages', 'wood.exr', 'oak')
+        src = self.texture('shot_b', 'wood.exr', 'pine')
+        report = copy_textures.collect_files([src], self.target)
+
+        self.assertEqual(self.read(os.path.join(self.target, 'wood.exr')), 'oak')
+        self.assertEqual(self.read(report['targets'][os.path.normpath(src)]), 'pine')
+
+    def test_updates_own_texture(self):
+        src = self.texture('shot_a', 'wood.exr', 'oak')
+        copy_textures.collect_files([src], self.target)
+        self.texture('shot_a', 'wood.exr', 'oak, repainted')
+        os.utime(src, (0, 0))
+        report = copy_textures.collect_files([src], self.target)
+
+        dst = os.path.join(self.target, 'wood.exr')
+        self.assertEqual(report['targets'][os.path.normpath(src)], dst)
+        self.assertEqual(self.read(dst), 'oak, repainted')
+
+    def test_reuses_same_content(self):
+        self.texture('sourceimages', 'wood.exr', 'oak')
+        src = self.texture('shot_a', 'wood.exr', 'oak')
+        report = copy_textures.collect_files([src], self.target)
+        self.assertEqual(report['targets'][os.path.normpath(src)], os.path.join(self.target, 'wood.exr'))
+
+
+
+@unittest.skipUnless(hasattr(os, 'sendfile') and sys.platform.startswith('linux'),
+                     'needs sendfile')
+class KernelCopyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='tbt_test_')
+        self.large_file = copy_textures.LARGE_FILE
+        copy_textures.LARGE_FILE = 1024
+        # pythons before 3.8 have no copy_file_range and use sendfile
+        self.copy_file_range = getattr(os, 'copy_file_range', None)
+        if self.copy_file_range is not None:
+            del os.copy_file_range
+
+    def tearDown(self):
+        copy_textures.LARGE_FILE = self.large_file
+        if self.copy_file_range is not None:
+            os.copy_file_range = self.copy_file_range
+        shutil.rmtree(self.tmp)
+
+    def test_copies_with_sendfile(self):
+        src = os.path.join(self.tmp, 'wood.exr')
+        dst = os.path.join(self.tmp, 'copy.exr')
+        content = os.urandom(64 * 1024)
+        with open(src, 'wb') as f:
+            f.write(content)
+        copy_textures.copy_file(src, dst)
+
+        with open(dst, 'rb') as f:
+            self.assertEqual(f.read(), content)
+        self.assertTrue(copy_textures.is_up_to_date(src, dst))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+"""
+Write edit files without leaving cut off files behind.
+"""
+
+import os
+import sys
+import gzip
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python'))
+
+import edit_files
+
+
+class WriteEditsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='tbt_test_')
+        self.path = os.path.join(self.tmp, 'shot' + edit_files.EXTENSION)
+        self.edits = {'ns:ctrl.tx': {'value': 1.0, 'type': 'doubleLinear'},
+                      'ns:ctrl.visibility': {'value': False, 'type': 'bool'}}
+        self.gzip_open = edit_files.gzip.open
+
+    def tearDown(self):
+        edit_files.gzip.open = self.gzip_open
+        shutil.rmtree(self.tmp)
+
+    def test_round_trip(self):
+        self.assertEqual(edit_files.write_edits(self.path, self.edits), 2)
+        self.assertEqual(dict(edit_files.iter_edits(self.path)), self.edits)
+        self.assertEqual(os.listdir(self.tmp), [os.path.basename(self.path)])
+
+    def test_keeps_old_file_when_write_fails(self):
+        edit_files.write_edits(self.path, self.edits)
+
+        def broken_open(path, mode):
+            f = self.gzip_open(path, mode)
+            f.write = None
+            return f
+        edit_files.gzip.open = broken_open
+        self.assertRaises(TypeError, edit_files.write_edits, self.path, {'ns:ctrl.ty': self.edits['ns:ctrl.tx']})
+        edit_files.gzip.open = self.gzip_open
+
+        self.assertEqual(dict(edit_files.iter_edits(self.path)), self.edits)
+        self.assertEqual(os.listdir(self.tmp), [os.path.basename(self.path)])
+
+
+if __name__ == '__main__':
+    unittest.main()
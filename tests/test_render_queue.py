@@ -0,0 +1,115 @@
+"""
+Run the render queue service against a stand-in renderer script.
+"""
+
+import os
+import sys
+import json
+import stat
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python'))
+
+import render_queue
+import render_schedule
+
+# records its command line and fails the tasks starting at $FAIL_FRAME
+RENDERER = '''#!{python}
+import os, sys, json
+args = sys.argv[1:]
+start = int(args[args.index('-s') + 1])
+with open(os.path.join({calls!r}, '{{}}.json'.format(start)), 'w') as f:
+    json.dump(args, f)
+sys.exit(1 if str(start) == os.environ.get('FAIL_FRAME') else 0)
+'''
+
+
+class RenderQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='tbt_test_')
+        self.queue_dir = os.path.join(self.tmp, 'queue')
+        self.calls = os.path.join(self.tmp, 'calls')
+        os.makedirs(self.calls)
+        self.render = os.path.join(self.tmp, 'Render')
+        with open(self.render, 'w') as f:
+            f.write(RENDERER.format(python=sys.executable, calls=self.calls))
+        os.chmod(self.render, os.stat(self.render).st_mode | stat.S_IEXEC)
+        # a snapshot like tbt_utils.queue_frame_range writes
+        folder = os.path.join(self.queue_dir, 'scenes', '1')
+        os.makedirs(folder)
+        self.scene = os.path.join(folder, 'TB_01130_v003.mb')
+        open(self.scene, 'w').close()
+        os.environ.pop('FAIL_FRAME', None)
+
+    def tearDown(self):
+        os.environ.pop('FAIL_FRAME', None)
+        shutil.rmtree(self.tmp)
+
+    def serve(self):
+        history = render_schedule.RenderHistory(None)
+        queue = render_queue.RenderQueue(self.queue_dir, slots=2, render=self.render, history=history)
+        queue.serve(poll_interval=0.01, exit_when_idle=True)
+        return render_queue.read_state(self.queue_dir), history
+
+    def rendered(self):
+        calls = {}
+        for name in os.listdir(self.calls):
+            with open(os.path.join(self.calls, name), 'r') as f:
+                calls[int(name.split('.')[0])] = json.load(f)
+        return calls
+
+    def test_renders_all_tasks(self):
+        job_id = render_queue.submit(self.scene, '1-10', preset='draft', chunk_size=4,
+                                     snapshot=True, queue_dir=self.queue_dir)
+        state, history = self.serve()
+
+        job = state['jobs'][job_id]
+        self.assertEqual(render_queue.job_state(job), render_queue.DONE)
+        self.assertEqual([(t['start'], t['end']) for t in job['tasks']], [(1, 4), (5, 8), (9, 10)])
+        calls = self.rendered()
+        self.assertEqual(sorted(calls), [1, 5, 9])
+        self.assertEqual(calls[9][calls[9].index('-e') + 1], '10')
+        self.assertEqual(calls[1][-1], self.scene)
+        self.assertIn('-ai:as', calls[1])
+        self.assertEqual(sorted(history.frames(job['shot'], 'draft')), list(range(1, 11)))
+        # the snapshot and its folder are gone
+        self.assertFalse(os.path.exists(os.path.dirname(self.scene)))
+
+    def test_failed_task(self):
+        os.environ['FAIL_FRAME'] = '3'
+        job_id = render_queue.submit(self.scene, [1, 2, 3, 4], chunk_size=2, retries=1,
+                                     snapshot=True, queue_dir=self.queue_dir)
+        state, _ = self.serve()
+
+        job = state['jobs'][job_id]
+        self.assertEqual(render_queue.job_state(job), render_queue.FAILED)
+        self.assertEqual([t['state'] for t in job['tasks']], [render_queue.DONE, render_queue.FAILED])
+        self.assertEqual(job['tasks'][1]['attempts'], 2)
+        self.assertFalse(os.path.exists(self.scene))
+
+    def test_keeps_submitted_scene(self):
+        render_queue.submit(self.scene, '1', queue_dir=self.queue_dir)
+        self.serve()
+        self.assertTrue(os.path.exists(self.scene))
+
+    def test_rejects_preset_without_resolution(self):
+        self.assertRaises(ValueError, render_queue.submit, self.scene, '1', preset='render',
+                          queue_dir=self.queue_dir)
+
+    def test_bad_job_does_not_stop_the_queue(self):
+        # a job which passed an older client
+        render_queue.send(render_queue.SUBMIT, self.queue_dir, job_id='bad', scene=self.scene,
+                          frames=[1], preset='render', priority=render_queue.DEFAULT_PRIORITY)
+        job_id = render_queue.submit(self.scene, '1', queue_dir=self.queue_dir)
+        state, _ = self.serve()
+
+        self.assertEqual(render_queue.job_state(state['jobs']['bad']), render_queue.FAILED)
+        self.assertIn('render', state['jobs']['bad']['tasks'][0]['error'])
+        self.assertEqual(render_queue.job_state(state['jobs'][job_id]), render_queue.DONE)
+
+
+if __name__ == '__main__':
+    unittest.main()
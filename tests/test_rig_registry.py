@@ -0,0 +1,36 @@
+"""
+Rank the rig files of a directory.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python'))
+
+import rig_registry
+
+
+class ScanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='tbt_test_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_versions_rank_above_unversioned_files(self):
+        for name in ('Horse_Rig_v2.mb', 'Horse_Rig_final.mb', 'Horse_Rig_v10.mb',
+                     'Horse_Rig_v2.ma', 'notes.txt'):
+            open(os.path.join(self.tmp, name), 'w').close()
+
+        rigs = [os.path.basename(r['file']) for r in rig_registry.scan(self.tmp)]
+        self.assertEqual(rigs[0], 'Horse_Rig_final.mb')
+        self.assertEqual(sorted(rigs[1:3]), ['Horse_Rig_v2.ma', 'Horse_Rig_v2.mb'])
+        self.assertEqual(rigs[-1], 'Horse_Rig_v10.mb')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Validate fur sequences whose files are rewritten in place.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python'))
+
+import yeti_cache_index
+
+
+class CacheIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='tbt_test_')
+        self.index = yeti_cache_index.CacheIndex(index_file=None)
+        self.cache = os.path.join(self.tmp, 'cache')
+        os.makedirs(self.cache)
+        self.file_name = os.path.join(self.cache, 'groom.%04d.fur')
+        for frame in range(1, 6):
+            self.write(frame, 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, frame, size):
+        with open(self.file_name % frame, 'wb') as f:
+            f.write(b'x' * size)
+
+    def test_complete_sequence(self):
+        report = self.index.validate(self.file_name, _range=(1, 5))
+        self.assertTrue(report['ok'])
+        self.assertEqual(report['frames'], 5)
+
+    def test_rewritten_frame(self):
+        self.assertTrue(self.index.validate(self.file_name)['ok'])
+        mtime = os.path.getmtime(self.cache)
+        # a re-cache cut off while writing frame 3
+        self.write(3, 0)
+        self.assertEqual(os.path.getmtime(self.cache), mtime)
+
+        report = self.index.validate(self.file_name)
+        self.assertFalse(report['ok'])
+        self.assertEqual(report['empty'], [3])
+
+    def test_reads_index_file(self):
+        index_file = os.path.join(self.tmp, 'index', 'fur_index.json')
+        yeti_cache_index.CacheIndex(index_file).validate(self.file_name)
+        mtime = os.path.getmtime(self.cache)
+        self.write(5, 10)
+        self.assertEqual(os.path.getmtime(self.cache), mtime)
+
+        report = yeti_cache_index.CacheIndex(index_file).validate(self.file_name)
+        self.assertEqual(report['outliers'], [5])
+
+
+if __name__ == '__main__':
+    unittest.main()